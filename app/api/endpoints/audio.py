@@ -1,64 +1,253 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request, Response
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
-from typing import List
-import os
-import shutil
-from datetime import datetime
+from typing import List, Optional
+from itertools import chain
 
 from ...database import get_db
 from ...models.audio import AudioFile
-from ...schemas.audio import AudioFile as AudioFileSchema, AudioFileCreate
+from ...schemas.audio import AudioFile as AudioFileSchema, AudioFileCreate, BatchUploadResult, LiveIngestResult
+from ...schemas.audio import UploadSession as UploadSessionSchema, UploadSessionCreate
+from ...schemas.audio import DirectUpload, DirectUploadCreate
+from ...services.storage import AUDIO_STORAGE_DIR, local_audio_path, storage_for
+from ...services.audio_stream import (
+    AUDIO_MEDIA_TYPES,
+    FileRangeResponse,
+    RangeNotSatisfiable,
+    etag_matches,
+    http_date,
+    parse_range,
+    time_slice
+)
+from ...services.audio_ingest import (
+    allowed_file,
+    is_archive,
+    store_audio,
+    create_audio_file,
+    iter_archive_entries,
+    ingest_many,
+    create_direct_upload,
+    complete_direct_upload
+)
+from ...services.pipeline import create_pipeline_jobs
+from ...services.live_ingest import ingest_stream, save_ingest
+from ...services.resumable_upload import (
+    UploadError,
+    create_upload_session,
+    get_active_session,
+    write_chunk,
+    complete_upload
+)
+import anyio
+import os
 
 router = APIRouter()
 
-AUDIO_UPLOAD_DIR = "uploads/audio"
-ALLOWED_EXTENSIONS = {"mp3", "wav"}
-
 # Upewnij się, że katalog istnieje
-os.makedirs(AUDIO_UPLOAD_DIR, exist_ok=True)
-
-def allowed_file(filename: str) -> bool:
-    return filename.lower().split(".")[-1] in ALLOWED_EXTENSIONS
+os.makedirs(AUDIO_STORAGE_DIR, exist_ok=True)
 
 @router.post("/upload/", response_model=AudioFileSchema)
-async def upload_audio(
+def upload_audio(
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
+    # Zwykła funkcja: FastAPI wykonuje ją w puli wątków, więc zapis pliku (dysk / S3)
+    # i zapytania do bazy nie blokują pętli zdarzeń
     if not allowed_file(file.filename):
         raise HTTPException(
             status_code=400,
             detail="Dozwolone tylko pliki MP3 i WAV"
         )
     
-    # Generuj unikalną nazwę pliku
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    file_path = os.path.join(AUDIO_UPLOAD_DIR, filename)
-    
-    # Zapisz plik
+    # Zapisz plik pod ścieżką adresowaną skrótem SHA-256 zawartości
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        record = store_audio(file.file, file.filename)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Błąd podczas zapisywania pliku: {str(e)}"
         )
     
-    # Zapisz informacje w bazie danych
-    db_audio = AudioFile(
-        filename=filename,
-        file_path=file_path,
-        file_type=file.filename.split(".")[-1].lower(),
-        duration=0.0  # TODO: Dodać rzeczywiste obliczanie długości
+    # Ten sam plik był już przesłany - zostanie zwrócony istniejący rekord
+    # (wraz z jego transkrypcją i oceną, bez ponownego przetwarzania)
+    return create_audio_file(db, record)
+
+@router.post("/upload/batch/", response_model=BatchUploadResult)
+def upload_audio_batch(
+    files: List[UploadFile] = File(...),
+    enqueue: bool = Form(False),
+    scorecard_type: str = Form("SERVICE"),
+    db: Session = Depends(get_db)
+):
+    """
+    Hurtowy upload: wiele plików MP3/WAV i/lub archiwów ZIP/TAR w jednym żądaniu.
+    Archiwa są rozpakowywane strumieniowo, rekordy zapisywane jedną transakcją.
+    Opcjonalnie (enqueue=true) od razu kolejkuje przetwarzanie wszystkich plików.
+    """
+    skipped = [
+        upload.filename for upload in files
+        if not allowed_file(upload.filename) and not is_archive(upload.filename)
+    ]
+    
+    sources = chain.from_iterable(
+        iter_archive_entries(upload.file, upload.filename) if is_archive(upload.filename)
+        else [(upload.filename, upload.file)]
+        for upload in files
+        if allowed_file(upload.filename) or is_archive(upload.filename)
     )
     
-    db.add(db_audio)
-    db.commit()
-    db.refresh(db_audio)
+    try:
+        result = ingest_many(db, sources)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Błąd podczas przetwarzania przesłanych plików: {str(e)}"
+        )
+    
+    job_ids = []
+    if enqueue and result["files"]:
+        unique_files = list({audio.id: audio for audio in result["files"]}.values())
+        job_ids = create_pipeline_jobs(db, unique_files, scorecard_type)
     
-    return db_audio
+    print(f"Hurtowy upload: {result['created']} nowych plików, {result['duplicates']} duplikatów")
+    
+    return BatchUploadResult(
+        files=result["files"],
+        created=result["created"],
+        duplicates=result["duplicates"],
+        skipped=skipped,
+        job_ids=job_ids
+    )
+
+# ========== UPLOAD Z TRANSKRYPCJĄ W TRAKCIE PRZESYŁANIA ==========
+
+@router.post("/ingest/", response_model=LiveIngestResult)
+async def ingest_audio_live(
+    request: Request,
+    filename: str,
+    enqueue: bool = False,
+    scorecard_type: str = "SERVICE",
+    provider: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Upload z transkrypcją strumieniową: treścią żądania jest sam plik MP3/WAV
+    (nie multipart), nazwa w parametrze filename. Nagranie jest zapisywane
+    i jednocześnie wysyłane do dostawcy strumieniowego (LIVE_INGEST_PROVIDER),
+    więc odpowiedź zawiera gotową transkrypcję z segmentami mówców.
+    Opcjonalnie (enqueue=true) kolejkuje ocenę.
+    """
+    try:
+        ingested = await ingest_stream(request.stream(), filename, provider)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await anyio.to_thread.run_sync(save_ingest, db, ingested, enqueue, scorecard_type)
+
+# ========== BEZPOŚREDNI UPLOAD DO MAGAZYNU ==========
+
+@router.post("/uploads/direct/", response_model=DirectUpload)
+def start_direct_upload(
+    upload_data: DirectUploadCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Zwraca podpisany URL, pod który klient wysyła plik bezpośrednio do magazynu S3
+    (z podanymi nagłówkami), albo istniejący rekord, jeśli plik już przesłano.
+    Po wysłaniu pliku należy wywołać POST /uploads/direct/complete.
+    """
+    try:
+        return create_direct_upload(db, upload_data.filename, upload_data.sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/uploads/direct/complete", response_model=AudioFileSchema)
+def finish_direct_upload(
+    upload_data: DirectUploadCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Tworzy rekord AudioFile dla pliku przesłanego bezpośrednio do magazynu.
+    """
+    try:
+        return complete_direct_upload(db, upload_data.filename, upload_data.sha256)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# ========== WZNAWIALNY UPLOAD W CZĘŚCIACH ==========
+
+@router.post("/uploads/", response_model=UploadSessionSchema, status_code=201)
+def start_resumable_upload(
+    upload_data: UploadSessionCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Zakłada sesję wznawialnego uploadu. Części pliku wysyła się potem żądaniami
+    PUT /uploads/{id} z nagłówkiem Content-Range: bytes start-end/total.
+    """
+    try:
+        return create_upload_session(db, upload_data.filename, upload_data.total_size, upload_data.sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.get("/uploads/{session_id}", response_model=UploadSessionSchema)
+def get_resumable_upload(
+    session_id: str,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Zwraca stan sesji; received_size (i nagłówek Upload-Offset) to offset,
+    od którego należy wznowić wysyłanie.
+    """
+    try:
+        upload = get_active_session(db, session_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    response.headers["Upload-Offset"] = str(upload.received_size)
+    return upload
+
+@router.put("/uploads/{session_id}", response_model=UploadSessionSchema)
+async def put_upload_chunk(
+    session_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Zapisuje część pliku wskazaną nagłówkiem Content-Range.
+    """
+    try:
+        upload = await anyio.to_thread.run_sync(get_active_session, db, session_id)
+        upload = await write_chunk(db, upload, request.headers.get("content-range"), request.stream())
+    except UploadError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Upload-Offset": str(upload.received_size)} if e.status_code == 409 else None
+        )
+    
+    response.headers["Upload-Offset"] = str(upload.received_size)
+    return upload
+
+@router.post("/uploads/{session_id}/complete", response_model=AudioFileSchema)
+def complete_resumable_upload(
+    session_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Kończy upload: weryfikuje kompletność i SHA-256, zapisuje plik w magazynie
+    i tworzy rekord AudioFile (jak POST /upload/).
+    """
+    try:
+        upload = get_active_session(db, session_id)
+        return complete_upload(db, upload)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 @router.get("/files/", response_model=List[AudioFileSchema])
 def list_audio_files(db: Session = Depends(get_db)):
@@ -71,6 +260,67 @@ def get_audio_file(file_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Plik nie znaleziony")
     return db_audio
 
+@router.api_route("/files/{file_id}/stream", methods=["GET", "HEAD"])
+def stream_audio_file(
+    file_id: int,
+    request: Request,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Odtwarza nagranie z obsługą nagłówka Range (przewijanie bez pobierania całości).
+    Parametry start/end (sekundy) zwracają sam fragment, np. wokół cytatu z oceny.
+    """
+    db_audio = db.query(AudioFile).filter(AudioFile.id == file_id).first()
+    if db_audio is None:
+        raise HTTPException(status_code=404, detail="Plik nie znaleziony")
+
+    location = db_audio.file_path
+    if start is None and end is None:
+        # Magazyn S3 obsługuje Range sam - klient pobiera dane bezpośrednio z niego
+        download_url = storage_for(location).presigned_download_url(location)
+        if download_url:
+            return RedirectResponse(download_url, status_code=307)
 
+    try:
+        path = local_audio_path(location)
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Plik audio nie istnieje w magazynie")
+
+    if start is None and end is None:
+        prefix, offset, length = b"", 0, stat.st_size
+        etag = f'"{db_audio.content_hash or f"{stat.st_size:x}-{int(stat.st_mtime):x}"}"'
+    else:
+        try:
+            prefix, offset, length = time_slice(path, db_audio.file_type, max(start or 0.0, 0.0), end)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        etag = f'"{db_audio.content_hash or int(stat.st_mtime)}-{start or 0}-{end or ""}"'
 
+    headers = {
+        "etag": etag,
+        "last-modified": http_date(stat.st_mtime),
+        "cache-control": "private, max-age=86400",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
+    # If-Range: zakres tylko wtedy, gdy klient ma tę samą wersję pliku
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range in (etag, headers["last-modified"]):
+        try:
+            byte_range = parse_range(request.headers.get("range"), len(prefix) + length)
+        except RangeNotSatisfiable:
+            raise HTTPException(
+                status_code=416,
+                detail="Żądany zakres jest poza plikiem",
+                headers={"Content-Range": f"bytes */{len(prefix) + length}"}
+            )
+
+    return FileRangeResponse(
+        path, offset, length, prefix, byte_range, headers,
+        media_type=AUDIO_MEDIA_TYPES.get(db_audio.file_type, "application/octet-stream")
+    )
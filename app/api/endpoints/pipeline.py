@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ...database import get_db
+from ...models.audio import AudioFile
+from ...schemas.pipeline import PipelineJob as PipelineJobSchema
+from ...services.pipeline import create_pipeline_job, get_pipeline_job
+from ...services.provider_cache import cache_stats
+from ...services.speech import providers_status
+
+router = APIRouter()
+
+@router.post("/{audio_id}", response_model=PipelineJobSchema, status_code=202)
+def start_pipeline(
+    audio_id: int,
+    scorecard_type: str = "SERVICE",
+    db: Session = Depends(get_db)
+):
+    """
+    Kolejkuje pełne przetwarzanie pliku audio (transkrypcja → diaryzacja → ocena)
+    do wykonania przez workery. Zwraca zadanie, którego stan można odpytywać.
+    """
+    audio_file = db.query(AudioFile).filter(AudioFile.id == audio_id).first()
+    if not audio_file:
+        raise HTTPException(status_code=404, detail="Plik audio nie znaleziony")
+
+    job = create_pipeline_job(db, audio_file, scorecard_type)
+
+    print(f"Zadanie pipeline {job.id} zakolejkowane dla pliku audio ID: {audio_id}")
+
+    return job
+
+@router.get("/jobs/{job_id}", response_model=PipelineJobSchema)
+def get_pipeline_job_status(
+    job_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    Zwraca stan zadania wraz ze stanem i czasami poszczególnych etapów.
+    """
+    job = get_pipeline_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Zadanie nie znalezione")
+
+    return job
+
+@router.get("/providers")
+def get_providers_status():
+    """
+    Zwraca stan dostawców transkrypcji (dostępność, bezpiecznik, czas odpowiedzi p95)
+    w kolejności, w jakiej pipeline by ich teraz użył.
+    """
+    return providers_status()
+
+@router.get("/cache")
+def get_provider_cache():
+    """Statystyki pamięci podręcznej odpowiedzi dostawców (trafienia, rozmiar, usunięte wpisy)"""
+    return cache_stats()
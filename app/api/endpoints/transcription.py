@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
+import anyio
 import os
 
 from ...database import get_db
 from ...models.audio import AudioFile
 from ...models.transcription import Transcription
 from ...schemas.transcription import Transcription as TranscriptionSchema
-from ...services.transcription import get_openai_client, transcribe_audio
+from ...services.transcription import get_openai_client
+from ...services.pipeline import transcribe_audio_file_async
+from ...services.provider_calls import ProviderError
 
 router = APIRouter()
 
@@ -29,11 +32,8 @@ def test_openai_api():
             detail=f"Błąd połączenia z OpenAI: {str(e)}"
         )
 
-@router.post("/transcribe/{audio_id}", response_model=TranscriptionSchema)
-def create_transcription(
-    audio_id: int,
-    db: Session = Depends(get_db)
-):
+def _audio_file_to_transcribe(db: Session, audio_id: int) -> AudioFile:
+    """Plik audio do transkrypcji (zapytania wykonywane w wątku)."""
     # Sprawdź czy plik audio istnieje
     audio_file = db.query(AudioFile).filter(AudioFile.id == audio_id).first()
     if not audio_file:
@@ -50,26 +50,20 @@ def create_transcription(
             detail="Transkrypcja dla tego pliku już istnieje"
         )
     
+    return audio_file
+
+@router.post("/transcribe/{audio_id}", response_model=TranscriptionSchema)
+async def create_transcription(
+    audio_id: int,
+    db: Session = Depends(get_db)
+):
+    audio_file = await anyio.to_thread.run_sync(_audio_file_to_transcribe, db, audio_id)
+    
     try:
-        # Otwórz plik audio
-        with open(audio_file.file_path, "rb") as audio:
-            # Wykonaj transkrypcję
-            result = transcribe_audio(audio)
-        
-        # Zapisz transkrypcję w bazie danych
-        transcription = Transcription(
-            audio_file_id=audio_id,
-            text=result["text"],
-            language=result["language"],
-            duration=result["duration"]
-        )
-        
-        db.add(transcription)
-        db.commit()
-        db.refresh(transcription)
-        
-        return transcription
+        return await transcribe_audio_file_async(db, audio_file)
     
+    except ProviderError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -1,16 +1,44 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from .api.endpoints import audio, transcription, diarization, evaluation, scorecard
-from .database import Base, engine
+from .api.endpoints import audio, transcription, diarization, evaluation, scorecard, pipeline
+from .database import Base, engine, ensure_schema_columns
+from .worker import start_embedded_workers, stop_embedded_workers
+from .services.clients import init_clients, close_clients, close_async_clients
+from .services.provider_calls import ProviderError, ProviderRateLimited
 
 # Tworzymy tabele w bazie danych
 Base.metadata.create_all(bind=engine)
+ensure_schema_columns()
 
-app = FastAPI(title="System Oceny Rozmów (SOR)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Klienty dostawców tworzone raz na proces (pule połączeń, keep-alive)
+    init_clients()
+    # Wbudowane workery pipeline (PIPELINE_EMBEDDED_WORKERS=0 gdy działają osobne procesy app.worker)
+    start_embedded_workers()
+    yield
+    stop_embedded_workers()
+    close_clients()
+    await close_async_clients()
+
+app = FastAPI(title="System Oceny Rozmów (SOR)", lifespan=lifespan)
+
+# Przeciążony lub niedostępny dostawca to błąd przejściowy (429/503), nie 500
+@app.exception_handler(ProviderError)
+async def provider_error_handler(request: Request, exc: ProviderError):
+    headers = {}
+    if exc.retry_after:
+        headers["Retry-After"] = str(max(int(exc.retry_after + 0.999), 1))
+    return JSONResponse(
+        status_code=429 if isinstance(exc, ProviderRateLimited) else 503,
+        content={"detail": str(exc), "provider": exc.provider},
+        headers=headers
+    )
 
 # Konfiguracja CORS
 app.add_middleware(
@@ -57,4 +85,5 @@ app.include_router(audio.router, prefix="/api/audio", tags=["audio"])
 app.include_router(transcription.router, prefix="/api/transcription", tags=["transcription"])
 app.include_router(diarization.router, prefix="/api/diarization", tags=["diarization"])
 app.include_router(evaluation.router, prefix="/api/evaluation", tags=["evaluation"])
-app.include_router(scorecard.router, prefix="/api", tags=["scorecard"])
\ No newline at end of file
+app.include_router(scorecard.router, prefix="/api", tags=["scorecard"])
+app.include_router(pipeline.router, prefix="/api/pipeline", tags=["pipeline"])
\ No newline at end of file
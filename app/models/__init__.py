@@ -3,5 +3,8 @@
 from .audio import AudioFile
 from .transcription import Transcription
 from .speaker_segment import SpeakerSegment
+from .pipeline import PipelineJob, PipelineStage
+from .upload_session import UploadSession
+from .provider_cache import ProviderCacheEntry
 
-__all__ = ["AudioFile", "Transcription", "SpeakerSegment"]
+__all__ = ["AudioFile", "Transcription", "SpeakerSegment", "PipelineJob", "PipelineStage", "UploadSession", "ProviderCacheEntry"]
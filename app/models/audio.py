@@ -10,6 +10,11 @@ class AudioFile(Base):
     file_path = Column(String)
     duration = Column(Float)
     file_type = Column(String)  # MP3 lub WAV
+    content_hash = Column(String(64), unique=True, index=True, nullable=True)  # SHA-256 zawartości
+    file_size = Column(Integer, nullable=True)  # Rozmiar w bajtach
+    sample_rate = Column(Integer, nullable=True)  # Hz
+    channels = Column(Integer, nullable=True)
+    bitrate = Column(Integer, nullable=True)  # bit/s
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..database import Base
+
+class PipelineJob(Base):
+    """Model dla zadania przetwarzania rozmowy (transkrypcja → diaryzacja → ocena)"""
+    __tablename__ = "pipeline_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    audio_file_id = Column(Integer, ForeignKey("audio_files.id"), nullable=False, index=True)
+    scorecard_type = Column(String(50), nullable=False, default="SERVICE")
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed, failed
+    transcription_id = Column(Integer, ForeignKey("transcriptions.id"), nullable=True)
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Relacje
+    audio_file = relationship("AudioFile")
+    stages = relationship(
+        "PipelineStage",
+        back_populates="job",
+        cascade="all, delete-orphan",
+        order_by="PipelineStage.position"
+    )
+
+class PipelineStage(Base):
+    """Model dla pojedynczego etapu zadania wraz z czasami wykonania"""
+    __tablename__ = "pipeline_stages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("pipeline_jobs.id"), nullable=False, index=True)
+    name = Column(String(50), nullable=False)  # transcription, diarization, evaluation
+    position = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # waiting, pending, running, completed, skipped, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_by = Column(String(100), nullable=True)  # Identyfikator workera, który wykonuje etap
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # Ostatni heartbeat workera
+    available_at = Column(DateTime(timezone=True), nullable=True)  # Ponowienie nie wcześniej niż (przeciążony dostawca)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+
+    # Relacja
+    job = relationship("PipelineJob", back_populates="stages")
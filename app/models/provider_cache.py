@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from sqlalchemy.sql import func
+from ..database import Base
+
+class ProviderCacheEntry(Base):
+    """Model dla zapisanej odpowiedzi dostawcy (transkrypcja, diaryzacja, ocena GPT-4)"""
+    __tablename__ = "provider_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 nagrania/promptu, dostawcy, modelu i opcji
+    kind = Column(String(20), nullable=False)  # speech, llm
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=True)
+    payload = Column(LargeBinary, nullable=False)  # Odpowiedź dostawcy (JSON skompresowany zlib)
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -34,6 +34,7 @@ class PhraseMatch(Base):
     phrase = Column(String(500), nullable=False)
     phrase_type = Column(String(20), nullable=False)  # "required" lub "forbidden"
     found = Column(Boolean, nullable=False)  # Czy fraza została znaleziona
+    match_type = Column(String(20), nullable=True)  # "exact" lub "fuzzy" (po normalizacji, z tolerancją błędów)
     timestamp = Column(String(20), nullable=True)  # Gdzie została znaleziona
     speaker = Column(String(50), nullable=True)  # KONSULTANT lub KLIENT
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -13,6 +13,7 @@ class SpeakerSegment(Base):
     speaker_label = Column(String(50), nullable=False)
     text = Column(Text, nullable=True)
     confidence = Column(Float, nullable=True)
+    normalized_text = Column(Text, nullable=True)  # Tekst do wyszukiwania fraz (services.text_normalize)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relacja z transkrypcją
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text, LargeBinary
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -11,6 +11,7 @@ class Transcription(Base):
     text = Column(Text)
     language = Column(String)
     duration = Column(Float)
+    words = Column(LargeBinary, nullable=True)  # Słowa ze znacznikami czasu (services.word_store)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
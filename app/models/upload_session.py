@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, ForeignKey
+from sqlalchemy.sql import func
+from ..database import Base
+
+class UploadSession(Base):
+    """Model dla wznawialnego uploadu przesyłanego w częściach"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True, index=True)
+    filename = Column(String, nullable=False)  # Oryginalna nazwa pliku
+    file_type = Column(String(10), nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    received_size = Column(BigInteger, nullable=False, default=0)
+    expected_hash = Column(String(64), nullable=True)  # SHA-256 podany przez klienta
+    temp_path = Column(String, nullable=False)
+    status = Column(String(20), nullable=False, default="active", index=True)  # active, completed, expired
+    audio_file_id = Column(Integer, ForeignKey("audio_files.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict
 
 class AudioFileBase(BaseModel):
     filename: str
@@ -13,12 +13,59 @@ class AudioFileCreate(AudioFileBase):
 class AudioFile(AudioFileBase):
     id: int
     file_path: str
+    content_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    bitrate: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class BatchUploadResult(BaseModel):
+    files: List[AudioFile]
+    created: int
+    duplicates: int
+    skipped: List[str] = []
+    job_ids: List[int] = []
 
+class LiveIngestResult(BaseModel):
+    audio_file: AudioFile
+    # Transkrypcja ze strumienia (lub istniejąca, jeśli plik był już przetworzony)
+    transcription_id: Optional[int] = None
+    segments: int = 0
+    provider: Optional[str] = None
+    # Błąd sesji strumieniowej - plik zapisany, transkrypcję wykona pipeline
+    live_error: Optional[str] = None
+    job_id: Optional[int] = None
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+    sha256: Optional[str] = None
+
+class UploadSession(BaseModel):
+    id: str
+    filename: str
+    total_size: int
+    received_size: int
+    status: str
+    expires_at: datetime
+    audio_file_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class DirectUploadCreate(BaseModel):
+    filename: str
+    sha256: str
 
+class DirectUpload(BaseModel):
+    # Plik już istnieje - upload nie jest potrzebny
+    audio_file: Optional[AudioFile] = None
+    upload_url: Optional[str] = None
+    method: Optional[str] = None
+    headers: Dict[str, str] = {}
+    expires_in: Optional[int] = None
@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional, List
+
+class PipelineStage(BaseModel):
+    name: str
+    position: int
+    status: str
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class PipelineJob(BaseModel):
+    id: int
+    audio_file_id: int
+    scorecard_type: str
+    status: str
+    transcription_id: Optional[int] = None
+    evaluation_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    stages: List[PipelineStage] = []
+
+    class Config:
+        from_attributes = True
@@ -25,3 +25,15 @@ class DiarizationResult(BaseModel):
     total_segments: int
     speakers_count: int
     total_duration: float
+
+class WordTiming(BaseModel):
+    word: str
+    start: float
+    end: float
+    confidence: float
+    speaker_label: str
+
+class TranscriptionWords(BaseModel):
+    transcription_id: int
+    total_words: int
+    words: list[WordTiming]
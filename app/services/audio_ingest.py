@@ -0,0 +1,262 @@
+"""
+Przyjmowanie plików audio: zapis adresowany zawartością, odczyt parametrów
+z nagłówków i utworzenie rekordów AudioFile - pojedynczo lub hurtowo
+(wiele plików albo archiwum ZIP/TAR w jednym żądaniu).
+"""
+import os
+import tarfile
+import zipfile
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.audio import AudioFile
+from .storage import store_stream, local_audio_path, get_storage, content_key
+from .audio_probe import probe_audio_file
+
+ALLOWED_EXTENSIONS = {"mp3", "wav"}
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Limity archiwum w uploadzie hurtowym (ochrona przed "bombami" ZIP/TAR):
+# łączny rozmiar plików po rozpakowaniu (MB) i liczba elementów archiwum
+BATCH_ARCHIVE_MAX_MB = int(os.getenv("BATCH_ARCHIVE_MAX_MB", "4096"))
+BATCH_ARCHIVE_MAX_MEMBERS = int(os.getenv("BATCH_ARCHIVE_MAX_MEMBERS", "5000"))
+
+# Maksymalna liczba wartości w jednym zapytaniu IN (...)
+_HASH_LOOKUP_BATCH = 500
+
+def allowed_file(filename: str) -> bool:
+    return filename.lower().split(".")[-1] in ALLOWED_EXTENSIONS
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+def probe_audio_info(file_path: str, file_type: str) -> Dict:
+    """Parametry nagrania z nagłówków; pusty słownik, jeśli nie da się ich odczytać."""
+    try:
+        return probe_audio_file(file_path, file_type)
+    except (ValueError, OSError) as e:
+        print(f"Ostrzeżenie: Nie można odczytać parametrów pliku {file_path}: {e}")
+        return {}
+
+def find_audio_by_hash(db: Session, content_hash: str) -> Optional[AudioFile]:
+    return db.query(AudioFile).filter(AudioFile.content_hash == content_hash).first()
+
+def store_audio(source: BinaryIO, original_filename: str) -> Dict:
+    """
+    Zapisuje strumień pliku audio i odczytuje jego parametry.
+    Zwraca słownik pól rekordu AudioFile (bez zapisu do bazy).
+    """
+    file_type = original_filename.split(".")[-1].lower()
+    return audio_record(store_stream(source, file_type), original_filename)
+
+def audio_record(stored: Dict, original_filename: str) -> Dict:
+    """Buduje pola rekordu AudioFile dla pliku zapisanego w magazynie."""
+    file_type = original_filename.split(".")[-1].lower()
+    probe = probe_audio_info(local_audio_path(stored["file_path"]), file_type)
+
+    # Generuj unikalną nazwę pliku
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    return {
+        "filename": f"{timestamp}_{os.path.basename(original_filename)}",
+        "file_path": stored["file_path"],
+        "file_type": file_type,
+        "content_hash": stored["content_hash"],
+        "file_size": stored["file_size"],
+        "duration": probe.get("duration", 0.0),
+        "sample_rate": probe.get("sample_rate"),
+        "channels": probe.get("channels"),
+        "bitrate": probe.get("bitrate"),
+    }
+
+def create_audio_file(db: Session, record: Dict) -> AudioFile:
+    """
+    Tworzy rekord AudioFile. Jeśli plik o tej samej zawartości już istnieje,
+    zwraca istniejący rekord (wraz z jego transkrypcją i oceną).
+    """
+    existing = find_audio_by_hash(db, record["content_hash"])
+    if existing:
+        print(f"Plik {record['filename']} jest duplikatem pliku audio ID: {existing.id}")
+        return existing
+
+    db_audio = AudioFile(**record)
+    db.add(db_audio)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Równoległy upload tego samego pliku zdążył zapisać rekord
+        db.rollback()
+        return find_audio_by_hash(db, record["content_hash"])
+    db.refresh(db_audio)
+
+    return db_audio
+
+def create_direct_upload(db: Session, filename: str, content_hash: str) -> Dict:
+    """
+    Przygotowuje bezpośredni upload pliku do magazynu (z pominięciem serwera).
+    Jeśli plik o tym skrócie już istnieje, zwraca go zamiast URL-a.
+
+    Returns:
+        Dict: {"audio_file"} albo {"upload_url", "method", "headers", "expires_in"}
+    """
+    if not allowed_file(filename):
+        raise ValueError("Dozwolone tylko pliki MP3 i WAV")
+
+    content_hash = content_hash.lower()
+    existing = find_audio_by_hash(db, content_hash)
+    if existing:
+        return {"audio_file": existing}
+
+    file_type = filename.split(".")[-1].lower()
+    upload = get_storage().presigned_upload(content_key(content_hash, file_type), content_hash)
+    if upload is None:
+        raise ValueError("Bezpośredni upload wymaga magazynu S3 (STORAGE_BACKEND=s3)")
+    return upload
+
+def complete_direct_upload(db: Session, filename: str, content_hash: str) -> AudioFile:
+    """
+    Tworzy rekord AudioFile dla pliku wysłanego bezpośrednio do magazynu.
+    Parametry nagrania uzupełnia pierwszy etap pipeline, który i tak pobiera plik.
+    """
+    content_hash = content_hash.lower()
+    file_type = filename.split(".")[-1].lower()
+    key = content_key(content_hash, file_type)
+
+    storage = get_storage()
+    size = storage.size(key)
+    if size is None:
+        raise LookupError("Plik nie został jeszcze przesłany do magazynu")
+
+    stored_hash = storage.checksum(key)
+    if stored_hash and stored_hash != content_hash:
+        storage.delete(key)
+        raise ValueError("Skrót SHA-256 przesłanego pliku nie zgadza się z zadeklarowanym")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return create_audio_file(db, {
+        "filename": f"{timestamp}_{os.path.basename(filename)}",
+        "file_path": storage.location(key),
+        "file_type": file_type,
+        "content_hash": content_hash,
+        "file_size": size,
+        "duration": 0.0,
+    })
+
+def _check_archive_limits(archive_name: str, members: int, total_size: int) -> None:
+    if members > BATCH_ARCHIVE_MAX_MEMBERS:
+        raise ValueError(f"Archiwum {archive_name} ma więcej niż {BATCH_ARCHIVE_MAX_MEMBERS} elementów")
+    if total_size > BATCH_ARCHIVE_MAX_MB * 1024 * 1024:
+        raise ValueError(f"Archiwum {archive_name} po rozpakowaniu przekracza {BATCH_ARCHIVE_MAX_MB} MB")
+
+def iter_archive_entries(source: BinaryIO, archive_name: str) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Zwraca kolejne pliki audio z archiwum jako strumienie (bez rozpakowywania
+    całego archiwum). TAR czytany jest sekwencyjnie, ZIP przez katalog centralny.
+
+    Archiwum przekraczające BATCH_ARCHIVE_MAX_MB lub BATCH_ARCHIVE_MAX_MEMBERS
+    jest odrzucane (ValueError): ZIP przed rozpakowaniem czegokolwiek (rozmiary
+    z katalogu centralnego - zipfile nie odczyta więcej, niż zadeklarowano),
+    TAR w trakcie odczytu, zanim przekroczony element zostanie zapisany.
+    """
+    if archive_name.lower().endswith(".zip"):
+        with zipfile.ZipFile(source) as archive:
+            infos = archive.infolist()
+            _check_archive_limits(archive_name, len(infos), sum(info.file_size for info in infos))
+            for info in infos:
+                if info.is_dir() or not allowed_file(info.filename):
+                    continue
+                with archive.open(info) as entry:
+                    yield info.filename, entry
+        return
+
+    members = 0
+    total_size = 0
+    with tarfile.open(fileobj=source, mode="r|*") as archive:
+        for member in archive:
+            members += 1
+            total_size += member.size if member.isfile() else 0
+            _check_archive_limits(archive_name, members, total_size)
+            if not member.isfile() or not allowed_file(member.name):
+                continue
+            entry = archive.extractfile(member)
+            if entry is None:
+                continue
+            yield member.name, entry
+
+def _load_by_hashes(db: Session, hashes: List[str]) -> Dict[str, AudioFile]:
+    by_hash: Dict[str, AudioFile] = {}
+    for start in range(0, len(hashes), _HASH_LOOKUP_BATCH):
+        batch = hashes[start:start + _HASH_LOOKUP_BATCH]
+        for audio in db.query(AudioFile).filter(AudioFile.content_hash.in_(batch)).all():
+            by_hash[audio.content_hash] = audio
+    return by_hash
+
+def _existing_filenames(db: Session, names: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(names), _HASH_LOOKUP_BATCH):
+        batch = names[start:start + _HASH_LOOKUP_BATCH]
+        existing.update(name for name, in db.query(AudioFile.filename).filter(AudioFile.filename.in_(batch)))
+    return existing
+
+def ingest_many(db: Session, sources: Iterator[Tuple[str, BinaryIO]]) -> Dict:
+    """
+    Zapisuje wiele plików audio i tworzy ich rekordy jedną transakcją.
+    Duplikaty (w partii i w bazie) wskazują na istniejące rekordy.
+
+    Returns:
+        Dict: {"files": [AudioFile...], "created": int, "duplicates": int}
+    """
+    records = [store_audio(stream, original_filename) for original_filename, stream in sources]
+
+    # Nazwy muszą być unikalne w obrębie partii i względem zapisanych plików
+    # (partie przesłane w tej samej sekundzie dostają te same znaczniki czasu)
+    used_names = _existing_filenames(db, list({record["filename"] for record in records}))
+    for record in records:
+        name = record["filename"]
+        suffix = 1
+        while name in used_names:
+            base, extension = os.path.splitext(record["filename"])
+            name = f"{base}_{suffix}{extension}"
+            suffix += 1
+            # Nazwa z przyrostkiem mogła zostać zajęta przez wcześniejszą partię
+            used_names |= _existing_filenames(db, [name])
+        used_names.add(name)
+        record["filename"] = name
+
+    # Jedno zapytanie (na partię hashy) o pliki, które już są w bazie
+    hashes = list({record["content_hash"] for record in records})
+    by_hash = _load_by_hashes(db, hashes)
+
+    new_files = []
+    for record in records:
+        if record["content_hash"] in by_hash:
+            continue
+        audio = AudioFile(**record)
+        by_hash[record["content_hash"]] = audio
+        new_files.append(audio)
+
+    db.add_all(new_files)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Równoległy upload - zapisz pojedynczo, pomijając istniejące
+        db.rollback()
+        for audio in new_files:
+            by_hash[audio.content_hash] = create_audio_file(db, {
+                column.name: getattr(audio, column.name)
+                for column in AudioFile.__table__.columns
+                if column.name not in ("id", "created_at", "updated_at")
+            })
+
+    # Po commit obiekty są nieaktualne - wczytaj je ponownie hurtowo zamiast po jednym
+    by_hash = _load_by_hashes(db, hashes)
+    files = [by_hash[record["content_hash"]] for record in records]
+
+    return {
+        "files": files,
+        "created": len(new_files),
+        "duplicates": len(records) - len(new_files),
+    }
@@ -0,0 +1,206 @@
+"""
+Normalizacja audio przed wysłaniem do dostawcy transkrypcji.
+
+Rozpoznawanie mowy nie potrzebuje więcej niż 16 kHz mono, więc nagrania
+44,1 kHz stereo konwertujemy do 16 kHz mono PCM 16-bit (ok. 5,5x mniej
+danych do wysłania) albo - przy keep_channels - do osobnej ścieżki na kanał.
+Pliki WAV przetwarzamy w NumPy blokami (stała pamięć niezależnie od długości
+nagrania); inne formaty lub kodowanie FLAC wymagają ffmpeg w systemie.
+Wynik zapisywany jest obok oryginału i używany ponownie przy kolejnych wywołaniach.
+"""
+import os
+import shutil
+import subprocess
+import wave
+from typing import List, Optional
+
+import numpy as np
+
+from .audio_probe import probe_audio_file
+
+# Włącza normalizację przed wywołaniem dostawcy
+AUDIO_NORMALIZATION = os.getenv("AUDIO_NORMALIZATION", "false").lower() in ("1", "true", "yes")
+
+NORMALIZED_SAMPLE_RATE = int(os.getenv("AUDIO_NORMALIZED_SAMPLE_RATE", "16000"))
+
+# wav (PCM 16-bit, bez zależności) lub flac (wymaga ffmpeg)
+NORMALIZED_FORMAT = os.getenv("AUDIO_NORMALIZED_FORMAT", "wav").lower()
+
+# Długość bloku przetwarzania w próbkach wyjściowych
+_BLOCK_FRAMES = 16000 * 30
+
+# Liczba współczynników filtru dolnoprzepustowego przed decymacją
+_FILTER_TAPS = 63
+
+def normalized_path(file_path: str, channel: Optional[int] = None, extension: str = "wav") -> str:
+    """Ścieżka znormalizowanej kopii pliku (obok oryginału)."""
+    suffix = f".{NORMALIZED_SAMPLE_RATE // 1000}k"
+    if channel is not None:
+        suffix += f".ch{channel}"
+    return f"{file_path}{suffix}.{extension}"
+
+def _is_cached(source: str, target: str) -> bool:
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+def _lowpass_taps(cutoff: float) -> np.ndarray:
+    """Filtr FIR (okienkowany sinc); cutoff jako ułamek częstotliwości próbkowania."""
+    n = np.arange(_FILTER_TAPS) - (_FILTER_TAPS - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(_FILTER_TAPS)
+    return (taps / taps.sum()).astype(np.float32)
+
+def _pcm_frames(file_path: str, info: dict) -> np.ndarray:
+    """Mapuje dane PCM pliku WAV do tablicy (ramki, kanały) bez wczytywania całości."""
+    channels = info["channels"]
+    bits = info["bits_per_sample"]
+    audio_format = info["audio_format"]
+    frames = info["data_size"] // info["block_align"]
+
+    if audio_format == 3:
+        dtype = {32: "<f4", 64: "<f8"}.get(bits)
+    elif audio_format == 1:
+        dtype = {8: "u1", 16: "<i2", 24: "u1", 32: "<i4"}.get(bits)
+    else:
+        dtype = None
+    if dtype is None:
+        raise ValueError(f"Nieobsługiwany format WAV (format={audio_format}, bity={bits})")
+
+    if bits == 24:
+        # Próbki 3-bajtowe składamy w _to_float
+        return np.memmap(file_path, dtype="u1", mode="r", offset=info["data_offset"], shape=(frames, channels, 3))
+    return np.memmap(file_path, dtype=dtype, mode="r", offset=info["data_offset"], shape=(frames, channels))
+
+def _to_float(block: np.ndarray, bits: int, audio_format: int) -> np.ndarray:
+    """Konwertuje blok próbek PCM do float32 w zakresie [-1, 1]."""
+    if audio_format == 3:
+        return block.astype(np.float32)
+    if bits == 8:
+        return (block.astype(np.float32) - 128.0) / 128.0
+    if bits == 24:
+        as_int = (block[..., 0].astype(np.int32)
+                  | (block[..., 1].astype(np.int32) << 8)
+                  | (block[..., 2].astype(np.int32) << 16))
+        as_int = np.where(as_int >= 1 << 23, as_int - (1 << 24), as_int)
+        return as_int.astype(np.float32) / float(1 << 23)
+    return block.astype(np.float32) / float(1 << (bits - 1))
+
+def _resample_tracks(pcm: np.ndarray, info: dict, target_rate: int, tracks: List[Optional[int]], writers: List[wave.Wave_write]) -> None:
+    """
+    Przepróbkowuje wskazane ścieżki (None = downmix wszystkich kanałów) blokami
+    i zapisuje je jako PCM 16-bit.
+    """
+    source_rate = info["sample_rate"]
+    total_in = pcm.shape[0]
+    ratio = source_rate / target_rate
+    total_out = int(total_in / ratio)
+    taps = _lowpass_taps(0.45 / ratio) if ratio > 1 else None
+    half = _FILTER_TAPS // 2 + 2
+
+    for out_start in range(0, total_out, _BLOCK_FRAMES):
+        out_end = min(out_start + _BLOCK_FRAMES, total_out)
+        positions = np.arange(out_start, out_end, dtype=np.float64) * ratio
+
+        in_start = max(int(positions[0]) - half, 0)
+        in_end = min(int(positions[-1]) + half + 1, total_in)
+        block = _to_float(pcm[in_start:in_end], info["bits_per_sample"], info["audio_format"])
+
+        for track, writer in zip(tracks, writers):
+            signal = block.mean(axis=1) if track is None else block[:, track]
+            if taps is not None:
+                signal = np.convolve(signal, taps, mode="same")
+            if ratio != 1:
+                signal = np.interp(positions - in_start, np.arange(signal.shape[0]), signal)
+            samples = np.clip(signal * 32767.0, -32768, 32767).astype("<i2")
+            writer.writeframes(samples.tobytes())
+
+def _normalize_wav(file_path: str, info: dict, targets: List[str], tracks: List[Optional[int]]) -> None:
+    target_rate = min(info["sample_rate"], NORMALIZED_SAMPLE_RATE)
+    pcm = _pcm_frames(file_path, info)
+
+    writers = []
+    tmp_targets = [f"{target}.tmp" for target in targets]
+    try:
+        for tmp_target in tmp_targets:
+            writer = wave.open(tmp_target, "wb")
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(target_rate)
+            writers.append(writer)
+
+        _resample_tracks(pcm, info, target_rate, tracks, writers)
+    finally:
+        for writer in writers:
+            writer.close()
+        del pcm
+
+    for tmp_target, target in zip(tmp_targets, targets):
+        os.replace(tmp_target, target)
+
+def _normalize_ffmpeg(file_path: str, target: str, channel: Optional[int] = None) -> None:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise ValueError("Normalizacja tego formatu wymaga programu ffmpeg")
+
+    command = [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", file_path]
+    if channel is not None:
+        command += ["-af", f"pan=mono|c0=c{channel}"]
+    else:
+        command += ["-ac", "1"]
+    command += ["-ar", str(NORMALIZED_SAMPLE_RATE)]
+    tmp_target = f"{target}.tmp{os.path.splitext(target)[1]}"
+    command.append(tmp_target)
+
+    subprocess.run(command, check=True, capture_output=True)
+    os.replace(tmp_target, target)
+
+def normalize_audio(file_path: str, keep_channels: bool = False) -> List[str]:
+    """
+    Tworzy (lub zwraca z pamięci podręcznej) znormalizowane kopie nagrania.
+
+    Args:
+        file_path: Ścieżka oryginalnego pliku
+        keep_channels: True - osobna ścieżka mono na każdy kanał; False - downmix do mono
+
+    Returns:
+        List[str]: Ścieżki plików (jedna przy downmiksie, po jednej na kanał przy keep_channels)
+    """
+    info = probe_audio_file(file_path)
+    channels = info.get("channels") or 1
+    use_wav_path = info["format"] == "wav" and NORMALIZED_FORMAT == "wav"
+    extension = NORMALIZED_FORMAT
+
+    # Nagranie już ma docelowy format - nie ma czego konwertować
+    if (use_wav_path and channels == 1 and info.get("audio_format") == 1
+            and info.get("bits_per_sample") == 16 and info["sample_rate"] <= NORMALIZED_SAMPLE_RATE):
+        return [file_path]
+
+    tracks: List[Optional[int]] = list(range(channels)) if keep_channels and channels > 1 else [None]
+    targets = [normalized_path(file_path, track, extension) for track in tracks]
+
+    if all(_is_cached(file_path, target) for target in targets):
+        return targets
+
+    if use_wav_path:
+        _normalize_wav(file_path, info, targets, tracks)
+    else:
+        for track, target in zip(tracks, targets):
+            _normalize_ffmpeg(file_path, target, track)
+
+    original_size = os.path.getsize(file_path)
+    normalized_size = sum(os.path.getsize(target) for target in targets)
+    print(f"Znormalizowano {file_path}: {original_size} → {normalized_size} bajtów")
+
+    return targets
+
+def prepare_for_provider(file_path: str) -> str:
+    """
+    Zwraca ścieżkę pliku do wysłania dostawcy: znormalizowaną kopię, jeśli
+    normalizacja jest włączona i się powiodła, w przeciwnym razie oryginał.
+    """
+    if not AUDIO_NORMALIZATION:
+        return file_path
+
+    try:
+        return normalize_audio(file_path)[0]
+    except Exception as e:
+        print(f"Ostrzeżenie: Normalizacja {file_path} nie powiodła się, wysyłam oryginał: {e}")
+        return file_path
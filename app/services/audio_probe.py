@@ -0,0 +1,281 @@
+"""
+Odczyt parametrów pliku audio (czas trwania, częstotliwość próbkowania,
+liczba kanałów, bitrate) wyłącznie z nagłówków - bez dekodowania dźwięku.
+
+WAV: przechodzimy po kawałkach RIFF aż do 'fmt ' i 'data'.
+MP3: pomijamy tag ID3v2, czytamy nagłówek pierwszej ramki i nagłówek
+Xing/Info/VBRI; gdy go brak, sprawdzamy kolejne nagłówki ramek, aby
+odróżnić CBR (czas z rozmiaru pliku) od VBR (pełny przegląd nagłówków).
+Niezależnie od długości nagrania odczytujemy co najwyżej kilkadziesiąt KB.
+"""
+import mmap
+import os
+import struct
+from typing import Dict, Optional
+
+# Bitrate w kbps: [wersja MPEG 1 / 2 i 2.5][warstwa][indeks]
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+# Ile ramek sprawdzamy, zanim uznamy plik za CBR
+_MP3_CBR_CHECK_FRAMES = 32
+
+def probe_audio_file(file_path: str, file_type: Optional[str] = None) -> Dict:
+    """
+    Odczytuje parametry pliku audio z nagłówków.
+
+    Args:
+        file_path: Ścieżka do pliku
+        file_type: "wav" lub "mp3"; domyślnie rozpoznawany po zawartości
+
+    Returns:
+        Dict: {"format", "duration", "sample_rate", "channels", "bitrate", ...}
+
+    Raises:
+        ValueError: gdy plik nie jest poprawnym plikiem WAV/MP3
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+
+        if file_type == "wav" or head[:4] in (b"RIFF", b"RF64"):
+            return probe_wav(f)
+        return probe_mp3(f)
+
+def probe_wav(f) -> Dict:
+    """Czyta kawałki RIFF 'fmt ' i 'data' pliku WAV."""
+    file_size = os.fstat(f.fileno()).st_size
+
+    header = f.read(12)
+    if len(header) < 12 or header[:4] not in (b"RIFF", b"RF64") or header[8:12] != b"WAVE":
+        raise ValueError("Nieprawidłowy nagłówek WAV")
+
+    fmt = None
+    data_offset = None
+    data_size = None
+    rf64_data_size = None
+
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        chunk_start = f.tell()
+
+        if chunk_id == b"ds64":
+            # RF64: prawdziwe rozmiary (>4 GB) są w kawałku ds64
+            ds64 = f.read(min(chunk_size, 24))
+            if len(ds64) >= 16:
+                rf64_data_size = struct.unpack("<Q", ds64[8:16])[0]
+        elif chunk_id == b"fmt ":
+            fmt_data = f.read(min(chunk_size, 40))
+            if len(fmt_data) < 16:
+                raise ValueError("Uszkodzony kawałek 'fmt ' pliku WAV")
+            audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack("<HHIIHH", fmt_data[:16])
+            if audio_format == 0xFFFE and len(fmt_data) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE - właściwy format w GUID podformatu
+                audio_format = struct.unpack("<H", fmt_data[24:26])[0]
+            fmt = {
+                "audio_format": audio_format,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "byte_rate": byte_rate,
+                "block_align": block_align,
+                "bits_per_sample": bits,
+            }
+        elif chunk_id == b"data":
+            data_offset = chunk_start
+            data_size = chunk_size
+            if rf64_data_size is not None and chunk_size == 0xFFFFFFFF:
+                data_size = rf64_data_size
+            # Nagrania przerwane w trakcie zapisu mają często błędny rozmiar
+            data_size = min(data_size, file_size - data_offset)
+            if fmt:
+                break
+
+        # Kawałki są wyrównane do parzystej liczby bajtów
+        f.seek(chunk_start + chunk_size + (chunk_size & 1))
+
+    if not fmt:
+        raise ValueError("Brak kawałka 'fmt ' w pliku WAV")
+    if data_offset is None:
+        raise ValueError("Brak kawałka 'data' w pliku WAV")
+
+    byte_rate = fmt["byte_rate"] or fmt["sample_rate"] * fmt["block_align"]
+    duration = data_size / byte_rate if byte_rate else 0.0
+
+    return {
+        "format": "wav",
+        "duration": round(duration, 3),
+        "sample_rate": fmt["sample_rate"],
+        "channels": fmt["channels"],
+        "bitrate": byte_rate * 8,
+        "bits_per_sample": fmt["bits_per_sample"],
+        "block_align": fmt["block_align"],
+        "audio_format": fmt["audio_format"],
+        "data_offset": data_offset,
+        "data_size": data_size,
+    }
+
+def _parse_mp3_header(header: bytes) -> Optional[Dict]:
+    """Dekoduje 4-bajtowy nagłówek ramki MPEG audio. Zwraca None, jeśli nie jest poprawny."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = (header[2] >> 4) & 0x0F
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    channel_mode = (header[3] >> 6) & 0x03
+
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if (layer == 2 or version == 1) else 576
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": 1 if channel_mode == 3 else 2,
+        "samples_per_frame": samples_per_frame,
+        "frame_length": frame_length,
+    }
+
+def _skip_id3v2(buf) -> int:
+    """Zwraca przesunięcie pierwszego bajtu za tagiem ID3v2 (0 jeśli brak tagu)."""
+    offset = 0
+    # Zdarzają się pliki z kilkoma tagami ID3v2 jeden po drugim
+    while buf[offset:offset + 3] == b"ID3" and len(buf) >= offset + 10:
+        flags = buf[offset + 5]
+        size_bytes = buf[offset + 6:offset + 10]
+        size = (size_bytes[0] << 21) | (size_bytes[1] << 14) | (size_bytes[2] << 7) | size_bytes[3]
+        offset += 10 + size + (10 if flags & 0x10 else 0)
+    return offset
+
+def _find_first_frame(buf, start: int, limit: int) -> Optional[int]:
+    """Szuka pierwszej ramki, której następnik też ma poprawny nagłówek."""
+    position = buf.find(b"\xff", start, limit)
+    while position != -1 and position + 4 <= len(buf):
+        frame = _parse_mp3_header(buf[position:position + 4])
+        if frame:
+            next_position = position + frame["frame_length"]
+            if next_position + 4 > len(buf) or _parse_mp3_header(buf[next_position:next_position + 4]):
+                return position
+        position = buf.find(b"\xff", position + 1, limit)
+    return None
+
+def find_mp3_frame(f, position: int, window: int = 16 * 1024) -> Optional[int]:
+    """Zwraca offset pierwszej pełnej ramki MP3 od podanej pozycji (np. po skoku w czasie)."""
+    f.seek(position)
+    buf = f.read(window)
+    found = _find_first_frame(buf, 0, len(buf))
+    return position + found if found is not None else None
+
+def probe_mp3(f) -> Dict:
+    """Czyta nagłówki ramek MP3 (oraz Xing/Info/VBRI) bez dekodowania dźwięku."""
+    file_size = os.fstat(f.fileno()).st_size
+    if file_size < 4:
+        raise ValueError("Plik MP3 jest pusty")
+
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        audio_start = _skip_id3v2(buf)
+        audio_end = file_size
+        if file_size >= 128 and buf[file_size - 128:file_size - 125] == b"TAG":
+            audio_end -= 128  # tag ID3v1 na końcu pliku
+
+        first = _find_first_frame(buf, audio_start, min(audio_end, audio_start + 256 * 1024))
+        if first is None:
+            raise ValueError("Nie znaleziono ramki MPEG audio")
+
+        frame = _parse_mp3_header(buf[first:first + 4])
+        sample_rate = frame["sample_rate"]
+        samples_per_frame = frame["samples_per_frame"]
+
+        # Nagłówek Xing/Info (LAME) za informacjami pobocznymi pierwszej ramki
+        if frame["version"] == 1:
+            side_info = 17 if frame["channels"] == 1 else 32
+        else:
+            side_info = 9 if frame["channels"] == 1 else 17
+        xing = first + 4 + side_info
+        frame_count = None
+        audio_bytes = None
+
+        if buf[xing:xing + 4] in (b"Xing", b"Info"):
+            flags = struct.unpack(">I", buf[xing + 4:xing + 8])[0]
+            position = xing + 8
+            if flags & 0x01:
+                frame_count = struct.unpack(">I", buf[position:position + 4])[0]
+                position += 4
+            if flags & 0x02:
+                audio_bytes = struct.unpack(">I", buf[position:position + 4])[0]
+        elif buf[first + 36:first + 40] == b"VBRI":
+            audio_bytes, frame_count = struct.unpack(">II", buf[first + 46:first + 54])
+
+        if frame_count:
+            duration = frame_count * samples_per_frame / sample_rate
+            if not audio_bytes:
+                audio_bytes = audio_end - first
+            bitrate = int(audio_bytes * 8 / duration) if duration else frame["bitrate"]
+        else:
+            # Sprawdź kilka kolejnych ramek - stały bitrate oznacza CBR
+            position = first
+            is_cbr = True
+            for _ in range(_MP3_CBR_CHECK_FRAMES):
+                current = _parse_mp3_header(buf[position:position + 4])
+                if not current:
+                    break
+                if current["bitrate"] != frame["bitrate"]:
+                    is_cbr = False
+                    break
+                position += current["frame_length"]
+
+            if is_cbr:
+                bitrate = frame["bitrate"]
+                duration = (audio_end - first) * 8 / bitrate
+            else:
+                # VBR bez nagłówka Xing - przeglądamy nagłówki wszystkich ramek
+                frames = 0
+                position = first
+                while position + 4 <= audio_end:
+                    current = _parse_mp3_header(buf[position:position + 4])
+                    if not current:
+                        break
+                    frames += 1
+                    position += current["frame_length"]
+                duration = frames * samples_per_frame / sample_rate
+                bitrate = int((position - first) * 8 / duration) if duration else frame["bitrate"]
+
+    return {
+        "format": "mp3",
+        "duration": round(duration, 3),
+        "sample_rate": sample_rate,
+        "channels": frame["channels"],
+        "bitrate": bitrate,
+        "data_offset": first,
+    }
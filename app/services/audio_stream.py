@@ -0,0 +1,184 @@
+"""
+Odtwarzanie nagrań z obsługą żądań HTTP Range.
+
+Przeglądarka (element <audio>) pobiera tylko potrzebne fragmenty pliku,
+więc przejście do cytatu w wielogodzinnym nagraniu nie wymaga pobrania
+całości. Wariant z parametrami start/end (sekundy) zwraca samodzielny,
+odtwarzalny fragment: dla WAV nowy nagłówek + dokładnie wycięte próbki,
+dla MP3 ramki od najbliższej granicy ramki (czas wyliczany z bitrate).
+
+Plik lokalny wysyłany jest rozszerzeniem ASGI zero-copy (sendfile), jeśli
+serwer je obsługuje, a w przeciwnym razie blokami przez os.pread.
+"""
+import os
+import re
+import struct
+from email.utils import formatdate
+from typing import List, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+
+from .audio_probe import probe_audio_file, find_mp3_frame
+
+AUDIO_MEDIA_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+}
+
+# Rozmiar bloku przy wysyłaniu bez zero-copy
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    """Żądany zakres leży poza plikiem (HTTP 416)."""
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parsuje nagłówek Range ('bytes=a-b', 'bytes=a-', 'bytes=-n').
+    Przy kilku zakresach używany jest pierwszy. Zwraca (start, end) włącznie
+    albo None, gdy nagłówek jest nieobecny lub niepoprawny (wysyłamy całość).
+    """
+    if not header:
+        return None
+
+    match = _RANGE.match(header.split(",")[0].strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    if not match.group(1):
+        # Ostatnie n bajtów
+        suffix = int(match.group(2))
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+def _wav_header(probe: dict, data_size: int) -> bytes:
+    """Minimalny nagłówek WAV (RIFF + 'fmt ' + 'data') dla wyciętego fragmentu."""
+    audio_format = probe["audio_format"] if probe["audio_format"] in (1, 3) else 1
+    return (
+        struct.pack("<4sI4s", b"RIFF", 36 + data_size, b"WAVE")
+        + struct.pack("<4sIHHIIHH", b"fmt ", 16, audio_format, probe["channels"], probe["sample_rate"],
+                      probe["sample_rate"] * probe["block_align"], probe["block_align"], probe["bits_per_sample"])
+        + struct.pack("<4sI", b"data", data_size)
+    )
+
+def time_slice(file_path: str, file_type: str, start: float, end: Optional[float]) -> Tuple[bytes, int, int]:
+    """
+    Wyznacza fragment pliku odpowiadający przedziałowi czasu.
+
+    Returns:
+        (prefix, offset, length): bajty nagłówka do wysłania przed fragmentem
+        oraz położenie fragmentu w pliku
+    """
+    probe = probe_audio_file(file_path, file_type)
+    if end is not None and end <= start:
+        raise ValueError("Koniec fragmentu musi być późniejszy niż początek")
+
+    if probe["format"] == "wav":
+        block_align = probe["block_align"]
+        data_end = probe["data_offset"] + probe["data_size"]
+
+        offset = probe["data_offset"] + int(start * probe["sample_rate"]) * block_align
+        if offset >= data_end:
+            raise ValueError("Początek fragmentu jest poza nagraniem")
+
+        stop = data_end if end is None else probe["data_offset"] + int(end * probe["sample_rate"]) * block_align
+        stop = min(stop, data_end)
+        length = stop - offset - (stop - offset) % block_align
+        return _wav_header(probe, length), offset, length
+
+    # MP3: pozycja z bitrate, wyrównana do najbliższej ramki
+    file_size = os.path.getsize(file_path)
+    bytes_per_second = probe["bitrate"] / 8
+    with open(file_path, "rb") as f:
+        offset = probe["data_offset"] + int(start * bytes_per_second)
+        if offset >= file_size:
+            raise ValueError("Początek fragmentu jest poza nagraniem")
+        offset = find_mp3_frame(f, offset) or offset
+
+        stop = file_size if end is None else probe["data_offset"] + int(end * bytes_per_second)
+        if stop < file_size:
+            stop = find_mp3_frame(f, stop) or stop
+        stop = min(stop, file_size)
+
+    return b"", offset, max(stop - offset, 0)
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+class FileRangeResponse(Response):
+    """
+    Odpowiedź z fragmentem pliku (opcjonalnie poprzedzonym bajtami nagłówka z pamięci).
+    Zakres Range odnosi się do całości: prefix + fragment pliku.
+    """
+    def __init__(self, file_path: str, offset: int, length: int, prefix: bytes = b"",
+                 byte_range: Optional[Tuple[int, int]] = None, headers: Optional[dict] = None,
+                 media_type: Optional[str] = None):
+        total = len(prefix) + length
+        first, last = byte_range if byte_range else (0, total - 1)
+
+        # Część z nagłówka w pamięci i część z pliku
+        self.prefix = prefix[first:last + 1] if first < len(prefix) else b""
+        self.file_path = file_path
+        self.file_offset = offset + max(first - len(prefix), 0)
+        self.file_length = max(last + 1 - max(first, len(prefix)), 0)
+
+        headers = dict(headers or {})
+        headers["accept-ranges"] = "bytes"
+        headers["content-length"] = str(len(self.prefix) + self.file_length)
+        if byte_range:
+            headers["content-range"] = f"bytes {first}-{last}/{total}"
+
+        super().__init__(status_code=206 if byte_range else 200, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if scope.get("method") == "HEAD" or (not self.prefix and not self.file_length):
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if self.prefix:
+            await send({"type": "http.response.body", "body": self.prefix, "more_body": self.file_length > 0})
+        if not self.file_length:
+            return
+
+        with open(self.file_path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # Serwer wysyła dane z pliku, zanim send zwróci - plik zamykamy dopiero potem
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.file_offset,
+                    "count": self.file_length,
+                    "more_body": False
+                })
+                return
+
+            position = self.file_offset
+            remaining = self.file_length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, f.fileno(), min(STREAM_CHUNK_SIZE, remaining), position)
+                if not chunk:
+                    break
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+            if remaining > 0:
+                # Plik skrócił się w trakcie wysyłania - zakończ odpowiedź
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates: List[str] = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
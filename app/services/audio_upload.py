@@ -0,0 +1,80 @@
+"""
+Wysyłanie nagrań do dostawców ze stałym zużyciem pamięci.
+
+Zamiast wczytywać całe nagranie (audio_file.read()) - a potem często
+kopiować je jeszcze raz w SDK - treść żądania powstaje z bloków
+PROVIDER_UPLOAD_CHUNK_KB czytanych z dysku w trakcie wysyłania. Pamięć
+zajęta przez jedno wywołanie nie zależy więc od długości rozmowy.
+Każda próba (ponowienie przez provider_calls) czyta plik od tej samej
+pozycji. SDK wymagające obiektu bytes dostają plik zmapowany w pamięci
+(map_audio) - strony wczytuje system na żądanie z pamięci podręcznej plików.
+"""
+import io
+import mmap
+import os
+from contextlib import contextmanager
+from typing import AsyncIterator, BinaryIO, Iterator, Optional, Union
+
+import anyio
+
+# Rozmiar bloku wysyłanego do dostawcy (KB)
+PROVIDER_UPLOAD_CHUNK_KB = int(os.getenv("PROVIDER_UPLOAD_CHUNK_KB", "256"))
+
+def _chunk_size() -> int:
+    return max(PROVIDER_UPLOAD_CHUNK_KB, 1) * 1024
+
+def upload_size(audio_file: BinaryIO, position: Optional[int] = None) -> Optional[int]:
+    """Liczba bajtów od pozycji position (domyślnie bieżącej) do końca pliku; None, jeśli nieznana."""
+    try:
+        if position is None:
+            position = audio_file.tell()
+        if isinstance(audio_file, io.BytesIO):
+            return audio_file.getbuffer().nbytes - position
+        return os.fstat(audio_file.fileno()).st_size - position
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+def upload_headers(audio_file: BinaryIO, position: int) -> dict:
+    # Znana długość - żądanie bez kodowania chunked
+    size = upload_size(audio_file, position)
+    return {"Content-Length": str(size)} if size is not None else {}
+
+def upload_chunks(audio_file: BinaryIO, position: int) -> Iterator[bytes]:
+    """Bloki pliku od pozycji position (każde wywołanie zaczyna od początku)."""
+    audio_file.seek(position)
+    chunk_size = _chunk_size()
+    while True:
+        block = audio_file.read(chunk_size)
+        if not block:
+            return
+        yield block
+
+async def upload_chunks_async(audio_file: BinaryIO, position: int) -> AsyncIterator[bytes]:
+    """Wersja async upload_chunks - odczyt z dysku w wątku, bez blokowania pętli."""
+    await anyio.to_thread.run_sync(audio_file.seek, position)
+    chunk_size = _chunk_size()
+    while True:
+        block = await anyio.to_thread.run_sync(audio_file.read, chunk_size)
+        if not block:
+            return
+        yield block
+
+@contextmanager
+def map_audio(audio_file: BinaryIO) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Treść nagrania jako obiekt bytes-like: plik na dysku mapowany w pamięci,
+    inne strumienie (oraz pusty plik lub odczyt od środka pliku) są wczytywane.
+    """
+    try:
+        fileno = audio_file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+
+    if fileno is not None and audio_file.tell() == 0 and upload_size(audio_file):
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+    else:
+        yield audio_file.read()
@@ -0,0 +1,167 @@
+"""
+Diaryzacja po kanałach dla nagrań stereo.
+
+Centrale telefoniczne zapisują zwykle konsultanta i klienta na osobnych
+kanałach. Zamiast statystycznej diaryzacji (i zgadywania ról w map_speakers)
+każdy kanał transkrybujemy osobno - równolegle - a słowa łączymy według
+czasu w segmenty mówców. Role wynikają z numeru kanału (AGENT_CHANNEL).
+Kanały transkrybują dostawcy z rejestru services.speech (słowa ze
+znacznikami czasu, bez diaryzacji), z przełączaniem na kolejnego po błędzie.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import numpy as np
+
+from .audio_normalize import normalize_audio
+from .audio_probe import probe_audio_file
+from .vad import AUDIO_VAD, OffsetMap, trim_silence, restore_timestamps
+from .word_segmenter import DEFAULT_WORD_CONFIDENCE, segment_words, speaker_codes
+
+# auto - stereo dzielimy na kanały, off - zawsze diaryzacja statystyczna
+CHANNEL_DIARIZATION = os.getenv("CHANNEL_DIARIZATION", "auto").lower()
+
+# Kanał konsultanta (0 - lewy, 1 - prawy); drugi kanał to klient
+AGENT_CHANNEL = int(os.getenv("AGENT_CHANNEL", "0"))
+
+# Kanały o korelacji powyżej progu to ten sam miks (mono zapisane jako stereo)
+_DUPLICATE_CORRELATION = 0.98
+
+# Długość fragmentu (sekundy) używanego do porównania kanałów
+_COMPARE_SECONDS = 120
+
+def channel_role(channel: int) -> str:
+    return "KONSULTANT" if channel == AGENT_CHANNEL else "KLIENT"
+
+def _channels_duplicated(tracks: List[str]) -> bool:
+    """Sprawdza, czy kanały zawierają ten sam sygnał (porównanie początku nagrania)."""
+    signals = []
+    for track in tracks[:2]:
+        info = probe_audio_file(track, "wav")
+        frames = min(info["data_size"] // 2, info["sample_rate"] * _COMPARE_SECONDS)
+        signals.append(np.memmap(track, dtype="<i2", mode="r", offset=info["data_offset"], shape=(frames,)))
+
+    length = min(signal.shape[0] for signal in signals)
+    left = signals[0][:length].astype(np.float32)
+    right = signals[1][:length].astype(np.float32)
+    if not length or not left.any() or not right.any():
+        return False
+
+    correlation = np.corrcoef(left, right)[0, 1]
+    return bool(correlation > _DUPLICATE_CORRELATION)
+
+def use_channel_diarization(file_path: str, channels: Optional[int] = None) -> bool:
+    """Czy nagranie nadaje się do diaryzacji po kanałach (stereo, różne kanały)."""
+    if CHANNEL_DIARIZATION != "auto":
+        return False
+
+    if channels is None:
+        try:
+            channels = probe_audio_file(file_path).get("channels")
+        except (ValueError, OSError):
+            return False
+    return channels == 2
+
+def _trim_track(track: str, channel: int) -> Tuple[str, Optional[OffsetMap]]:
+    """Zwraca (ścieżka dla dostawcy, mapa przesunięć VAD lub None)."""
+    if AUDIO_VAD:
+        try:
+            trimmed = trim_silence(track)
+            if trimmed:
+                return trimmed
+        except Exception as e:
+            print(f"Ostrzeżenie: VAD dla kanału {channel} nie powiódł się: {e}")
+    return track, None
+
+def _transcribe_track(track: str, channel: int, language: str) -> Dict:
+    from .speech import transcribe_words
+
+    provider_path, offset_map = _trim_track(track, channel)
+    with open(provider_path, "rb") as audio:
+        result = restore_timestamps(transcribe_words(audio, language=language), offset_map)
+
+    print(f"Kanał {channel} ({channel_role(channel)}): {len(result['words'])} słów ({result['provider']})")
+    return result
+
+async def _transcribe_track_async(track: str, channel: int, language: str) -> Dict:
+    from .speech import transcribe_words_async
+
+    provider_path, offset_map = await anyio.to_thread.run_sync(_trim_track, track, channel)
+    with open(provider_path, "rb") as audio:
+        result = restore_timestamps(await transcribe_words_async(audio, language=language), offset_map)
+
+    print(f"Kanał {channel} ({channel_role(channel)}): {len(result['words'])} słów ({result['provider']})")
+    return result
+
+def merge_channel_words(channel_words: Dict[int, List[Dict]]) -> List[Dict]:
+    """
+    Łączy słowa wszystkich kanałów w jeden strumień według czasu i dzieli go
+    na segmenty mówców (services.word_segmenter) - te same reguły (zmiana
+    mówcy, przerwa SEGMENT_PAUSE_SECONDS) co dla diaryzacji dostawcy.
+    """
+    entries = [(word, channel_role(channel)) for channel, words in channel_words.items() for word in words]
+    entries.sort(key=lambda entry: (entry[0]["start"], entry[0]["end"]))
+
+    speakers, labels = speaker_codes(role for _, role in entries)
+    return segment_words(
+        [word["start"] for word, _ in entries],
+        [word["end"] for word, _ in entries],
+        speakers,
+        [word["word"] for word, _ in entries],
+        [word.get("confidence", DEFAULT_WORD_CONFIDENCE) for word, _ in entries],
+        labels=labels,
+        with_words=True
+    )
+
+def transcribe_by_channel(file_path: str, language: str = "pl") -> Optional[Dict]:
+    """
+    Transkrybuje każdy kanał nagrania stereo osobno (równolegle) i łączy wyniki.
+
+    Returns:
+        Dict: {"text", "language", "duration", "segments"} lub None, jeśli kanały
+        zawierają ten sam sygnał i potrzebna jest zwykła diaryzacja
+    """
+    tracks = _split_channels(file_path)
+    if tracks is None:
+        return None
+
+    with ThreadPoolExecutor(max_workers=len(tracks)) as executor:
+        futures = {
+            channel: executor.submit(_transcribe_track, track, channel, language)
+            for channel, track in enumerate(tracks)
+        }
+        results = {channel: future.result() for channel, future in futures.items()}
+
+    return _merged_result(results, language)
+
+async def transcribe_by_channel_async(file_path: str, language: str = "pl") -> Optional[Dict]:
+    """Wersja async transcribe_by_channel - kanały wysyłane równolegle bez wątków."""
+    tracks = await anyio.to_thread.run_sync(_split_channels, file_path)
+    if tracks is None:
+        return None
+
+    results = await asyncio.gather(*(
+        _transcribe_track_async(track, channel, language) for channel, track in enumerate(tracks)
+    ))
+    return _merged_result(dict(enumerate(results)), language)
+
+def _split_channels(file_path: str) -> Optional[List[str]]:
+    """Ścieżki kanałów nagrania lub None, jeśli kanały zawierają ten sam sygnał."""
+    tracks = normalize_audio(file_path, keep_channels=True)
+    if len(tracks) < 2 or _channels_duplicated(tracks):
+        print(f"Nagranie {file_path} nie ma rozdzielonych kanałów mówców")
+        return None
+    return tracks
+
+def _merged_result(results: Dict[int, Dict], language: str) -> Dict:
+    segments = merge_channel_words({channel: result["words"] for channel, result in results.items()})
+
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "language": language,
+        "duration": max((result.get("duration") or 0.0) for result in results.values()),
+        "segments": segments
+    }
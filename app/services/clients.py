@@ -0,0 +1,162 @@
+"""
+Współdzielone klienty dostawców (OpenAI, Deepgram, ...).
+
+Każdy klient tworzony jest raz na proces i trzyma pulę połączeń HTTP
+z keep-alive, więc kolejne wywołania nie otwierają nowych połączeń TLS.
+Moduły dostawców rejestrują fabryki klientów (register_client), a serwer API
+i worker tworzą je i rozgrzewają przy starcie (init_clients) oraz zamykają
+przy zatrzymaniu (close_clients). Klient, o który poproszono przed
+init_clients (np. w skrypcie), jest tworzony przy pierwszym użyciu.
+
+Warianty async (endpointy API) używają osobnych klientów httpx.AsyncClient
+(register_async_client) związanych z pętlą zdarzeń serwera. Liczbę
+równoczesnych wywołań każdego dostawcy ogranicza semafor (provider_slot),
+więc wolny dostawca nie zajmie wszystkich połączeń ani workerów serwera.
+"""
+import asyncio
+import inspect
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+# Limity puli połączeń do jednego dostawcy
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "20"))
+PROVIDER_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PROVIDER_MAX_KEEPALIVE_CONNECTIONS", "10"))
+
+# Jak długo (sekundy) nieużywane połączenie pozostaje otwarte
+PROVIDER_KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "120"))
+
+# Limity czasu (sekundy); odczyt obejmuje przetwarzanie długich nagrań po stronie dostawcy
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "10"))
+PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "600"))
+PROVIDER_WRITE_TIMEOUT = float(os.getenv("PROVIDER_WRITE_TIMEOUT", "120"))
+
+# Nawiązanie połączeń przy starcie, zanim trafi pierwsze zadanie
+PROVIDER_WARMUP = os.getenv("PROVIDER_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Domyślny limit równoczesnych wywołań jednego dostawcy w wariantach async;
+# osobno: <DOSTAWCA>_CONCURRENCY, np. OPENAI_CONCURRENCY=8, DEEPGRAM_CONCURRENCY=4
+PROVIDER_CONCURRENCY = int(os.getenv("PROVIDER_CONCURRENCY", "4"))
+
+_factories: Dict[str, Tuple[Callable[[], Any], Optional[Callable[[Any], None]]]] = {}
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+_async_factories: Dict[str, Callable[[], Any]] = {}
+_async_clients: Dict[str, Any] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def provider_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=PROVIDER_CONNECT_TIMEOUT,
+        read=PROVIDER_READ_TIMEOUT,
+        write=PROVIDER_WRITE_TIMEOUT,
+        pool=PROVIDER_CONNECT_TIMEOUT
+    )
+
+def provider_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=PROVIDER_MAX_CONNECTIONS,
+        max_keepalive_connections=PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=PROVIDER_KEEPALIVE_EXPIRY
+    )
+
+def http_client(**kwargs) -> httpx.Client:
+    """Klient HTTP z pulą połączeń i limitami czasu dostawców."""
+    kwargs.setdefault("timeout", provider_timeout())
+    kwargs.setdefault("limits", provider_limits())
+    return httpx.Client(**kwargs)
+
+def async_http_client(**kwargs) -> httpx.AsyncClient:
+    """Asynchroniczny klient HTTP z pulą połączeń i limitami czasu dostawców."""
+    kwargs.setdefault("timeout", provider_timeout())
+    kwargs.setdefault("limits", provider_limits())
+    return httpx.AsyncClient(**kwargs)
+
+def register_client(name: str, factory: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None) -> None:
+    """Rejestruje fabrykę klienta; warmup(client) nawiązuje pierwsze połączenie."""
+    _factories[name] = (factory, warmup)
+
+def get_client(name: str) -> Any:
+    """Zwraca współdzielonego klienta (tworzy go przy pierwszym użyciu)."""
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            factory, _ = _factories[name]
+            client = factory()
+            _clients[name] = client
+    return client
+
+def init_clients() -> None:
+    """Tworzy i rozgrzewa wszystkie zarejestrowane klienty (wywoływane przy starcie)."""
+    for name, (_, warmup) in list(_factories.items()):
+        try:
+            client = get_client(name)
+        except Exception as e:
+            # Brak klucza jednego dostawcy nie może blokować startu aplikacji
+            print(f"Ostrzeżenie: Nie można utworzyć klienta {name}: {e}")
+            continue
+
+        if PROVIDER_WARMUP and warmup:
+            try:
+                warmup(client)
+                print(f"Klient {name} gotowy (połączenie nawiązane)")
+            except Exception as e:
+                print(f"Ostrzeżenie: Rozgrzewanie klienta {name} nie powiodło się: {e}")
+
+def close_clients() -> None:
+    """Zamyka pule połączeń wszystkich klientów."""
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+
+    for name, client in clients:
+        close = getattr(client, "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                print(f"Ostrzeżenie: Błąd zamykania klienta {name}: {e}")
+
+def provider_concurrency(name: str) -> int:
+    return max(int(os.getenv(f"{name.upper()}_CONCURRENCY", str(PROVIDER_CONCURRENCY))), 1)
+
+def provider_slot(name: str) -> asyncio.Semaphore:
+    """Semafor ograniczający równoczesne wywołania dostawcy (async with provider_slot(...))."""
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        semaphore = _semaphores[name] = asyncio.Semaphore(provider_concurrency(name))
+    return semaphore
+
+def register_async_client(name: str, factory: Callable[[], Any]) -> None:
+    """Rejestruje fabrykę klienta async (tworzony w pętli zdarzeń przy pierwszym użyciu)."""
+    _async_factories[name] = factory
+
+def get_async_client(name: str) -> Any:
+    """Zwraca współdzielonego klienta async (wywoływane tylko z pętli zdarzeń)."""
+    client = _async_clients.get(name)
+    if client is None:
+        client = _async_clients[name] = _async_factories[name]()
+    return client
+
+async def close_async_clients() -> None:
+    """Zamyka klienty async i zwalnia semafory (przy zatrzymaniu pętli zdarzeń)."""
+    clients = list(_async_clients.items())
+    _async_clients.clear()
+    _semaphores.clear()
+
+    for name, client in clients:
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if close:
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Ostrzeżenie: Błąd zamykania klienta {name}: {e}")
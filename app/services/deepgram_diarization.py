@@ -1,28 +1,127 @@
 import os
-from deepgram import DeepgramClient
-from typing import List, Dict, BinaryIO
+import httpx
+from deepgram import PrerecordedResponse
+from typing import List, Dict, BinaryIO, Optional
 from dotenv import load_dotenv
+from urllib.parse import urlencode
 import io
+import json
 import asyncio
+import anyio
+
+from .clients import (
+    register_client, get_client, http_client,
+    register_async_client, get_async_client, async_http_client
+)
+from .provider_calls import ProviderError, call_provider, call_provider_async
+from .audio_upload import upload_size, upload_headers, upload_chunks, upload_chunks_async
+from .provider_cache import speech_cache_key, get_cached, store_cached, get_cached_async, store_cached_async
+from .word_segmenter import DEFAULT_WORD_CONFIDENCE, segment_words, speaker_codes
 
 try:
     load_dotenv()
 except Exception as e:
     print(f"Ostrzeżenie: Nie można załadować pliku .env: {e}")
 
-def get_deepgram_client():
-    """Tworzy i zwraca klienta Deepgram"""
+DEEPGRAM_API_URL = os.getenv("DEEPGRAM_API_URL", "https://api.deepgram.com")
+
+def _deepgram_headers() -> Dict[str, str]:
     # Z powodu problemów z .env używamy klucza bezpośrednio
     api_key = os.getenv("DEEPGRAM_API_KEY", "74988a83efa96261a8f892c93000cd227622373f")
     if not api_key:
         raise ValueError("Brak klucza API Deepgram. Sprawdź plik .env")
+    return {"Authorization": f"Token {api_key}"}
+
+def _create_deepgram_client() -> httpx.Client:
+    # SDK otwiera nowe połączenie przy każdym żądaniu, dlatego REST API wołamy
+    # przez współdzieloną pulę połączeń, a odpowiedź parsuje model z SDK
+    return http_client(base_url=DEEPGRAM_API_URL, headers=_deepgram_headers())
+
+def _create_async_deepgram_client() -> httpx.AsyncClient:
+    return async_http_client(base_url=DEEPGRAM_API_URL, headers=_deepgram_headers())
+
+register_client("deepgram", _create_deepgram_client, warmup=lambda client: client.head("/"))
+register_async_client("deepgram", _create_async_deepgram_client)
+
+def get_deepgram_client() -> httpx.Client:
+    """Zwraca współdzielonego klienta HTTP Deepgram"""
+    return get_client("deepgram")
+
+def _listen_options(language: str, diarize: bool) -> Dict[str, str]:
+    # Mapowanie języka - Deepgram używa innych kodów
+    language_map = {
+        "pl": "pl",  # Polski
+        "en": "en",  # Angielski
+    }
+    deepgram_language = language_map.get(language, "en")
     
-    # DeepgramClient przyjmuje api_key jako nazwany argument
-    return DeepgramClient(api_key=api_key)
+    # Endpoint prerecorded v1 - te same opcje co w SDK, jako parametry zapytania
+    return {
+        "model": "nova-2",
+        "language": deepgram_language,
+        "punctuate": "true",
+        "smart_format": "true",
+        "diarize": "true" if diarize else "false",
+    }
 
-def transcribe_with_speaker_diarization_async(audio_file: BinaryIO, language: str = "pl") -> Dict:
+def _transcribe_file(deepgram: httpx.Client, audio_file: BinaryIO, language: str, diarize: bool) -> PrerecordedResponse:
     """
-    Transkrybuje plik audio używając Deepgram API z diaryzacją mówców (wersja async).
+    Wysyła nagranie do endpointu prerecorded Deepgram i zwraca sparsowaną odpowiedź.
+    Plik wysyłany jest blokami prosto z dysku (services.audio_upload).
+    Surowa odpowiedź trafia do pamięci podręcznej (klucz: treść nagrania i opcje).
+    """
+    options = _listen_options(language, diarize)
+    position = audio_file.tell()
+    cache_key = speech_cache_key("deepgram", options["model"], audio_file, options)
+    cached = get_cached(cache_key, "speech")
+    if cached is not None:
+        return PrerecordedResponse.from_dict(cached)
+    
+    def request() -> httpx.Response:
+        print("Wysyłanie żądania do Deepgram...")
+        response = deepgram.post(
+            "/v1/listen", params=options, headers=upload_headers(audio_file, position),
+            content=upload_chunks(audio_file, position)
+        )
+        response.raise_for_status()
+        return response
+    
+    response = call_provider("deepgram", request)
+    print("Otrzymano odpowiedź z Deepgram")
+    payload = response.json()
+    store_cached(cache_key, "speech", "deepgram", options["model"], payload)
+    return PrerecordedResponse.from_dict(payload)
+
+async def _transcribe_file_async(audio_file: BinaryIO, language: str, diarize: bool) -> PrerecordedResponse:
+    """Jak _transcribe_file, ale przez klienta async; limit: DEEPGRAM_CONCURRENCY."""
+    deepgram = get_async_client("deepgram")
+    options = _listen_options(language, diarize)
+    position = audio_file.tell()
+    cache_key = await anyio.to_thread.run_sync(
+        lambda: speech_cache_key("deepgram", options["model"], audio_file, options)
+    )
+    cached = await get_cached_async(cache_key, "speech")
+    if cached is not None:
+        return PrerecordedResponse.from_dict(cached)
+    
+    async def request() -> httpx.Response:
+        print("Wysyłanie żądania do Deepgram...")
+        response = await deepgram.post(
+            "/v1/listen", params=options, headers=upload_headers(audio_file, position),
+            content=upload_chunks_async(audio_file, position)
+        )
+        response.raise_for_status()
+        return response
+    
+    response = await call_provider_async("deepgram", request)
+    print("Otrzymano odpowiedź z Deepgram")
+    payload = response.json()
+    await store_cached_async(cache_key, "speech", "deepgram", options["model"], payload)
+    return PrerecordedResponse.from_dict(payload)
+
+def transcribe_with_speaker_diarization(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """
+    Transkrybuje plik audio używając Deepgram API z diaryzacją mówców.
     
     Args:
         audio_file: Plik audio do transkrypcji
@@ -36,168 +135,228 @@ def transcribe_with_speaker_diarization_async(audio_file: BinaryIO, language: st
         
         print("Wykonywanie transkrypcji z diaryzacją mówców przez Deepgram...")
         
-        # Wczytaj cały plik audio
-        audio_data = audio_file.read()
-        print(f"Rozmiar pliku audio: {len(audio_data)} bajtów")
-        
-        # Mapowanie języka - Deepgram używa innych kodów
-        language_map = {
-            "pl": "pl",  # Polski
-            "en": "en",  # Angielski
-        }
-        deepgram_language = language_map.get(language, "en")
-        
-        print("Wysyłanie żądania do Deepgram...")
-        # Deepgram SDK v3 – używamy endpointu prerecorded v("1")
-        file_source = {"buffer": audio_data}
-        options = {
-            "model": "nova-2",
-            "language": deepgram_language,
-            "punctuate": True,
-            "smart_format": True,
-            "diarize": True,
-        }
-        response = deepgram.listen.prerecorded.v("1").transcribe_file(
-            file_source,
-            options,
-        )
-        
-        print("Otrzymano odpowiedź z Deepgram")
-        
-        # Debug: Sprawdź strukturę odpowiedzi
-        print(f"Typ odpowiedzi: {type(response)}")
-        print(f"Ma results: {hasattr(response, 'results')}")
+        print(f"Rozmiar pliku audio: {upload_size(audio_file)} bajtów")
         
-        if not hasattr(response, 'results') or not response.results:
-            print("Ostrzeżenie: Brak wyników w odpowiedzi Deepgram")
-            return {
-                "text": "",
-                "language": language,
-                "duration": 0.0,
-                "segments": []
-            }
-        
-        if not response.results.channels or len(response.results.channels) == 0:
-            print("Ostrzeżenie: Brak kanałów w odpowiedzi Deepgram")
-            print(f"Liczba kanałów: {len(response.results.channels) if response.results.channels else 0}")
-            print(f"Struktura response.results: {dir(response.results)}")
-            return {
-                "text": "",
-                "language": language,
-                "duration": 0.0,
-                "segments": []
-            }
-        
-        # Przetwarzanie wyników
-        transcript = response.results.channels[0].alternatives[0].transcript
-        print(f"Transkrypcja: {transcript[:100]}...")
-        
-        # Pobierz segmenty z diaryzacją
-        diarization_results = response.results.channels[0].alternatives[0].words
-        print(f"Liczba słów z diaryzacją: {len(diarization_results) if diarization_results else 0}")
-        
-        # Grupuj słowa w segmenty dla każdego mówcy
-        speaker_segments = group_words_into_sentences(diarization_results)
-        
-        # Mapuj SPEAKER_0, SPEAKER_1 na KONSULTANT, KLIENT
-        mapped_segments = map_speakers(speaker_segments)
-        
-        return {
-            "text": transcript,
-            "language": language,
-            "duration": response.metadata.duration if hasattr(response, 'metadata') else 0.0,
-            "segments": mapped_segments
-        }
+        response = _transcribe_file(deepgram, audio_file, language, diarize=True)
+        return _diarization_result(response, language)
         
+    except ProviderError:
+        raise
     except Exception as e:
         print(f"Szczegóły błędu Deepgram: {str(e)}")
         import traceback
         traceback.print_exc()
         raise Exception(f"Błąd podczas transkrypcji z diaryzacją przez Deepgram: {str(e)}")
 
-def transcribe_with_speaker_diarization(audio_file: BinaryIO, language: str = "pl") -> Dict:
+async def transcribe_with_speaker_diarization_async(audio_file: BinaryIO, language: str = "pl") -> Dict:
     """
-    Transkrypcja z diaryzacją mówców - synchroniczna funkcja.
+    Transkrybuje plik audio używając Deepgram API z diaryzacją mówców (wersja async).
+    Bloki pliku czytane są w wątku, a żądanie nie blokuje wątku serwera.
     """
-    return transcribe_with_speaker_diarization_async(audio_file, language)
+    try:
+        print("Wykonywanie transkrypcji z diaryzacją mówców przez Deepgram...")
+        print(f"Rozmiar pliku audio: {upload_size(audio_file)} bajtów")
+        
+        response = await _transcribe_file_async(audio_file, language, diarize=True)
+        return _diarization_result(response, language)
+        
+    except ProviderError:
+        raise
+    except Exception as e:
+        print(f"Szczegóły błędu Deepgram: {str(e)}")
+        raise Exception(f"Błąd podczas transkrypcji z diaryzacją przez Deepgram: {str(e)}")
 
-def group_words_into_sentences(words: List) -> List[Dict]:
-    """
-    Grupuje słowa w zdania dla każdego mówcy.
+def _diarization_result(response: PrerecordedResponse, language: str) -> Dict:
+    # Debug: Sprawdź strukturę odpowiedzi
+    print(f"Typ odpowiedzi: {type(response)}")
+    print(f"Ma results: {hasattr(response, 'results')}")
     
-    Args:
-        words: Lista słów z informacją o mówcy (format Deepgram)
+    if not hasattr(response, 'results') or not response.results:
+        print("Ostrzeżenie: Brak wyników w odpowiedzi Deepgram")
+        return {
+            "text": "",
+            "language": language,
+            "duration": 0.0,
+            "segments": []
+        }
+    
+    if not response.results.channels or len(response.results.channels) == 0:
+        print("Ostrzeżenie: Brak kanałów w odpowiedzi Deepgram")
+        print(f"Liczba kanałów: {len(response.results.channels) if response.results.channels else 0}")
+        print(f"Struktura response.results: {dir(response.results)}")
+        return {
+            "text": "",
+            "language": language,
+            "duration": 0.0,
+            "segments": []
+        }
+    
+    # Przetwarzanie wyników
+    transcript = response.results.channels[0].alternatives[0].transcript
+    print(f"Transkrypcja: {transcript[:100]}...")
+    
+    # Pobierz segmenty z diaryzacją
+    diarization_results = response.results.channels[0].alternatives[0].words
+    print(f"Liczba słów z diaryzacją: {len(diarization_results) if diarization_results else 0}")
+    
+    # Grupuj słowa w segmenty dla każdego mówcy
+    speaker_segments = _segment_words(diarization_results)
+    
+    # Mapuj SPEAKER_0, SPEAKER_1 na KONSULTANT, KLIENT
+    mapped_segments = map_speakers(speaker_segments)
+    
+    return {
+        "text": transcript,
+        "language": language,
+        "duration": response.metadata.duration if hasattr(response, 'metadata') else 0.0,
+        "segments": mapped_segments
+    }
+
+def transcribe_words(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """
+    Transkrybuje nagranie jednego mówcy (bez diaryzacji) i zwraca słowa ze znacznikami czasu.
     
     Returns:
-        List[Dict]: Lista segmentów zdań z informacją o mówcy
+        Dict: {"text", "language", "duration", "words": [{"word", "start", "end", "confidence"}]}
     """
-    if not words:
-        return []
-    
-    # Debug: Sprawdź typ pierwszego słowa
-    if len(words) > 0:
-        print(f"Typ pierwszego słowa: {type(words[0])}")
-        print(f"Czy jest dict: {isinstance(words[0], dict)}")
-        print(f"Ma atrybut speaker: {hasattr(words[0], 'speaker')}")
-        if hasattr(words[0], 'speaker'):
-            print(f"Speaker: {words[0].speaker}")
-        if hasattr(words[0], 'word'):
-            print(f"Word: {words[0].word}")
-    
-    sentence_segments = []
-    current_speaker = None
-    current_text = ""
-    start_time = 0.0
-    
-    for word in words:
-        # Deepgram v5 zwraca słowa jako obiekty z atrybutami
-        if hasattr(word, 'speaker'):
-            speaker = word.speaker
-            text = word.word if hasattr(word, 'word') else ''
-            start = word.start if hasattr(word, 'start') else 0.0
-            end = word.end if hasattr(word, 'end') else 0.0
-        elif isinstance(word, dict):
-            speaker = word.get('speaker', None)
-            text = word.get('word', '')
-            start = word.get('start', 0.0)
-            end = word.get('end', 0.0)
-        else:
-            # Pomiń jeśli nie ma informacji o mówcy
-            continue
-        
-        # Jeśli zmienił się mówca lub to pierwsze słowo
-        if current_speaker != speaker:
-            # Zapisz poprzednie zdanie jeśli istnieje
-            if current_text.strip():
-                sentence_segments.append({
-                    "start_time": start_time,
-                    "end_time": sentence_segments[-1]["end_time"] if sentence_segments else end,
-                    "speaker_label": f"SPEAKER_{current_speaker}",
-                    "text": current_text.strip(),
-                    "confidence": 0.8
-                })
-            
-            # Rozpocznij nowe zdanie
-            current_speaker = speaker
-            current_text = text
-            start_time = start
-        else:
-            # Dodaj słowo do bieżącego zdania
-            current_text += " " + text
-    
-    # Zapisz ostatnie zdanie
-    if current_text.strip():
-        last_word = words[-1]
-        last_end = last_word.get('end', 0.0) if isinstance(last_word, dict) else 0.0
-        sentence_segments.append({
-            "start_time": start_time,
-            "end_time": last_end,
-            "speaker_label": f"SPEAKER_{current_speaker}",
-            "text": current_text.strip(),
-            "confidence": 0.8
-        })
-    
-    return sentence_segments
+    try:
+        deepgram = get_deepgram_client()
+        response = _transcribe_file(deepgram, audio_file, language, diarize=False)
+        return _words_result(response, language)
+    
+    except ProviderError:
+        raise
+    except Exception as e:
+        print(f"Szczegóły błędu Deepgram: {str(e)}")
+        raise Exception(f"Błąd podczas transkrypcji przez Deepgram: {str(e)}")
+
+async def transcribe_words_async(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """Wersja async transcribe_words."""
+    try:
+        response = await _transcribe_file_async(audio_file, language, diarize=False)
+        return _words_result(response, language)
+    
+    except ProviderError:
+        raise
+    except Exception as e:
+        print(f"Szczegóły błędu Deepgram: {str(e)}")
+        raise Exception(f"Błąd podczas transkrypcji przez Deepgram: {str(e)}")
+
+def _words_result(response: PrerecordedResponse, language: str) -> Dict:
+    words = []
+    text = ""
+    results = getattr(response, "results", None)
+    if results and results.channels:
+        alternative = results.channels[0].alternatives[0]
+        text = alternative.transcript or ""
+        words = [_word_entry(word) for word in alternative.words or []]
+    
+    return {
+        "text": text,
+        "language": language,
+        "duration": response.metadata.duration if hasattr(response, 'metadata') else 0.0,
+        "words": words
+    }
+
+# Jak długo (sekundy) po wysłaniu całego nagrania czekamy na ostatnie wyniki strumienia
+DEEPGRAM_LIVE_FINISH_TIMEOUT = float(os.getenv("DEEPGRAM_LIVE_FINISH_TIMEOUT", "60"))
+
+def _websocket_connect(url: str, headers: Dict[str, str]):
+    # websockets jest zależnością deepgram-sdk; API połączenia zmieniło się w wersji 13
+    try:
+        from websockets.asyncio.client import connect
+        return connect(url, additional_headers=headers, max_size=None)
+    except ImportError:
+        from websockets import connect
+        return connect(url, extra_headers=headers, max_size=None)
+
+class DeepgramLiveSession:
+    """
+    Transkrypcja strumieniowa Deepgram (WebSocket /v1/listen) z diaryzacją.
+    Bloki nagrania (w kontenerze MP3/WAV) wysyłane są w miarę napływania,
+    a słowa z wyników końcowych zbierane w tle.
+    """
+    def __init__(self, language: str = "pl"):
+        self.language = language
+        self.words: List[Dict] = []
+        self.duration = 0.0
+        self._socket = None
+        self._receiver: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        query = urlencode(_listen_options(self.language, diarize=True))
+        url = f"{DEEPGRAM_API_URL.replace('http', 'ws', 1)}/v1/listen?{query}"
+        self._socket = await _websocket_connect(url, _deepgram_headers())
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def _receive(self) -> None:
+        async for message in self._socket:
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            if data.get("type") != "Results" or not data.get("is_final"):
+                continue
+            alternatives = (data.get("channel") or {}).get("alternatives") or [{}]
+            self.words.extend(alternatives[0].get("words") or [])
+            self.duration = max(self.duration, float(data.get("start", 0.0)) + float(data.get("duration", 0.0)))
+
+    async def send(self, chunk: bytes) -> None:
+        if self._receiver.done():
+            # Deepgram zamknął połączenie - zgłoś przyczynę zamiast wysyłać dalej
+            self._receiver.result()
+            raise ConnectionError("Deepgram zakończył strumień przed końcem nagrania")
+        await self._socket.send(chunk)
+
+    async def finish(self, file_path: str) -> Dict:
+        """Kończy strumień i zwraca wynik jak transcribe_with_speaker_diarization."""
+        await self._socket.send(json.dumps({"type": "CloseStream"}))
+        await asyncio.wait_for(self._receiver, DEEPGRAM_LIVE_FINISH_TIMEOUT)
+        await self._socket.close()
+
+        print(f"Deepgram (strumień): {len(self.words)} słów")
+        segments = map_speakers(_segment_words(self.words))
+        return {
+            "text": " ".join(_word_entry(word)["word"] for word in self.words),
+            "language": self.language,
+            "duration": self.duration,
+            "segments": segments,
+            "provider": "deepgram"
+        }
+
+    async def abort(self) -> None:
+        if self._receiver:
+            self._receiver.cancel()
+        if self._socket:
+            await self._socket.close()
+
+def _word_entry(word) -> Dict:
+    """Słowo Deepgram (obiekt SDK lub dict) jako {"word", "start", "end", "confidence"}."""
+    get = word.get if isinstance(word, dict) else lambda name, default=None: getattr(word, name, default)
+    # Pewność 0.0 to poprawna wartość - domyślna tylko, gdy dostawca jej nie podał
+    confidence = get("confidence")
+    return {
+        "word": get("punctuated_word") or get("word", ""),
+        "start": float(get("start", 0.0) or 0.0),
+        "end": float(get("end", 0.0) or 0.0),
+        "confidence": DEFAULT_WORD_CONFIDENCE if confidence is None else float(confidence)
+    }
+
+def _segment_words(words: List) -> List[Dict]:
+    """Grupuje słowa Deepgram (obiekty SDK lub dict) w segmenty mówców (services.word_segmenter)."""
+    words = words or []
+    entries = [_word_entry(word) for word in words]
+    speakers, labels = speaker_codes(
+        word.get("speaker") if isinstance(word, dict) else getattr(word, "speaker", None) for word in words
+    )
+    return segment_words(
+        [entry["start"] for entry in entries],
+        [entry["end"] for entry in entries],
+        speakers,
+        [entry["word"] for entry in entries],
+        [entry["confidence"] for entry in entries],
+        labels=labels,
+        with_words=True
+    )
 
 def map_speakers(segments: List[Dict]) -> List[Dict]:
     """
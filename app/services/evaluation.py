@@ -1,24 +1,20 @@
 import os
 import json
-from openai import OpenAI
 from typing import Dict, List
 from datetime import timedelta
 from dotenv import load_dotenv
 
+from .provider_calls import ProviderError, call_provider, call_provider_async
+from .transcription import get_openai_client, get_async_openai_client
+from .provider_cache import llm_cache_key, get_cached, store_cached, get_cached_async, store_cached_async
+
 try:
     load_dotenv()
 except Exception as e:
     print(f"Ostrzeżenie: Nie można załadować pliku .env: {e}")
 
-def get_openai_client():
-    """Tworzy i zwraca klienta OpenAI"""
-    # TODO: Usunąć hardkod po naprawie pliku .env
-    api_key = os.getenv("OPENAI_API_KEY") or "sk-proj-..."
-    
-    if not api_key or api_key == "sk-proj-...":
-        raise ValueError("Brak klucza API OpenAI. Sprawdź plik .env lub dodaj klucz bezpośrednio w kodzie")
-    
-    return OpenAI(api_key=api_key)
+# Szacowana długość odpowiedzi GPT-4 (tokeny) przy rezerwacji limitu TPM
+EXPECTED_COMPLETION_TOKENS = 1500
 
 # Globalny System Prompt zgodnie ze specyfikacją
 GLOBAL_SYSTEM_PROMPT = """Analizuj rozmowy konsultant–klient pod kątem jakości komunikacji: jasność przekazu, empatia, logika diagnozy i skuteczność pomocy. Nie oceniaj zgodności z procedurami. Każdą kategorię oceń w skali 1–5, gdzie 1 = bardzo słabo, 3 = poprawnie, 5 = wzorowo. Dla każdej kategorii podaj krótki komentarz i 1–2 cytaty (z czasem). Na końcu opisz emocje klienta i konsultanta: nastroje na początku/końcu oraz krótki opis trendu."""
@@ -114,8 +110,85 @@ def evaluate_conversation_gpt4(transcription_text: str, speaker_segments: List[D
     Returns:
         Dict: Wynik oceny z kategoriami, sentymentem i komentarzem
     """
+    messages = _evaluation_messages(speaker_segments)
+    
+    # Ten sam prompt (transkrypcja + karta oceny) daje zapisaną wcześniej odpowiedź
+    cache_key = llm_cache_key("openai", "gpt-4", messages=messages, temperature=0.3)
+    cached = get_cached(cache_key, "llm")
+    if cached is not None:
+        return _parse_evaluation_response(cached["content"])
+    
     client = get_openai_client()
     
+    print("Wysyłanie żądania do GPT-4...")
+    
+    try:
+        response = call_provider(
+            "gpt-4",
+            lambda: client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                temperature=0.3
+            ),
+            tokens=_estimate_tokens(messages)
+        )
+        
+        content = response.choices[0].message.content
+        result = _parse_evaluation_response(content)
+        store_cached(cache_key, "llm", "openai", "gpt-4", {"content": content})
+        return result
+        
+    except ProviderError:
+        raise
+    except Exception as e:
+        print(f"Błąd GPT-4: {str(e)}")
+        raise Exception(f"Błąd podczas oceny przez GPT-4: {str(e)}")
+
+async def evaluate_conversation_gpt4_async(transcription_text: str, speaker_segments: List[Dict]) -> Dict:
+    """
+    Ocenia rozmowę używając GPT-4 bez blokowania wątku serwera.
+    Liczbę równoczesnych wywołań ogranicza OPENAI_CONCURRENCY.
+    """
+    messages = _evaluation_messages(speaker_segments)
+    
+    cache_key = llm_cache_key("openai", "gpt-4", messages=messages, temperature=0.3)
+    cached = await get_cached_async(cache_key, "llm")
+    if cached is not None:
+        return _parse_evaluation_response(cached["content"])
+    
+    client = get_async_openai_client()
+    
+    print("Wysyłanie żądania do GPT-4...")
+    
+    try:
+        response = await call_provider_async(
+            "gpt-4",
+            lambda: client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                temperature=0.3
+            ),
+            tokens=_estimate_tokens(messages),
+            slot="openai"
+        )
+        
+        content = response.choices[0].message.content
+        result = _parse_evaluation_response(content)
+        await store_cached_async(cache_key, "llm", "openai", "gpt-4", {"content": content})
+        return result
+        
+    except ProviderError:
+        raise
+    except Exception as e:
+        print(f"Błąd GPT-4: {str(e)}")
+        raise Exception(f"Błąd podczas oceny przez GPT-4: {str(e)}")
+
+def _estimate_tokens(messages: List[Dict]) -> int:
+    """Przybliżona liczba tokenów wywołania (limit TPM): ~3 znaki na token polskiego tekstu + odpowiedź."""
+    return sum(len(message["content"]) for message in messages) // 3 + EXPECTED_COMPLETION_TOKENS
+
+def _evaluation_messages(speaker_segments: List[Dict]) -> List[Dict]:
+    """Buduje wiadomości (system + user) dla GPT-4."""
     # Przygotuj transkrypcję w formacie z timestampami
     formatted_transcription = prepare_transcription_for_evaluation(speaker_segments)
     
@@ -153,38 +226,26 @@ Zwróć odpowiedź w formacie JSON:
   "final_comment": "komentarz końcowy"
 }"""
     
-    print("Wysyłanie żądania do GPT-4...")
+    return [
+        {"role": "system", "content": GLOBAL_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _parse_evaluation_response(content: str) -> Dict:
+    # Wyciągnij JSON z odpowiedzi (może zawierać markdown)
+    if "```json" in content:
+        json_start = content.find("```json") + 7
+        json_end = content.find("```", json_start)
+        content = content[json_start:json_end].strip()
+    elif "```" in content:
+        json_start = content.find("```") + 3
+        json_end = content.find("```", json_start)
+        content = content[json_start:json_end].strip()
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": GLOBAL_SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3
-        )
-        
-        content = response.choices[0].message.content
-        
-        # Wyciągnij JSON z odpowiedzi (może zawierać markdown)
-        if "```json" in content:
-            json_start = content.find("```json") + 7
-            json_end = content.find("```", json_start)
-            content = content[json_start:json_end].strip()
-        elif "```" in content:
-            json_start = content.find("```") + 3
-            json_end = content.find("```", json_start)
-            content = content[json_start:json_end].strip()
-        
-        result = json.loads(content)
-        print("GPT-4 odpowiedział pomyślnie")
-        
-        return result
-        
-    except Exception as e:
-        print(f"Błąd GPT-4: {str(e)}")
-        raise Exception(f"Błąd podczas oceny przez GPT-4: {str(e)}")
+    result = json.loads(content)
+    print("GPT-4 odpowiedział pomyślnie")
+    
+    return result
 
 def calculate_overall_score(category_results: List[Dict]) -> float:
     """
@@ -240,7 +301,14 @@ def evaluate_conversation(transcription_text: str, speaker_segments: List[Dict])
     """
     # Wywołaj GPT-4
     gpt_result = evaluate_conversation_gpt4(transcription_text, speaker_segments)
-    
+    return _evaluation_result(gpt_result)
+
+async def evaluate_conversation_async(transcription_text: str, speaker_segments: List[Dict]) -> Dict:
+    """Wersja async evaluate_conversation (dla endpointów API)."""
+    gpt_result = await evaluate_conversation_gpt4_async(transcription_text, speaker_segments)
+    return _evaluation_result(gpt_result)
+
+def _evaluation_result(gpt_result: Dict) -> Dict:
     # Połącz wyniki GPT z wagami kategorii
     category_results = []
     for i, cat_result in enumerate(gpt_result.get("categories", [])):
@@ -262,4 +330,3 @@ def evaluate_conversation(transcription_text: str, speaker_segments: List[Dict])
         "overall_score": overall_score,
         "grade": grade
     }
-
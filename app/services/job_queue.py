@@ -0,0 +1,189 @@
+"""
+Trwała kolejka etapów pipeline oparta o tabelę pipeline_stages.
+
+Na PostgreSQL etapy pobierane są przez SELECT ... FOR UPDATE SKIP LOCKED,
+dzięki czemu wiele procesów workerów (także na różnych maszynach) może
+równolegle pobierać pracę bez blokowania się nawzajem. Na SQLite (lokalnie)
+używamy warunkowego UPDATE ... WHERE status = 'pending', który w pojedynczym
+pliku bazy daje ten sam efekt.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session
+
+from ..models.pipeline import PipelineJob, PipelineStage
+
+# Po tylu sekundach bez heartbeatu etap uznajemy za porzucony (np. restart workera)
+STAGE_LEASE_SECONDS = int(os.getenv("PIPELINE_STAGE_LEASE_SECONDS", "300"))
+
+# Maksymalna liczba prób wykonania etapu
+MAX_STAGE_ATTEMPTS = int(os.getenv("PIPELINE_MAX_ATTEMPTS", "3"))
+
+# Opóźnienie (sekundy) ponowienia etapu po przeciążeniu dostawcy, podwajane z każdą próbą
+PIPELINE_RETRY_DELAY = float(os.getenv("PIPELINE_RETRY_DELAY", "30"))
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _mark_claimed(stage: PipelineStage, worker_id: str) -> None:
+    stage.status = "running"
+    stage.locked_by = worker_id
+    stage.locked_at = _now()
+    stage.started_at = stage.locked_at
+    stage.attempts = (stage.attempts or 0) + 1
+
+    job = stage.job
+    if job.status == "queued":
+        job.status = "running"
+        job.started_at = stage.started_at
+
+def claim_next_stage(db: Session, worker_id: str) -> Optional[PipelineStage]:
+    """
+    Pobiera najstarszy oczekujący etap i oznacza go jako wykonywany przez workera.
+    Zwraca None, jeśli kolejka jest pusta.
+    """
+    query = db.query(PipelineStage).filter(
+        PipelineStage.status == "pending",
+        or_(PipelineStage.available_at.is_(None), PipelineStage.available_at <= _now())
+    ).order_by(PipelineStage.id)
+
+    if db.bind.dialect.name == "postgresql":
+        stage = query.with_for_update(skip_locked=True).first()
+        if not stage:
+            db.rollback()
+            return None
+
+        _mark_claimed(stage, worker_id)
+        db.commit()
+        return stage
+
+    # SQLite - próbujemy przejąć kolejnych kandydatów warunkowym UPDATE
+    for candidate_id, in query.with_entities(PipelineStage.id).limit(10).all():
+        result = db.execute(
+            update(PipelineStage)
+            .where(PipelineStage.id == candidate_id, PipelineStage.status == "pending")
+            .values(status="running", locked_by=worker_id, locked_at=_now())
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            continue
+
+        stage = db.query(PipelineStage).filter(PipelineStage.id == candidate_id).first()
+        _mark_claimed(stage, worker_id)
+        db.commit()
+        return stage
+
+    db.rollback()
+    return None
+
+def heartbeat_stage(db: Session, stage_id: int, worker_id: str) -> None:
+    """Przedłuża dzierżawę etapu wykonywanego przez workera."""
+    db.execute(
+        update(PipelineStage)
+        .where(PipelineStage.id == stage_id, PipelineStage.locked_by == worker_id)
+        .values(locked_at=_now())
+    )
+    db.commit()
+
+def complete_stage(db: Session, stage: PipelineStage, executed: bool, duration: float) -> None:
+    """
+    Oznacza etap jako zakończony i udostępnia kolejny etap zadania.
+    """
+    stage.status = "completed" if executed else "skipped"
+    stage.finished_at = _now()
+    stage.duration_seconds = round(duration, 3)
+    stage.error = None
+    stage.locked_by = None
+
+    job = stage.job
+    next_stage = next((s for s in job.stages if s.position == stage.position + 1), None)
+
+    if next_stage:
+        next_stage.status = "pending"
+    else:
+        job.status = "completed"
+        job.finished_at = stage.finished_at
+
+    db.commit()
+
+def fail_stage(db: Session, stage: PipelineStage, error: str, duration: float,
+               retry_after: Optional[float] = None) -> None:
+    """
+    Zapisuje błąd etapu. Jeśli limit prób nie został wyczerpany, etap wraca do kolejki.
+    retry_after (przeciążony dostawca) odkłada ponowienie co najmniej o tyle sekund.
+    """
+    stage.error = error
+    stage.finished_at = _now()
+    stage.duration_seconds = round(duration, 3)
+    stage.locked_by = None
+
+    if (stage.attempts or 0) < MAX_STAGE_ATTEMPTS:
+        stage.status = "pending"
+        if retry_after is not None:
+            delay = max(retry_after, PIPELINE_RETRY_DELAY * 2 ** ((stage.attempts or 1) - 1))
+            stage.available_at = stage.finished_at + timedelta(seconds=delay)
+            print(f"Dostawca przeciążony - ponowienie etapu '{stage.name}' za {delay:.0f} s")
+        print(f"Etap '{stage.name}' zadania {stage.job_id} wraca do kolejki (próba {stage.attempts}/{MAX_STAGE_ATTEMPTS})")
+    else:
+        stage.status = "failed"
+        job = stage.job
+        job.status = "failed"
+        job.error = f"Błąd w etapie '{stage.name}': {error}"
+        job.finished_at = stage.finished_at
+
+    db.commit()
+
+def requeue_stale_stages(db: Session) -> int:
+    """
+    Zwraca do kolejki etapy, których worker przestał wysyłać heartbeat
+    (np. proces został zrestartowany w trakcie pracy). Zwraca liczbę etapów.
+
+    Porzucona próba jest już policzona w attempts (przy pobraniu etapu).
+    Etap, który wyczerpał limit prób (np. za każdym razem zabija workera),
+    jest oznaczany jako nieudany wraz z zadaniem - tak jak w fail_stage.
+    """
+    now = _now()
+    deadline = now - timedelta(seconds=STAGE_LEASE_SECONDS)
+    stale = (PipelineStage.status == "running", PipelineStage.locked_at < deadline)
+    # Etapy sprzed dodania kolumny attempts (ensure_schema_columns) mają w niej NULL
+    attempts = func.coalesce(PipelineStage.attempts, 0)
+
+    result = db.execute(
+        update(PipelineStage)
+        .where(*stale, attempts < MAX_STAGE_ATTEMPTS)
+        .values(status="pending", locked_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    requeued = result.rowcount
+
+    exhausted = db.query(PipelineStage).filter(*stale, attempts >= MAX_STAGE_ATTEMPTS).all()
+    for stage in exhausted:
+        error = f"Worker przestał odpowiadać podczas etapu (próba {stage.attempts}/{MAX_STAGE_ATTEMPTS})"
+        # Warunkowy UPDATE - inny worker mógł w międzyczasie obsłużyć ten etap
+        result = db.execute(
+            update(PipelineStage)
+            .where(PipelineStage.id == stage.id, *stale)
+            .values(status="failed", locked_by=None, finished_at=now, error=error)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            continue
+
+        db.execute(
+            update(PipelineJob)
+            .where(PipelineJob.id == stage.job_id)
+            .values(status="failed", error=f"Błąd w etapie '{stage.name}': {error}", finished_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        print(f"Etap '{stage.name}' zadania {stage.job_id} porzucony {stage.attempts} razy - oznaczony jako nieudany")
+
+    # synchronize_session=False: obiekty w sesji odświeżą się po commit (expire_on_commit)
+    db.commit()
+
+    if requeued:
+        print(f"Przywrócono do kolejki {requeued} porzuconych etapów")
+
+    return requeued
@@ -0,0 +1,199 @@
+"""
+Transkrypcja w trakcie uploadu (tryb opt-in: POST /api/audio/ingest/).
+
+Zwykły upload jest sekwencyjny: cały plik trafia na dysk, a transkrypcja
+czyta go potem ponownie i wysyła dostawcy. Tu strumień żądania jest
+rozdzielany: każdy blok trafia jednocześnie do pliku tymczasowego (skrót
+SHA-256 liczony w trakcie, jak w store_stream) i do sesji strumieniowej
+dostawcy, więc transkrypcja jest gotowa niemal w chwili końca uploadu.
+
+Dostawcy strumieniowi (LIVE_INGEST_PROVIDER):
+- deepgram - WebSocket /v1/listen z diaryzacją,
+- local - zastępnik bez strumieniowania do pracy lokalnej i testów: po
+  zakończeniu uploadu wykonuje zwykłą transkrypcję (services.long_audio).
+
+Błąd sesji dostawcy nie przerywa uploadu - plik zostaje zapisany,
+a transkrypcję wykona zwykły pipeline.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Dict, Optional
+
+import anyio
+from sqlalchemy.orm import Session
+
+from ..models.transcription import Transcription
+from ..models.speaker_segment import SpeakerSegment
+from .audio_ingest import allowed_file, audio_record, create_audio_file
+from .long_audio import transcribe_and_diarize_file_async
+from .pipeline import create_pipeline_jobs, save_speech_result
+from .storage import AUDIO_STORAGE_DIR, local_audio_path, store_file
+
+# deepgram (WebSocket) lub local (zastępnik: transkrypcja po zakończeniu uploadu)
+LIVE_INGEST_PROVIDER = os.getenv("LIVE_INGEST_PROVIDER", "deepgram").lower()
+
+# Tyle bloków może czekać na wysłanie do dostawcy; potem upload zwalnia do tempa dostawcy
+LIVE_INGEST_QUEUE_CHUNKS = int(os.getenv("LIVE_INGEST_QUEUE_CHUNKS", "64"))
+
+# Maksymalny rozmiar jednej ramki wysyłanej do dostawcy (bloki żądania bywają większe)
+_LIVE_FRAME_BYTES = 64 * 1024
+
+# Bloki żądania zbierane są w bufory tej wielkości i zapisywane w wątku (bez blokowania pętli zdarzeń)
+_WRITE_BLOCK_BYTES = 1024 * 1024
+
+class LocalLiveSession:
+    """Zastępnik sesji strumieniowej: ignoruje bloki i transkrybuje zapisany plik."""
+    def __init__(self, language: str = "pl"):
+        self.language = language
+
+    async def start(self) -> None:
+        pass
+
+    async def send(self, chunk: bytes) -> None:
+        pass
+
+    async def finish(self, file_path: str) -> Dict:
+        return await transcribe_and_diarize_file_async(file_path, language=self.language)
+
+    async def abort(self) -> None:
+        pass
+
+def _deepgram_session(language: str):
+    from .deepgram_diarization import DeepgramLiveSession
+    return DeepgramLiveSession(language)
+
+LIVE_SESSIONS = {
+    "deepgram": _deepgram_session,
+    "local": LocalLiveSession,
+}
+
+def create_live_session(provider: Optional[str] = None, language: str = "pl"):
+    name = (provider or LIVE_INGEST_PROVIDER).lower()
+    factory = LIVE_SESSIONS.get(name)
+    if not factory:
+        raise ValueError(f"Nieznany dostawca strumieniowy: {name}. Dostępni: {', '.join(LIVE_SESSIONS)}")
+    return factory(language)
+
+async def _feed(session, queue: asyncio.Queue) -> Optional[Exception]:
+    """Wysyła bloki z kolejki do sesji; po błędzie dalej opróżnia kolejkę, by nie blokować uploadu."""
+    error = None
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            return error
+        if error is None:
+            try:
+                await session.send(chunk)
+            except Exception as e:
+                error = e
+
+async def ingest_stream(body: AsyncIterator[bytes], filename: str, provider: Optional[str] = None,
+                        language: str = "pl") -> Dict:
+    """
+    Zapisuje strumień nagrania i równolegle przesyła go do sesji strumieniowej.
+
+    Returns:
+        Dict: {"record": pola AudioFile, "result": wynik transkrypcji z diaryzacją
+        lub None, "error": opis błędu sesji lub None}
+    """
+    if not allowed_file(filename):
+        raise ValueError("Dozwolone tylko pliki MP3 i WAV")
+
+    session = create_live_session(provider, language)
+    error: Optional[Exception] = None
+    try:
+        await session.start()
+    except Exception as e:
+        print(f"Ostrzeżenie: Nie można rozpocząć transkrypcji strumieniowej: {e}")
+        session, error = None, e
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(LIVE_INGEST_QUEUE_CHUNKS, 1))
+    feeder = asyncio.create_task(_feed(session, queue)) if session else None
+
+    extension = filename.split(".")[-1].lower()
+    tmp_dir = os.path.join(AUDIO_STORAGE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=f".{extension}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pending = bytearray()
+            async for chunk in body:
+                if not chunk:
+                    continue
+                digest.update(chunk)
+                pending += chunk
+                size += len(chunk)
+                if len(pending) >= _WRITE_BLOCK_BYTES:
+                    await anyio.to_thread.run_sync(f.write, bytes(pending))
+                    pending.clear()
+                if feeder:
+                    for offset in range(0, len(chunk), _LIVE_FRAME_BYTES):
+                        await queue.put(chunk[offset:offset + _LIVE_FRAME_BYTES])
+            if pending:
+                await anyio.to_thread.run_sync(f.write, bytes(pending))
+        if not size:
+            raise ValueError("Pusta treść żądania")
+        stored = await anyio.to_thread.run_sync(store_file, tmp_path, extension, digest.hexdigest())
+    except BaseException:
+        if feeder:
+            feeder.cancel()
+        if session:
+            await session.abort()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    record = await anyio.to_thread.run_sync(audio_record, stored, filename)
+
+    result = None
+    if feeder:
+        await queue.put(None)
+        error = await feeder
+        try:
+            if error is None:
+                path = await anyio.to_thread.run_sync(local_audio_path, stored["file_path"])
+                result = await session.finish(path)
+        except Exception as e:
+            error = e
+        if error is not None:
+            await session.abort()
+            print(f"Ostrzeżenie: Transkrypcja strumieniowa nie powiodła się, plik zapisany bez niej: {error}")
+
+    return {"record": record, "result": result, "error": str(error) if error else None}
+
+def save_ingest(db: Session, ingested: Dict, enqueue: bool = False, scorecard_type: str = "SERVICE") -> Dict:
+    """
+    Tworzy rekord AudioFile (lub zwraca duplikat), zapisuje transkrypcję ze strumienia
+    - chyba że nagranie ma już transkrypcję z segmentami - i opcjonalnie kolejkuje
+    pipeline (etap speech zostanie pominięty, jeśli transkrypcja już jest).
+    """
+    audio_file = create_audio_file(db, ingested["record"])
+    result = ingested["result"]
+
+    transcription = db.query(Transcription).filter(Transcription.audio_file_id == audio_file.id).first()
+    has_segments = transcription is not None and db.query(SpeakerSegment.id).filter(
+        SpeakerSegment.transcription_id == transcription.id
+    ).first() is not None
+
+    if result is not None and not has_segments:
+        transcription = save_speech_result(db, audio_file, result)
+
+    segments = 0
+    if transcription is not None:
+        segments = db.query(SpeakerSegment).filter(SpeakerSegment.transcription_id == transcription.id).count()
+
+    job_ids = create_pipeline_jobs(db, [audio_file], scorecard_type) if enqueue else []
+
+    return {
+        "audio_file": audio_file,
+        "transcription_id": transcription.id if transcription else None,
+        "segments": segments,
+        "provider": result.get("provider") if result else None,
+        "live_error": ingested["error"],
+        "job_id": job_ids[0] if job_ids else None
+    }
@@ -0,0 +1,439 @@
+"""
+Tryb długich nagrań: podział na fragmenty w miejscach ciszy i równoległa transkrypcja.
+
+Whisper przyjmuje pliki do 25 MB, a czas odpowiedzi Deepgram rośnie z długością
+nagrania. Nagrania dłuższe niż LONG_AUDIO_MIN_SECONDS (albo większe niż limit
+dostawcy) dzielimy na fragmenty nie dłuższe niż LONG_AUDIO_CHUNK_SECONDS, tnąc
+w najcichszym miejscu przed planowaną granicą. Fragmenty wysyłane są równolegle
+(LONG_AUDIO_CONCURRENCY), więc czas przetwarzania godzinnej rozmowy zależy od
+liczby równoległych wywołań, a nie od jej długości.
+
+Sąsiednie fragmenty zachodzą na siebie o LONG_AUDIO_OVERLAP_SECONDS. Słowo
+należy do fragmentu, w którego części właściwej (między cięciami) leży jego
+środek, więc zakładka nie dubluje tekstu. Na zakładce oba fragmenty słyszą
+tych samych mówców - na tej podstawie etykiety mówców kolejnego fragmentu
+łączone są z etykietami poprzednich.
+"""
+import asyncio
+import difflib
+import os
+import string
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import numpy as np
+
+from .audio_normalize import normalize_audio
+from .audio_probe import probe_audio_file
+from .speech import transcribe_and_diarize, transcribe_and_diarize_async
+from .transcription import transcribe_audio, transcribe_audio_async
+from .vad import VAD_FRAME_MS, _frame_features
+from .word_segmenter import segment_words, speaker_codes
+
+# auto - dzielimy długie nagrania, off - zawsze jedno wywołanie dostawcy
+LONG_AUDIO_CHUNKING = os.getenv("LONG_AUDIO_CHUNKING", "auto").lower()
+
+# Nagrania dłuższe niż ta wartość (sekundy) są dzielone na fragmenty
+LONG_AUDIO_MIN_SECONDS = float(os.getenv("LONG_AUDIO_MIN_SECONDS", "1200"))
+
+# Maksymalna długość części właściwej fragmentu (sekundy); 16 kHz mono to ok. 1,9 MB na minutę.
+# Dla Whisper skracana tak, by fragment z zakładkami zmieścił się w WHISPER_MAX_UPLOAD_BYTES
+LONG_AUDIO_CHUNK_SECONDS = float(os.getenv("LONG_AUDIO_CHUNK_SECONDS", "600"))
+
+# Zakładka dodawana po obu stronach cięcia (sekundy)
+LONG_AUDIO_OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", "8"))
+
+# Jak daleko przed planowaną granicą szukamy ciszy (sekundy)
+LONG_AUDIO_SEARCH_SECONDS = float(os.getenv("LONG_AUDIO_SEARCH_SECONDS", "60"))
+
+# Liczba fragmentów jednego nagrania przetwarzanych równolegle
+LONG_AUDIO_CONCURRENCY = int(os.getenv("LONG_AUDIO_CONCURRENCY", "4"))
+
+# Limit rozmiaru pliku w Whisper API
+WHISPER_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Fragment zapisywany jest blokami po tyle próbek
+_WRITE_BLOCK_FRAMES = 16000 * 30
+
+# Rozmiar nagłówka WAV zapisywanego przez moduł wave (PCM)
+_WAV_HEADER_BYTES = 44
+
+# Okno wygładzania energii przy wyborze miejsca cięcia (ms)
+_QUIET_WINDOW_MS = 500
+
+# Tyle słów z końca poprzedniego i początku kolejnego tekstu porównujemy przy łączeniu
+_TEXT_OVERLAP_WORDS = 80
+
+# Minimalna liczba wspólnych słów, aby uznać je za powtórzoną zakładkę
+_TEXT_MIN_MATCH = 3
+
+class AudioChunk:
+    """
+    Fragment nagrania (czasy w sekundach oryginału).
+    start/end - wysyłany zakres (z zakładką), core_start/core_end - część właściwa.
+    """
+    def __init__(self, index: int, start: float, end: float, core_start: float, core_end: float):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.core_start = core_start
+        self.core_end = core_end
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def owns(self, start: float, end: float) -> bool:
+        middle = (start + end) / 2
+        return self.core_start <= middle < self.core_end
+
+def _quietest_point(samples: np.ndarray, sample_rate: int, start: float, end: float) -> float:
+    """Środek najcichszego okna _QUIET_WINDOW_MS w przedziale [start, end)."""
+    lo, hi = int(start * sample_rate), int(end * sample_rate)
+    frame_length = int(sample_rate * VAD_FRAME_MS / 1000)
+    energy_db, _ = _frame_features(samples[lo:hi], frame_length)
+    if energy_db.size == 0:
+        return end
+
+    width = min(max(int(_QUIET_WINDOW_MS / VAD_FRAME_MS), 1), energy_db.size)
+    smoothed = np.convolve(energy_db, np.ones(width) / width, mode="valid")
+    frame = int(np.argmin(smoothed)) + width // 2
+    return round((lo + frame * frame_length + frame_length / 2) / sample_rate, 3)
+
+def plan_chunks(samples: np.ndarray, sample_rate: int, chunk_seconds: Optional[float] = None) -> List[AudioChunk]:
+    """
+    Wyznacza fragmenty sygnału mono PCM 16-bit: równe części nie dłuższe niż
+    chunk_seconds (domyślnie LONG_AUDIO_CHUNK_SECONDS), cięte w najcichszym
+    miejscu przed granicą.
+    """
+    chunk_seconds = chunk_seconds or LONG_AUDIO_CHUNK_SECONDS
+    total = samples.shape[0] / sample_rate
+    cuts = []
+    position = 0.0
+    while True:
+        # Cięcie przed granicą skraca fragment, więc liczbę pozostałych liczymy za każdym razem
+        remaining = int(np.ceil((total - position) / chunk_seconds))
+        if remaining <= 1:
+            break
+        target = position + (total - position) / remaining
+        search_start = max(target - LONG_AUDIO_SEARCH_SECONDS, position + (target - position) / 2)
+        position = _quietest_point(samples, sample_rate, search_start, target)
+        cuts.append(position)
+
+    bounds = [0.0] + cuts + [total]
+    chunks = []
+    for index, (core_start, core_end) in enumerate(zip(bounds, bounds[1:])):
+        chunks.append(AudioChunk(
+            index,
+            max(core_start - LONG_AUDIO_OVERLAP_SECONDS, 0.0),
+            min(core_end + LONG_AUDIO_OVERLAP_SECONDS, total),
+            core_start if index else float("-inf"),
+            core_end if index < len(bounds) - 2 else float("inf")
+        ))
+    return chunks
+
+def _load_samples(source: str) -> Tuple[np.ndarray, int]:
+    info = probe_audio_file(source, "wav")
+    samples = np.memmap(source, dtype="<i2", mode="r", offset=info["data_offset"],
+                        shape=(info["data_size"] // 2,))
+    return samples, info["sample_rate"]
+
+def _max_chunk_seconds(max_bytes: int, sample_rate: int) -> float:
+    """
+    Najdłuższa część właściwa fragmentu, którego plik WAV (16-bit mono, razem
+    z zakładkami po obu stronach) mieści się w max_bytes.
+    """
+    seconds = (max_bytes - _WAV_HEADER_BYTES) / (sample_rate * 2)
+    # Sekunda zapasu na zaokrąglenie miejsc cięcia
+    limit = np.floor(seconds) - 2 * LONG_AUDIO_OVERLAP_SECONDS - 1
+    if limit <= 0:
+        raise ValueError(f"Limit {max_bytes} bajtów nie mieści fragmentu z zakładką {LONG_AUDIO_OVERLAP_SECONDS} s")
+    return float(limit)
+
+def _plan(file_path: str, max_bytes: Optional[int] = None) -> Optional[Tuple[str, List[AudioChunk]]]:
+    """
+    Zwraca (znormalizowane nagranie 16 kHz mono, fragmenty) albo None, jeśli
+    nagranie należy wysłać w całości.
+    """
+    if LONG_AUDIO_CHUNKING == "off":
+        return None
+
+    try:
+        info = probe_audio_file(file_path)
+    except (ValueError, OSError):
+        return None
+
+    too_long = (info.get("duration") or 0.0) > LONG_AUDIO_MIN_SECONDS
+    too_large = max_bytes is not None and os.path.getsize(file_path) > max_bytes
+    if not (too_long or too_large):
+        return None
+
+    try:
+        source = normalize_audio(file_path)[0]
+        samples, sample_rate = _load_samples(source)
+        chunk_seconds = LONG_AUDIO_CHUNK_SECONDS
+        if max_bytes is not None:
+            chunk_seconds = min(chunk_seconds, _max_chunk_seconds(max_bytes, sample_rate))
+        chunks = plan_chunks(samples, sample_rate, chunk_seconds)
+        del samples
+    except Exception as e:
+        print(f"Ostrzeżenie: Nie można podzielić {file_path} na fragmenty, wysyłam całe nagranie: {e}")
+        return None
+
+    # Jeden fragment ma sens tylko wtedy, gdy znormalizowany plik mieści się w limicie, a oryginał nie
+    if len(chunks) < 2 and not too_large:
+        return None
+
+    print(f"Długie nagranie {file_path}: {len(chunks)} fragmentów (do {chunk_seconds:.0f} s)")
+    return source, chunks
+
+def _write_chunk(source: str, chunk: AudioChunk) -> str:
+    """
+    Zapisuje zakres fragmentu do tymczasowego pliku WAV obok źródła (blokami),
+    aby dostawca wysłał go z dysku jak każde inne nagranie.
+    """
+    samples, sample_rate = _load_samples(source)
+    lo, hi = int(chunk.start * sample_rate), int(chunk.end * sample_rate)
+    # Nazwa z rozszerzeniem pozwala dostawcy rozpoznać format (Whisper)
+    fd, path = tempfile.mkstemp(suffix=f".chunk{chunk.index}.wav", dir=os.path.dirname(source) or None)
+    try:
+        with os.fdopen(fd, "wb") as f, wave.open(f, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(sample_rate)
+            for offset in range(lo, hi, _WRITE_BLOCK_FRAMES):
+                writer.writeframes(samples[offset:min(offset + _WRITE_BLOCK_FRAMES, hi)].tobytes())
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        del samples
+    return path
+
+# ========== ŁĄCZENIE WYNIKÓW ==========
+
+def _chunk_items(result: Dict, chunk: AudioChunk) -> List[Dict]:
+    """
+    Słowa fragmentu z etykietą mówcy i czasem w oryginale. Segmenty bez listy
+    słów (Whisper, Soniox) traktowane są jako jedna całość.
+    """
+    items = []
+    for segment in result.get("segments", []):
+        words = segment.get("words") or [{
+            "word": segment["text"],
+            "start": segment["start_time"],
+            "end": segment["end_time"],
+            "confidence": segment.get("confidence", 0.8)
+        }]
+        for word in words:
+            items.append({
+                "text": word["word"],
+                "start": round(chunk.start + word["start"], 3),
+                "end": round(chunk.start + word["end"], 3),
+                "confidence": word.get("confidence", 0.8),
+                "speaker": segment["speaker_label"]
+            })
+    return items
+
+def _link_speakers(previous: List[Dict], current: List[Dict], start: float, end: float,
+                   known: List[str]) -> Dict[str, str]:
+    """
+    Mapuje etykiety mówców fragmentu na etykiety globalne według tego, kto
+    mówił w tym samym czasie na zakładce [start, end) w poprzednim fragmencie.
+    """
+    previous = [item for item in previous if item["end"] > start and item["start"] < end]
+    shared: Dict[Tuple[str, str], float] = {}
+    for item in current:
+        if item["end"] <= start or item["start"] >= end:
+            continue
+        for other in previous:
+            overlap = min(item["end"], other["end"], end) - max(item["start"], other["start"], start)
+            if overlap > 0:
+                pair = (item["speaker"], other["speaker"])
+                shared[pair] = shared.get(pair, 0.0) + overlap
+
+    mapping: Dict[str, str] = {}
+    for (local, global_label), _ in sorted(shared.items(), key=lambda entry: -entry[1]):
+        if local not in mapping and global_label not in mapping.values():
+            mapping[local] = global_label
+
+    # Mówcy bez śladu na zakładce: ta sama etykieta, jeśli wolna, potem pozostali znani mówcy
+    local_labels = list(dict.fromkeys(item["speaker"] for item in current))
+    for label in local_labels:
+        if label not in mapping and label in known and label not in mapping.values():
+            mapping[label] = label
+    for label in local_labels:
+        if label not in mapping:
+            free = [candidate for candidate in known if candidate not in mapping.values()]
+            if free:
+                mapping[label] = free[0]
+            elif label not in mapping.values():
+                mapping[label] = label
+            else:
+                mapping[label] = f"SPEAKER_{len(known) + len(mapping)}"
+    return mapping
+
+def _items_to_segments(items: List[Dict]) -> List[Dict]:
+    """Łączy kolejne słowa tego samego mówcy w segmenty (services.word_segmenter)."""
+    speakers, labels = speaker_codes(item["speaker"] for item in items)
+    return segment_words(
+        [item["start"] for item in items],
+        [item["end"] for item in items],
+        speakers,
+        [item["text"] for item in items],
+        [item["confidence"] for item in items],
+        labels=labels,
+        with_words=True
+    )
+
+def stitch_diarized(chunks: List[AudioChunk], results: List[Dict], language: str) -> Dict:
+    """Łączy wyniki fragmentów w jeden wynik {"text", "language", "duration", "segments", "provider", "diarized"}."""
+    owned: List[Dict] = []
+    known: List[str] = []
+    previous: List[Dict] = []
+
+    for chunk, result in zip(chunks, results):
+        items = _chunk_items(result, chunk)
+        if chunk.index:
+            mapping = _link_speakers(previous, items, chunk.start, chunks[chunk.index - 1].end, known)
+            for item in items:
+                item["speaker"] = mapping[item["speaker"]]
+
+        for item in items:
+            if item["speaker"] not in known:
+                known.append(item["speaker"])
+        owned.extend(item for item in items if chunk.owns(item["start"], item["end"]))
+        previous = items
+
+    owned.sort(key=lambda item: item["start"])
+    segments = _items_to_segments(owned)
+    providers = list(dict.fromkeys(result.get("provider") for result in results if result.get("provider")))
+
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "language": language,
+        "duration": chunks[-1].end,
+        "segments": segments,
+        "provider": ",".join(providers) or None,
+        "diarized": all(result.get("diarized", True) for result in results)
+    }
+
+def _normalized_word(word: str) -> str:
+    return word.strip(string.punctuation + "„”«»…").lower()
+
+def merge_texts(texts: List[str]) -> str:
+    """
+    Łączy teksty kolejnych fragmentów, usuwając zakładkę: najdłuższy wspólny
+    ciąg słów końca poprzedniego i początku kolejnego tekstu występuje raz.
+    """
+    merged: List[str] = []
+    for text in texts:
+        words = text.split()
+        if merged and words:
+            tail = [_normalized_word(word) for word in merged[-_TEXT_OVERLAP_WORDS:]]
+            head = [_normalized_word(word) for word in words[:_TEXT_OVERLAP_WORDS]]
+            match = difflib.SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(
+                0, len(tail), 0, len(head)
+            )
+            if match.size >= _TEXT_MIN_MATCH:
+                cut = len(merged) - len(tail) + match.a + match.size
+                merged = merged[:cut]
+                words = words[match.b + match.size:]
+        merged.extend(words)
+    return " ".join(merged)
+
+def _text_result(chunks: List[AudioChunk], results: List[Dict], language: str) -> Dict:
+    return {
+        "text": merge_texts([result["text"] for result in results]),
+        "language": language,
+        "duration": chunks[-1].end
+    }
+
+# ========== WYWOŁANIA ==========
+
+def _run_chunks(source: str, chunks: List[AudioChunk], transcribe) -> List[Dict]:
+    def run(chunk: AudioChunk) -> Dict:
+        # Plik fragmentu istnieje tylko na czas wywołania dostawcy
+        path = _write_chunk(source, chunk)
+        try:
+            with open(path, "rb") as audio:
+                return transcribe(audio, chunk)
+        finally:
+            os.remove(path)
+
+    with ThreadPoolExecutor(max_workers=max(min(LONG_AUDIO_CONCURRENCY, len(chunks)), 1)) as executor:
+        return list(executor.map(run, chunks))
+
+async def _run_chunks_async(source: str, chunks: List[AudioChunk], transcribe) -> List[Dict]:
+    semaphore = asyncio.Semaphore(max(LONG_AUDIO_CONCURRENCY, 1))
+
+    async def run(chunk: AudioChunk) -> Dict:
+        async with semaphore:
+            path = await anyio.to_thread.run_sync(_write_chunk, source, chunk)
+            try:
+                with open(path, "rb") as audio:
+                    return await transcribe(audio, chunk)
+            finally:
+                os.remove(path)
+
+    return list(await asyncio.gather(*(run(chunk) for chunk in chunks)))
+
+def transcribe_and_diarize_file(file_path: str, language: str = "pl", duration: Optional[float] = None) -> Dict:
+    """
+    Transkrypcja z diaryzacją pliku (services.speech); długie nagrania dzielone
+    są na fragmenty przetwarzane równolegle.
+    """
+    plan = _plan(file_path)
+    if plan is None:
+        with open(file_path, "rb") as audio:
+            return transcribe_and_diarize(audio, language=language, duration=duration)
+
+    source, chunks = plan
+    results = _run_chunks(source, chunks, lambda audio, chunk: transcribe_and_diarize(
+        audio, language=language, duration=chunk.duration
+    ))
+    return stitch_diarized(chunks, results, language)
+
+async def transcribe_and_diarize_file_async(file_path: str, language: str = "pl",
+                                            duration: Optional[float] = None) -> Dict:
+    """Wersja async transcribe_and_diarize_file."""
+    plan = await anyio.to_thread.run_sync(_plan, file_path)
+    if plan is None:
+        with open(file_path, "rb") as audio:
+            return await transcribe_and_diarize_async(audio, language=language, duration=duration)
+
+    source, chunks = plan
+    results = await _run_chunks_async(source, chunks, lambda audio, chunk: transcribe_and_diarize_async(
+        audio, language=language, duration=chunk.duration
+    ))
+    return stitch_diarized(chunks, results, language)
+
+def transcribe_file(file_path: str, language: str = "pl") -> Dict:
+    """
+    Transkrypcja pliku przez Whisper; nagrania długie lub większe niż limit
+    API dzielone są na fragmenty, a teksty łączone bez powtórzonej zakładki.
+    """
+    plan = _plan(file_path, WHISPER_MAX_UPLOAD_BYTES)
+    if plan is None:
+        with open(file_path, "rb") as audio:
+            return transcribe_audio(audio, language=language)
+
+    source, chunks = plan
+    results = _run_chunks(source, chunks, lambda audio, chunk: transcribe_audio(audio, language=language))
+    return _text_result(chunks, results, language)
+
+async def transcribe_file_async(file_path: str, language: str = "pl") -> Dict:
+    """Wersja async transcribe_file."""
+    plan = await anyio.to_thread.run_sync(_plan, file_path, WHISPER_MAX_UPLOAD_BYTES)
+    if plan is None:
+        with open(file_path, "rb") as audio:
+            return await transcribe_audio_async(audio, language=language)
+
+    source, chunks = plan
+    results = await _run_chunks_async(source, chunks, lambda audio, chunk: transcribe_audio_async(
+        audio, language=language
+    ))
+    return _text_result(chunks, results, language)
@@ -0,0 +1,102 @@
+"""
+Zapis wyników diaryzacji i oceny zbiorczymi instrukcjami INSERT.
+
+Zamiast db.add + flush/refresh dla każdego segmentu, kategorii i cytatu
+wiersze jednej tabeli trafiają do bazy jedną instrukcją INSERT (executemany,
+a gdy potrzebne są ID - INSERT ... RETURNING, który SQLAlchemy wysyła
+stronami po 1000 wierszy). Liczba zapytań nie rośnie więc z liczbą
+segmentów, kategorii ani cytatów.
+
+RETURNING nie gwarantuje kolejności wierszy (sort_by_parameter_order
+wymusiłby na SQLite osobne zapytanie dla każdego wiersza), dlatego zwrócone
+ID są przypisywane po kluczu (np. nazwie kategorii), a nie po pozycji.
+"""
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+
+from ..models.evaluation import CategoryScore, Evaluation, Quote
+from ..models.scorecard import PhraseMatch, RuleApplied
+from ..models.speaker_segment import SpeakerSegment
+from .text_normalize import normalized_text
+
+def _insert(model):
+    # render_nulls: wartości None nie dzielą wierszy na osobne instrukcje (domyślnie ORM grupuje je
+    # według kolumn bez None)
+    return insert(model).execution_options(render_nulls=True)
+
+def bulk_insert(db: Session, model, rows: List[Dict]) -> None:
+    """Wstawia wiersze jedną instrukcją INSERT (executemany)."""
+    if rows:
+        db.execute(_insert(model), rows)
+
+def bulk_insert_returning(db: Session, model, rows: List[Dict], key: str) -> Dict:
+    """Wstawia wiersze (INSERT ... RETURNING) i zwraca słownik {wartość kolumny key: id}."""
+    if not rows:
+        return {}
+    column = getattr(model, key)
+    return {row[1]: row[0] for row in db.execute(_insert(model).returning(model.id, column), rows)}
+
+def replace_speaker_segments(db: Session, transcription_id: int, speaker_segments: List[Dict]) -> List[SpeakerSegment]:
+    """Zastępuje segmenty mówców transkrypcji nowymi i zatwierdza zmiany."""
+    db.query(SpeakerSegment).filter(
+        SpeakerSegment.transcription_id == transcription_id
+    ).delete(synchronize_session=False)
+
+    bulk_insert(db, SpeakerSegment, [
+        {
+            "transcription_id": transcription_id,
+            "start_time": segment["start_time"],
+            "end_time": segment["end_time"],
+            "speaker_label": segment["speaker_label"],
+            "text": segment["text"],
+            "confidence": segment.get("confidence", 0.8),
+            "normalized_text": normalized_text(segment["text"])
+        }
+        for segment in speaker_segments
+    ])
+    db.commit()
+
+    # Po commit obiekty są nieaktualne - jedno zapytanie odświeża wszystkie naraz
+    return db.query(SpeakerSegment).filter(
+        SpeakerSegment.transcription_id == transcription_id
+    ).order_by(SpeakerSegment.id).all()
+
+def save_evaluation_result(db: Session, evaluation: Evaluation, phrase_matches: List[Dict],
+                           rules_applied: List[Dict], categories: List[Dict]) -> Evaluation:
+    """
+    Zapisuje ocenę wraz z dopasowaniami fraz, regułami, kategoriami i cytatami.
+
+    Args:
+        evaluation: Nowy obiekt Evaluation (jeszcze niezapisany)
+        phrase_matches: Pola PhraseMatch (bez evaluation_id)
+        rules_applied: Pola RuleApplied (bez evaluation_id)
+        categories: Pola CategoryScore (bez evaluation_id, unikalne category_name) z listą "quotes" pól Quote
+
+    Returns:
+        Evaluation: Zapisana ocena z załadowanymi kategoriami i cytatami
+    """
+    db.add(evaluation)
+    db.flush()  # Otrzymaj ID
+
+    bulk_insert(db, PhraseMatch, [{**match, "evaluation_id": evaluation.id} for match in phrase_matches])
+    bulk_insert(db, RuleApplied, [{**rule, "evaluation_id": evaluation.id} for rule in rules_applied])
+
+    # Nazwy kategorii są unikalne w ocenie - po nich cytaty dostają category_score_id
+    category_ids = bulk_insert_returning(db, CategoryScore, [
+        {**{key: value for key, value in category.items() if key != "quotes"}, "evaluation_id": evaluation.id}
+        for category in categories
+    ], key="category_name")
+    bulk_insert(db, Quote, [
+        {**quote, "category_score_id": category_ids[category["category_name"]]}
+        for category in categories
+        for quote in category.get("quotes", [])
+    ])
+
+    db.commit()
+
+    # Załaduj pełną ocenę z kategoriami i cytatami
+    return db.query(Evaluation).options(
+        joinedload(Evaluation.category_scores).joinedload(CategoryScore.quotes)
+    ).filter(Evaluation.id == evaluation.id).first()
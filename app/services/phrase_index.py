@@ -0,0 +1,148 @@
+"""
+Przybliżone wyszukiwanie fraz karty oceny (services.text_normalize + indeks n-gramów).
+
+Frazy karty są normalizowane (bez diakrytyków, po stemmingu) i kompilowane
+raz do indeksu:
+- słownik wariantów słów: każde słowo fraz i jego warianty z usuniętymi
+  do PHRASE_FUZZY_MAX_EDITS znakami (metoda "symmetric delete") - słowo
+  transkrypcji o odległości edycyjnej <= PHRASE_FUZZY_MAX_EDITS znajduje
+  się kilkoma odczytami słownika, bez porównywania ze wszystkimi słowami,
+- indeks n-gramów: pierwsze dwa słowa frazy (lub jedno dla fraz
+  jednowyrazowych) -> frazy zaczynające się od nich.
+
+Dla każdej pozycji w segmencie sprawdzane są tylko frazy, których
+początkowy bigram pasuje - koszt rośnie z długością rozmowy, a nie
+z liczbą fraz karty.
+"""
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .text_normalize import normalize_tokens, segment_tokens
+
+# Wyszukiwanie przybliżone po wyszukiwaniu dokładnym: PHRASE_FUZZY_MATCHING=false wyłącza
+PHRASE_FUZZY_MATCHING = os.getenv("PHRASE_FUZZY_MATCHING", "true").lower() in ("1", "true", "yes")
+
+# Maksymalna odległość edycyjna (Levenshtein) słowa po normalizacji
+PHRASE_FUZZY_MAX_EDITS = int(os.getenv("PHRASE_FUZZY_MAX_EDITS", "1"))
+
+# Krótsze słowa muszą zgadzać się dokładnie (po normalizacji) - "nie"/"nic" to różne słowa
+PHRASE_FUZZY_MIN_TOKEN_LENGTH = int(os.getenv("PHRASE_FUZZY_MIN_TOKEN_LENGTH", "5"))
+
+_INDEX_CACHE_SIZE = 64
+
+def _deletes(token: str, max_edits: int) -> Set[str]:
+    """Warianty słowa z usuniętymi do max_edits znakami (wraz z samym słowem)."""
+    variants = {token}
+    frontier = {token}
+    for _ in range(max_edits):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+def _within_edits(a: str, b: str, max_edits: int) -> bool:
+    """Czy odległość Levenshteina a i b wynosi co najwyżej max_edits."""
+    if abs(len(a) - len(b)) > max_edits:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_edits:
+            return False
+        previous = current
+    return previous[-1] <= max_edits
+
+class FuzzyPhraseIndex:
+    """Indeks n-gramów znormalizowanych fraz z tolerancją błędów w słowach."""
+    def __init__(self, phrases: Iterable[str], max_edits: Optional[int] = None,
+                 min_token_length: Optional[int] = None):
+        self.phrases = list(phrases)
+        self.max_edits = PHRASE_FUZZY_MAX_EDITS if max_edits is None else max_edits
+        self.min_token_length = PHRASE_FUZZY_MIN_TOKEN_LENGTH if min_token_length is None else min_token_length
+
+        self._vocabulary: Dict[str, int] = {}
+        self._phrase_tokens: List[Tuple[int, ...]] = []
+        self._ngrams: Dict[Tuple[int, ...], List[int]] = {}
+        for index, phrase in enumerate(self.phrases):
+            tokens = tuple(self._vocabulary.setdefault(token, len(self._vocabulary))
+                           for token in normalize_tokens(phrase))
+            self._phrase_tokens.append(tokens)
+            if tokens:
+                self._ngrams.setdefault(tokens[:2], []).append(index)
+
+        self._words = list(self._vocabulary)
+        self._variants: Dict[str, List[int]] = {}
+        for word, word_id in self._vocabulary.items():
+            for variant in self._word_variants(word):
+                self._variants.setdefault(variant, []).append(word_id)
+
+    def _word_variants(self, word: str) -> Set[str]:
+        if self.max_edits <= 0 or len(word) < self.min_token_length:
+            return {word}
+        return _deletes(word, self.max_edits)
+
+    def _resolve(self, token: str, memo: Dict[str, frozenset]) -> frozenset:
+        """Słowa fraz (ID) pasujące do słowa transkrypcji."""
+        resolved = memo.get(token)
+        if resolved is None:
+            exact = self._vocabulary.get(token)
+            candidates = set()
+            for variant in self._word_variants(token):
+                candidates.update(self._variants.get(variant, ()))
+            resolved = frozenset(
+                word_id for word_id in candidates
+                if word_id == exact or (
+                    len(self._words[word_id]) >= self.min_token_length
+                    and _within_edits(token, self._words[word_id], self.max_edits)
+                )
+            )
+            memo[token] = resolved
+        return resolved
+
+    def scan_segments(self, segments: List[Dict], phrase_filter: Optional[Set[int]] = None) -> List[Dict]:
+        """
+        Jeden przebieg po słowach segmentów.
+
+        Args:
+            segments: Segmenty {"text", "speaker_label", "start_time"[, "normalized_text"]}
+            phrase_filter: Tylko te indeksy fraz (domyślnie wszystkie)
+
+        Returns:
+            List[Dict]: Wystąpienia {"phrase", "phrase_index", "segment_index", "speaker",
+            "start_time", "token_offset"}
+        """
+        memo: Dict[str, frozenset] = {}
+        occurrences = []
+        for segment_index, segment in enumerate(segments):
+            tokens = segment_tokens(segment.get("text"), segment.get("normalized_text"))
+            matched = [self._resolve(token, memo) for token in tokens]
+            for position, first in enumerate(matched):
+                if not first:
+                    continue
+                following = matched[position + 1] if position + 1 < len(matched) else frozenset()
+                keys = [(word_id,) for word_id in first]
+                keys += [(word_id, next_id) for word_id in first for next_id in following]
+                for key in keys:
+                    for index in self._ngrams.get(key, ()):
+                        if phrase_filter is not None and index not in phrase_filter:
+                            continue
+                        phrase_tokens = self._phrase_tokens[index]
+                        if position + len(phrase_tokens) > len(matched):
+                            continue
+                        if all(phrase_tokens[k] in matched[position + k] for k in range(2, len(phrase_tokens))):
+                            occurrences.append({
+                                "phrase": self.phrases[index],
+                                "phrase_index": index,
+                                "segment_index": segment_index,
+                                "speaker": segment.get("speaker_label", ""),
+                                "start_time": segment.get("start_time", 0),
+                                "token_offset": position
+                            })
+        return occurrences
+
+@lru_cache(maxsize=_INDEX_CACHE_SIZE)
+def compile_fuzzy_phrases(phrases: Tuple[str, ...]) -> FuzzyPhraseIndex:
+    """Zwraca indeks dla krotki fraz (zapamiętany - kompilacja raz na wersję fraz)."""
+    return FuzzyPhraseIndex(phrases)
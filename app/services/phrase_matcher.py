@@ -0,0 +1,128 @@
+"""
+Wyszukiwanie wielu fraz naraz (automat Aho-Corasick).
+
+Frazy karty oceny są kompilowane raz do automatu, który w jednym
+przebiegu po tekście znajduje wszystkie wystąpienia wszystkich fraz -
+czas nie zależy od liczby fraz (karty zgodności mają ich setki).
+Skompilowane automaty są zapamiętywane (compile_phrases) według treści
+fraz, więc zmiana fraz karty tworzy nowy automat, a kolejne oceny tej
+samej karty używają gotowego.
+"""
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Liczba zapamiętanych automatów (różne karty / wersje fraz)
+_MATCHER_CACHE_SIZE = 64
+
+class PhraseMatcher:
+    """Automat Aho-Corasick dla listy fraz."""
+    def __init__(self, phrases: Sequence[str], case_sensitive: bool = False):
+        self.phrases = list(phrases)
+        self.case_sensitive = case_sensitive
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        self._lengths: List[int] = []
+
+        # Identyczne frazy (po normalizacji wielkości liter) dzielą jeden wzorzec
+        self._pattern_phrases: List[List[int]] = []
+        patterns: Dict[str, int] = {}
+        for index, phrase in enumerate(self.phrases):
+            pattern = self._normalize(phrase)
+            if not pattern:
+                continue
+            if pattern not in patterns:
+                patterns[pattern] = len(self._lengths)
+                self._lengths.append(len(pattern))
+                self._pattern_phrases.append([])
+                self._add(pattern, patterns[pattern])
+            self._pattern_phrases[patterns[pattern]].append(index)
+
+        self._link()
+
+    def _normalize(self, text: str) -> str:
+        return text if self.case_sensitive else text.lower()
+
+    def _add(self, pattern: str, pattern_id: int) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += (pattern_id,)
+
+    def _link(self) -> None:
+        """Wyznacza przejścia awaryjne (BFS) i dołącza wyjścia sufiksów."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fallback = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Wszystkie wystąpienia fraz w tekście.
+
+        Yields:
+            Tuple: (pozycja początku w tekście, indeks frazy w phrases)
+        """
+        goto, fail, output, lengths = self._goto, self._fail, self._output, self._lengths
+        state = 0
+        for position, char in enumerate(self._normalize(text)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                start = position - lengths[pattern_id] + 1
+                for index in self._pattern_phrases[pattern_id]:
+                    yield start, index
+
+    def found(self, text: str) -> List[bool]:
+        """Dla każdej frazy: czy występuje w tekście."""
+        present = [False] * len(self.phrases)
+        for _, index in self.find(text):
+            present[index] = True
+        return present
+
+    def scan_segments(self, segments: Iterable[Dict]) -> List[Dict]:
+        """
+        Jeden przebieg po segmentach mówców.
+
+        Returns:
+            List[Dict]: Wystąpienia {"phrase", "phrase_index", "segment_index", "speaker",
+            "start_time", "offset"} w kolejności segmentów i pozycji
+        """
+        occurrences = []
+        for segment_index, segment in enumerate(segments):
+            for offset, index in sorted(self.find(segment.get("text", "") or "")):
+                occurrences.append({
+                    "phrase": self.phrases[index],
+                    "phrase_index": index,
+                    "segment_index": segment_index,
+                    "speaker": segment.get("speaker_label", ""),
+                    "start_time": segment.get("start_time", 0),
+                    "offset": offset
+                })
+        return occurrences
+
+@lru_cache(maxsize=_MATCHER_CACHE_SIZE)
+def compile_phrases(phrases: Tuple[str, ...], case_sensitive: bool = False) -> PhraseMatcher:
+    """Zwraca automat dla krotki fraz (zapamiętany - kompilacja raz na wersję fraz)."""
+    return PhraseMatcher(phrases, case_sensitive)
+
+def phrase_text(phrase) -> str:
+    """Fraza karty oceny: tekst albo {"phrase": "...", ...}."""
+    return phrase.get("phrase", "") if isinstance(phrase, dict) else str(phrase)
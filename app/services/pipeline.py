@@ -0,0 +1,522 @@
+"""
+Pipeline przetwarzania rozmowy: transkrypcja → diaryzacja → ocena.
+
+Etapy wykonywane są w tle przez workery (app.worker), które pobierają je
+z trwałej kolejki w bazie danych (services.job_queue). Stan każdego etapu
+wraz z czasami zapisywany jest w tabeli pipeline_stages.
+"""
+from typing import List, Optional
+
+import anyio
+from sqlalchemy.orm import Session, joinedload
+
+from ..models.audio import AudioFile
+from ..models.transcription import Transcription
+from ..models.speaker_segment import SpeakerSegment
+from ..models.evaluation import Evaluation
+from ..models.pipeline import PipelineJob, PipelineStage
+from .long_audio import (
+    transcribe_file,
+    transcribe_file_async,
+    transcribe_and_diarize_file,
+    transcribe_and_diarize_file_async
+)
+from .vad import prepare_speech_audio, restore_timestamps
+from .word_store import pack_result_words
+from .persistence import replace_speaker_segments, save_evaluation_result
+from .channel_diarization import use_channel_diarization, transcribe_by_channel, transcribe_by_channel_async
+from .storage import audio_cache_in_use, local_audio_path
+from .audio_ingest import probe_audio_info
+from .evaluation import evaluate_conversation, evaluate_conversation_async, calculate_grade
+from .rules_engine import (
+    find_scorecard_phrases,
+    apply_required_phrases_penalty,
+    apply_forbidden_phrases_penalty,
+    apply_rules,
+    apply_hard_fail_threshold,
+    get_default_service_scorecard
+)
+
+# Etap "speech" wykonuje transkrypcję i diaryzację jednym wywołaniem dostawcy.
+# Etapy "transcription" i "diarization" zostają dla zadań utworzonych wcześniej.
+PIPELINE_STAGES = ["speech", "evaluation"]
+
+# ========== ETAPY ==========
+
+def transcribe_audio_file(db: Session, audio_file: AudioFile) -> Transcription:
+    """
+    Wykonuje transkrypcję pliku audio przez Whisper i zapisuje ją w bazie danych.
+    """
+    provider_path, offset_map = prepare_speech_audio(_local_audio_file(audio_file))
+    result = restore_timestamps(transcribe_file(provider_path), offset_map)
+
+    return _save_transcription(db, audio_file, result)
+
+async def transcribe_audio_file_async(db: Session, audio_file: AudioFile) -> Transcription:
+    """
+    Wersja async transcribe_audio_file dla endpointów API: przygotowanie nagrania
+    i zapis w wątku, wywołanie Whisper bez blokowania wątku serwera.
+    """
+    provider_path, offset_map = await anyio.to_thread.run_sync(
+        lambda: prepare_speech_audio(_local_audio_file(audio_file))
+    )
+    result = restore_timestamps(await transcribe_file_async(provider_path), offset_map)
+
+    return await anyio.to_thread.run_sync(_save_transcription, db, audio_file, result)
+
+def _save_transcription(db: Session, audio_file: AudioFile, result: dict) -> Transcription:
+    transcription = Transcription(
+        audio_file_id=audio_file.id,
+        text=result["text"],
+        language=result["language"],
+        duration=result["duration"] or audio_file.duration or 0.0
+    )
+
+    db.add(transcription)
+    db.commit()
+    db.refresh(transcription)
+
+    return transcription
+
+def diarize_transcription(db: Session, transcription: Transcription) -> List[SpeakerSegment]:
+    """
+    Wykonuje diaryzację mówców (dostawca wg SPEECH_PROVIDER z przełączaniem
+    na SPEECH_FALLBACKS) i zapisuje segmenty w bazie danych.
+    Istniejące segmenty transkrypcji są zastępowane.
+    """
+    audio_file = _transcription_audio_file(transcription)
+    audio_path = _local_audio_file(audio_file)
+
+    transcription_result = _try_channel_diarization(audio_path, audio_file.channels)
+
+    if transcription_result is None:
+        # Transkrypcja z diaryzacją (długie nagrania we fragmentach)
+        provider_path, offset_map = prepare_speech_audio(audio_path)
+        transcription_result = restore_timestamps(
+            transcribe_and_diarize_file(provider_path, language="pl", duration=audio_file.duration), offset_map
+        )
+
+    return _save_diarization(db, transcription, transcription_result)
+
+async def diarize_transcription_async(db: Session, transcription: Transcription) -> List[SpeakerSegment]:
+    """Wersja async diarize_transcription dla endpointów API."""
+    audio_file = _transcription_audio_file(transcription)
+    audio_path = await anyio.to_thread.run_sync(_local_audio_file, audio_file)
+
+    transcription_result = await _try_channel_diarization_async(audio_path, audio_file.channels)
+
+    if transcription_result is None:
+        provider_path, offset_map = await anyio.to_thread.run_sync(prepare_speech_audio, audio_path)
+        transcription_result = restore_timestamps(
+            await transcribe_and_diarize_file_async(provider_path, language="pl", duration=audio_file.duration),
+            offset_map
+        )
+
+    return await anyio.to_thread.run_sync(_save_diarization, db, transcription, transcription_result)
+
+def _transcription_audio_file(transcription: Transcription) -> AudioFile:
+    audio_file = transcription.audio_file
+    if not audio_file:
+        raise ValueError("Plik audio nie znaleziony")
+
+    print(f"Plik audio istnieje: {audio_file.file_path}")
+    return audio_file
+
+def _warn_not_diarized(result: dict) -> None:
+    if result.get("diarized") is False:
+        print(f"Ostrzeżenie: Dostawca {result.get('provider')} nie rozpoznaje mówców - "
+              f"segmenty zostały przypisane mówcom na podstawie tekstu")
+
+def _save_diarization(db: Session, transcription: Transcription, transcription_result: dict) -> List[SpeakerSegment]:
+    speaker_segments = transcription_result.get("segments", [])
+
+    provider = transcription_result.get("provider", "kanały stereo")
+    print(f"Dostawca {provider} zwrócił {len(speaker_segments)} segmentów mówców")
+    _warn_not_diarized(transcription_result)
+
+    transcription.words = pack_result_words(speaker_segments)
+    db_segments = replace_speaker_segments(db, transcription.id, speaker_segments)
+
+    print(f"Wyniki diaryzacji zapisane do bazy danych, liczba segmentów: {len(db_segments)}")
+
+    return db_segments
+
+def transcribe_and_diarize_audio_file(db: Session, audio_file: AudioFile) -> Transcription:
+    """
+    Wykonuje transkrypcję z diaryzacją jednym wywołaniem dostawcy (SPEECH_PROVIDER)
+    i zapisuje zarówno transkrypcję, jak i segmenty mówców.
+    Jeśli transkrypcja już istnieje (bez segmentów), zostaje uzupełniona.
+    """
+    audio_path = _local_audio_file(audio_file)
+
+    result = _try_channel_diarization(audio_path, audio_file.channels)
+
+    if result is None:
+        provider_path, offset_map = prepare_speech_audio(audio_path)
+        result = restore_timestamps(
+            transcribe_and_diarize_file(provider_path, language="pl", duration=audio_file.duration), offset_map
+        )
+
+    return save_speech_result(db, audio_file, result)
+
+def save_speech_result(db: Session, audio_file: AudioFile, result: dict) -> Transcription:
+    """
+    Zapisuje wynik transkrypcji z diaryzacją (services.speech, live_ingest):
+    tworzy lub uzupełnia transkrypcję nagrania i zastępuje jej segmenty mówców.
+    """
+    speaker_segments = result.get("segments", [])
+    _warn_not_diarized(result)
+    duration = result.get("duration") or audio_file.duration or 0.0
+    if not duration and speaker_segments:
+        duration = max(segment["end_time"] for segment in speaker_segments)
+
+    transcription = db.query(Transcription).filter(
+        Transcription.audio_file_id == audio_file.id
+    ).first()
+
+    if not transcription:
+        transcription = Transcription(audio_file_id=audio_file.id)
+        db.add(transcription)
+
+    transcription.text = result["text"]
+    transcription.language = result["language"]
+    transcription.duration = duration
+    transcription.words = pack_result_words(speaker_segments)
+    db.flush()
+
+    db_segments = replace_speaker_segments(db, transcription.id, speaker_segments)
+
+    print(f"Transkrypcja z diaryzacją zapisana, liczba segmentów: {len(db_segments)}")
+
+    return transcription
+
+def _local_audio_file(audio_file: AudioFile) -> str:
+    """
+    Zwraca lokalną ścieżkę nagrania (pobiera je z magazynu, jeśli trzeba)
+    i uzupełnia parametry, których nie odczytano przy uploadzie.
+    """
+    path = local_audio_path(audio_file.file_path)
+
+    if not audio_file.duration or audio_file.channels is None:
+        probe = probe_audio_info(path, audio_file.file_type)
+        if probe:
+            audio_file.duration = probe.get("duration") or audio_file.duration
+            audio_file.sample_rate = probe.get("sample_rate")
+            audio_file.channels = probe.get("channels")
+            audio_file.bitrate = probe.get("bitrate")
+
+    return path
+
+def _try_channel_diarization(file_path: str, channels: Optional[int]) -> Optional[dict]:
+    """
+    Dla nagrań stereo transkrybuje kanały osobno (role wg AGENT_CHANNEL).
+    Zwraca None, gdy trzeba użyć zwykłej diaryzacji.
+    """
+    if not use_channel_diarization(file_path, channels):
+        return None
+
+    try:
+        return transcribe_by_channel(file_path, language="pl")
+    except Exception as e:
+        # Także ProviderError - wszyscy dostawcy słów zawiedli; diaryzacja mono ma własne przełączanie
+        print(f"Ostrzeżenie: Diaryzacja po kanałach nie powiodła się, używam diaryzacji dostawcy: {e}")
+        return None
+
+async def _try_channel_diarization_async(file_path: str, channels: Optional[int]) -> Optional[dict]:
+    if not use_channel_diarization(file_path, channels):
+        return None
+
+    try:
+        return await transcribe_by_channel_async(file_path, language="pl")
+    except Exception as e:
+        # Także ProviderError - wszyscy dostawcy słów zawiedli; diaryzacja mono ma własne przełączanie
+        print(f"Ostrzeżenie: Diaryzacja po kanałach nie powiodła się, używam diaryzacji dostawcy: {e}")
+        return None
+
+def evaluate_transcription_record(db: Session, transcription: Transcription,
+                                  speaker_segments: List[SpeakerSegment],
+                                  scorecard_type: str = "SERVICE") -> Evaluation:
+    """
+    Ocenia rozmowę przez GPT-4, stosuje Rules Engine i zapisuje ocenę w bazie danych.
+    """
+    # Wykonaj ocenę przez GPT-4
+    print("Wykonywanie oceny przez GPT-4...")
+    evaluation_result = evaluate_conversation(
+        transcription_text=transcription.text or "",
+        speaker_segments=speaker_segments
+    )
+
+    return _save_evaluation(db, transcription, speaker_segments, evaluation_result, scorecard_type)
+
+async def evaluate_transcription_record_async(db: Session, transcription: Transcription,
+                                              speaker_segments: List[SpeakerSegment],
+                                              scorecard_type: str = "SERVICE") -> Evaluation:
+    """Wersja async evaluate_transcription_record dla endpointów API."""
+    print("Wykonywanie oceny przez GPT-4...")
+    evaluation_result = await evaluate_conversation_async(
+        transcription_text=transcription.text or "",
+        speaker_segments=speaker_segments
+    )
+
+    return await anyio.to_thread.run_sync(
+        _save_evaluation, db, transcription, speaker_segments, evaluation_result, scorecard_type
+    )
+
+def _save_evaluation(db: Session, transcription: Transcription, speaker_segments: List[SpeakerSegment],
+                     evaluation_result: dict, scorecard_type: str) -> Evaluation:
+    """Stosuje Rules Engine do wyniku GPT-4 i zapisuje ocenę w bazie danych."""
+    transcription_id = transcription.id
+
+    base_score = evaluation_result["overall_score"]
+    print(f"Wynik bazowy: {base_score}%")
+
+    # Zastosuj Rules Engine (frazy i reguły)
+    print("Zastosowuję Rules Engine...")
+    scorecard_config = get_default_service_scorecard()
+
+    segments_data = [
+        {"text": s.text, "start_time": s.start_time, "speaker_label": s.speaker_label,
+         "normalized_text": s.normalized_text}
+        for s in speaker_segments
+    ]
+
+    # Znajdź frazy obowiązkowe i zakazane (jeden automat dla całej karty)
+    required_matches, forbidden_matches = find_scorecard_phrases(
+        transcription.text or "",
+        segments_data,
+        scorecard_config
+    )
+
+    # Zastosuj kary za brak fraz obowiązkowych
+    adjusted_score, required_adjustments = apply_required_phrases_penalty(base_score, required_matches)
+    print(f"Po frazach obowiązkowych: {adjusted_score}%")
+
+    # Zastosuj kary za użycie fraz zakazanych
+    adjusted_score, hard_fail_threshold, forbidden_adjustments = apply_forbidden_phrases_penalty(
+        adjusted_score, forbidden_matches
+    )
+    print(f"Po frazach zakazanych: {adjusted_score}%")
+
+    # Zastosuj reguły IF-THEN (uproszczone)
+    rules = scorecard_config.get("rules", [])
+    adjusted_score, applied_rules = apply_rules(
+        adjusted_score,
+        transcription.text or "",
+        segments_data,
+        rules
+    )
+    print(f"Po regułach (uproszczone): {adjusted_score}%")
+
+    # Zastosuj hard-fail (sufit)
+    if hard_fail_threshold:
+        adjusted_score = apply_hard_fail_threshold(adjusted_score, hard_fail_threshold)
+        print(f"Po hard-fail (max {hard_fail_threshold}%): {adjusted_score}%")
+
+    # Przelicz ocenę literową po wszystkich zmianach
+    final_grade = calculate_grade(adjusted_score)
+
+    # Zapisz ocenę w bazie danych
+    evaluation = Evaluation(
+        transcription_id=transcription_id,
+        scorecard_type=scorecard_type,
+        base_score=base_score,
+        overall_score=adjusted_score,
+        rules_adjustment=adjusted_score - base_score,
+        grade=final_grade,
+        final_comment=evaluation_result["final_comment"],
+        hard_fail_applied=hard_fail_threshold is not None,
+        hard_fail_threshold=hard_fail_threshold
+    )
+
+    # Dopasowania fraz i zastosowane reguły
+    phrase_matches = [
+        {
+            "phrase": match["phrase"],
+            "phrase_type": phrase_type,
+            "found": match["found"],
+            "match_type": match.get("match_type"),
+            "timestamp": match.get("timestamp"),
+            "speaker": match.get("speaker")
+        }
+        for phrase_type, matches in (("required", required_matches), ("forbidden", forbidden_matches))
+        for match in matches
+    ]
+    rules_applied = [
+        {
+            "rule_description": rule["description"],
+            "applied": rule["applied"],
+            "effect": rule.get("effect"),
+            "hard_fail_applied": rule.get("hard_fail_threshold") is not None
+        }
+        for rule in applied_rules
+    ]
+
+    # Kategorie (tylko unikalne) z cytatami
+    categories = []
+    seen_categories = set()
+    for cat_result in evaluation_result["category_results"]:
+        category_name = cat_result["name"]
+
+        # Pomiń duplikaty w tej samej ocenie
+        if category_name in seen_categories:
+            print(f"Pomijam duplikat kategorii: {category_name}")
+            continue
+
+        seen_categories.add(category_name)
+
+        categories.append({
+            "category_name": category_name,
+            "weight": cat_result["weight"],
+            "score": cat_result["score"],
+            "points": cat_result["weight"] * (cat_result["score"] / 5.0),
+            "comment": cat_result["comment"],
+            "quotes": [
+                {
+                    "speaker": quote_data.get("speaker", ""),
+                    "timestamp": quote_data.get("timestamp"),
+                    "text": quote_data.get("text", ""),
+                    "is_positive": quote_data.get("is_positive", True)
+                }
+                for quote_data in cat_result.get("quotes", [])
+            ]
+        })
+
+    evaluation = save_evaluation_result(db, evaluation, phrase_matches, rules_applied, categories)
+
+    print(f"Ocena zapisana: {evaluation.overall_score}% (Grade: {evaluation.grade})")
+
+    return evaluation
+
+def _run_transcription_stage(db: Session, job: PipelineJob) -> bool:
+    """Zwraca False jeśli etap został pominięty (transkrypcja już istnieje)."""
+    transcription = db.query(Transcription).filter(
+        Transcription.audio_file_id == job.audio_file_id
+    ).first()
+
+    if transcription:
+        job.transcription_id = transcription.id
+        return False
+
+    audio_file = db.query(AudioFile).filter(AudioFile.id == job.audio_file_id).first()
+    if not audio_file:
+        raise ValueError("Plik audio nie znaleziony")
+
+    transcription = transcribe_audio_file(db, audio_file)
+    job.transcription_id = transcription.id
+    return True
+
+def _run_diarization_stage(db: Session, job: PipelineJob) -> bool:
+    """Zwraca False jeśli etap został pominięty (segmenty już istnieją)."""
+    existing = db.query(SpeakerSegment.id).filter(
+        SpeakerSegment.transcription_id == job.transcription_id
+    ).first()
+
+    if existing:
+        return False
+
+    transcription = db.query(Transcription).filter(Transcription.id == job.transcription_id).first()
+    if not transcription:
+        raise ValueError("Transkrypcja nie znaleziona")
+
+    diarize_transcription(db, transcription)
+    return True
+
+def _run_speech_stage(db: Session, job: PipelineJob) -> bool:
+    """Zwraca False jeśli etap został pominięty (transkrypcja z segmentami już istnieje)."""
+    transcription = db.query(Transcription).filter(
+        Transcription.audio_file_id == job.audio_file_id
+    ).first()
+
+    if transcription:
+        job.transcription_id = transcription.id
+        existing = db.query(SpeakerSegment.id).filter(
+            SpeakerSegment.transcription_id == transcription.id
+        ).first()
+        if existing:
+            return False
+
+    audio_file = db.query(AudioFile).filter(AudioFile.id == job.audio_file_id).first()
+    if not audio_file:
+        raise ValueError("Plik audio nie znaleziony")
+
+    transcription = transcribe_and_diarize_audio_file(db, audio_file)
+    job.transcription_id = transcription.id
+    return True
+
+def _run_evaluation_stage(db: Session, job: PipelineJob) -> bool:
+    """Zwraca False jeśli etap został pominięty (ocena już istnieje)."""
+    existing_evaluation = db.query(Evaluation).filter(
+        Evaluation.transcription_id == job.transcription_id
+    ).first()
+
+    if existing_evaluation:
+        job.evaluation_id = existing_evaluation.id
+        return False
+
+    transcription = db.query(Transcription).filter(Transcription.id == job.transcription_id).first()
+    if not transcription:
+        raise ValueError("Transkrypcja nie znaleziona")
+
+    speaker_segments = db.query(SpeakerSegment).filter(
+        SpeakerSegment.transcription_id == transcription.id
+    ).order_by(SpeakerSegment.start_time).all()
+
+    if not speaker_segments:
+        raise ValueError("Brak segmentów mówców. Najpierw wykonaj diaryzację.")
+
+    evaluation = evaluate_transcription_record(db, transcription, speaker_segments, job.scorecard_type)
+    job.evaluation_id = evaluation.id
+    return True
+
+STAGE_RUNNERS = {
+    "speech": _run_speech_stage,
+    "transcription": _run_transcription_stage,
+    "diarization": _run_diarization_stage,
+    "evaluation": _run_evaluation_stage,
+}
+
+# ========== ZADANIA ==========
+
+def create_pipeline_job(db: Session, audio_file: AudioFile, scorecard_type: str = "SERVICE") -> PipelineJob:
+    """
+    Tworzy zadanie przetwarzania wraz z listą etapów. Pierwszy etap trafia od razu
+    do kolejki ('pending'), kolejne czekają na zakończenie poprzednich ('waiting').
+    """
+    job_id = create_pipeline_jobs(db, [audio_file], scorecard_type)[0]
+    return get_pipeline_job(db, job_id)
+
+def create_pipeline_jobs(db: Session, audio_files: List[AudioFile], scorecard_type: str = "SERVICE") -> List[int]:
+    """Tworzy zadania dla wielu plików audio jedną transakcją. Zwraca ID zadań."""
+    jobs = []
+    for audio_file in audio_files:
+        job = PipelineJob(
+            audio_file_id=audio_file.id,
+            scorecard_type=scorecard_type,
+            status="queued"
+        )
+        job.stages = [
+            PipelineStage(name=name, position=position, status="pending" if position == 0 else "waiting")
+            for position, name in enumerate(PIPELINE_STAGES)
+        ]
+        jobs.append(job)
+
+    db.add_all(jobs)
+    db.flush()
+    job_ids = [job.id for job in jobs]
+    db.commit()
+
+    return job_ids
+
+def execute_stage(db: Session, stage: PipelineStage) -> bool:
+    """
+    Wykonuje pojedynczy etap zadania. Zwraca False, jeśli etap został pominięty,
+    bo jego wynik już istnieje w bazie danych.
+    """
+    print(f"[pipeline {stage.job_id}] Etap: {stage.name}")
+    with audio_cache_in_use(stage.job.audio_file.file_path):
+        return STAGE_RUNNERS[stage.name](db, stage.job)
+
+def get_pipeline_job(db: Session, job_id: int) -> Optional[PipelineJob]:
+    return db.query(PipelineJob).options(
+        joinedload(PipelineJob.stages)
+    ).filter(PipelineJob.id == job_id).first()
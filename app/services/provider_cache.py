@@ -0,0 +1,225 @@
+"""
+Trwała pamięć podręczna odpowiedzi dostawców (tabela provider_cache).
+
+Ponowne przetworzenie tego samego nagrania (ponowna diaryzacja, ocena po
+usunięciu wiersza, przeliczenie po poprawce błędu) nie wymaga kolejnego
+płatnego wywołania. Zapisywane są surowe odpowiedzi dostawców, więc zmiany
+w kodzie przetwarzającym wyniki działają także na odpowiedziach z pamięci.
+
+Klucz to SHA-256 z: treści wysłanego nagrania, dostawcy, modelu i opcji
+(transkrypcja) albo modelu i pełnego promptu (GPT-4). Wpisy wygasają po
+PROVIDER_CACHE_TTL_DAYS, a po przekroczeniu PROVIDER_CACHE_MAX_MB usuwane
+są najdawniej używane.
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+import anyio
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal
+from ..models.provider_cache import ProviderCacheEntry
+
+# Wyłączenie pamięci podręcznej: PROVIDER_CACHE=false
+PROVIDER_CACHE = os.getenv("PROVIDER_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Czas życia wpisu (dni)
+PROVIDER_CACHE_TTL_DAYS = float(os.getenv("PROVIDER_CACHE_TTL_DAYS", "30"))
+
+# Maksymalny łączny rozmiar (MB, po kompresji); po przekroczeniu usuwane są najdawniej używane wpisy
+PROVIDER_CACHE_MAX_MB = float(os.getenv("PROVIDER_CACHE_MAX_MB", "512"))
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_stats: Dict[str, Dict[str, int]] = {}
+_evictions = 0
+_stats_lock = threading.Lock()
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _count(kind: str, counter: str) -> None:
+    with _stats_lock:
+        kind_stats = _stats.setdefault(kind, {"hits": 0, "misses": 0, "stores": 0})
+        kind_stats[counter] += 1
+
+def audio_digest(audio: Union[bytes, BinaryIO]) -> str:
+    """SHA-256 nagrania (bajty lub plik - czytany od bieżącej pozycji, po czym przewijany)."""
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(audio).hexdigest()
+
+    position = audio.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: audio.read(_HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    audio.seek(position)
+    return digest.hexdigest()
+
+def _key(**parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def speech_cache_key(provider: str, model: str, audio: Union[bytes, BinaryIO], options: Optional[Dict] = None) -> Optional[str]:
+    """Klucz odpowiedzi dostawcy mowy; None, gdy pamięć podręczna jest wyłączona."""
+    if not PROVIDER_CACHE:
+        return None
+    return _key(kind="speech", provider=provider, model=model, audio=audio_digest(audio), options=options or {})
+
+def llm_cache_key(provider: str, model: str, **request) -> Optional[str]:
+    """Klucz odpowiedzi modelu językowego (model + pełny prompt i parametry)."""
+    if not PROVIDER_CACHE:
+        return None
+    return _key(kind="llm", provider=provider, model=model, request=request)
+
+def get_cached(key: Optional[str], kind: str) -> Optional[Any]:
+    """Zwraca zapisaną odpowiedź (JSON) albo None."""
+    if key is None:
+        return None
+
+    db = SessionLocal()
+    try:
+        now = _now()
+        entry = db.query(ProviderCacheEntry).filter(
+            ProviderCacheEntry.cache_key == key,
+            ProviderCacheEntry.expires_at > now
+        ).first()
+        if entry is None:
+            _count(kind, "misses")
+            return None
+
+        payload = json.loads(zlib.decompress(entry.payload))
+        entry.hits = (entry.hits or 0) + 1
+        entry.last_used_at = now
+        db.commit()
+
+        _count(kind, "hits")
+        print(f"Odpowiedź {entry.provider} ({entry.model}) z pamięci podręcznej")
+        return payload
+    except Exception as e:
+        # Pamięć podręczna nie może zatrzymać przetwarzania
+        db.rollback()
+        print(f"Ostrzeżenie: Nie można odczytać pamięci podręcznej dostawców: {e}")
+        return None
+    finally:
+        db.close()
+
+def store_cached(key: Optional[str], kind: str, provider: str, model: Optional[str], payload: Any) -> None:
+    """Zapisuje odpowiedź dostawcy (JSON) i w razie potrzeby zwalnia miejsce."""
+    if key is None:
+        return
+
+    data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    now = _now()
+    expires_at = now + timedelta(days=PROVIDER_CACHE_TTL_DAYS)
+
+    db = SessionLocal()
+    try:
+        entry = db.query(ProviderCacheEntry).filter(ProviderCacheEntry.cache_key == key).first()
+        if entry is None:
+            entry = ProviderCacheEntry(cache_key=key, kind=kind, provider=provider, hits=0)
+            db.add(entry)
+        entry.model = model
+        entry.payload = data
+        entry.size_bytes = len(data)
+        entry.last_used_at = now
+        entry.expires_at = expires_at
+        db.commit()
+        _count(kind, "stores")
+
+        _evict(db)
+    except IntegrityError:
+        # Ten sam wynik zapisał równolegle inny worker
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        print(f"Ostrzeżenie: Nie można zapisać odpowiedzi w pamięci podręcznej: {e}")
+    finally:
+        db.close()
+
+async def get_cached_async(key: Optional[str], kind: str) -> Optional[Any]:
+    if key is None:
+        return None
+    return await anyio.to_thread.run_sync(get_cached, key, kind)
+
+async def store_cached_async(key: Optional[str], kind: str, provider: str, model: Optional[str], payload: Any) -> None:
+    if key is None:
+        return
+    await anyio.to_thread.run_sync(store_cached, key, kind, provider, model, payload)
+
+def _evict(db) -> int:
+    """Usuwa najdawniej używane wpisy, aż łączny rozmiar spadnie do 90% limitu."""
+    global _evictions
+
+    limit = PROVIDER_CACHE_MAX_MB * 1024 * 1024
+    total = db.query(func.coalesce(func.sum(ProviderCacheEntry.size_bytes), 0)).scalar()
+    if total <= limit:
+        return 0
+
+    target = limit * 0.9
+    evicted = []
+    for entry_id, size in db.query(ProviderCacheEntry.id, ProviderCacheEntry.size_bytes).order_by(
+        ProviderCacheEntry.last_used_at
+    ).all():
+        if total <= target:
+            break
+        evicted.append(entry_id)
+        total -= size
+
+    if evicted:
+        db.query(ProviderCacheEntry).filter(ProviderCacheEntry.id.in_(evicted)).delete(synchronize_session=False)
+        db.commit()
+        with _stats_lock:
+            _evictions += len(evicted)
+        print(f"Pamięć podręczna dostawców: usunięto {len(evicted)} najdawniej używanych wpisów")
+    return len(evicted)
+
+def prune_provider_cache() -> int:
+    """Usuwa wygasłe wpisy i pilnuje limitu rozmiaru (wywoływane okresowo przez workery)."""
+    if not PROVIDER_CACHE:
+        return 0
+
+    db = SessionLocal()
+    try:
+        expired = db.query(ProviderCacheEntry).filter(
+            ProviderCacheEntry.expires_at <= _now()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return expired + _evict(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Ostrzeżenie: Nie można wyczyścić pamięci podręcznej dostawców: {e}")
+        return 0
+    finally:
+        db.close()
+
+def cache_stats() -> Dict:
+    """Liczniki trafień/chybień (od startu procesu) i rozmiar pamięci podręcznej."""
+    db = SessionLocal()
+    try:
+        entries, size = db.query(
+            func.count(ProviderCacheEntry.id),
+            func.coalesce(func.sum(ProviderCacheEntry.size_bytes), 0)
+        ).one()
+        stored_hits = db.query(func.coalesce(func.sum(ProviderCacheEntry.hits), 0)).scalar()
+    finally:
+        db.close()
+
+    with _stats_lock:
+        kinds = {kind: dict(values) for kind, values in _stats.items()}
+        evictions = _evictions
+
+    return {
+        "enabled": PROVIDER_CACHE,
+        "entries": entries,
+        "size_mb": round(size / (1024 * 1024), 2),
+        "max_mb": PROVIDER_CACHE_MAX_MB,
+        "ttl_days": PROVIDER_CACHE_TTL_DAYS,
+        "total_hits": stored_hits,
+        "evictions": evictions,
+        "process": kinds
+    }
@@ -0,0 +1,341 @@
+"""
+Warstwa wywołań dostawców (Whisper, Deepgram, GPT-4).
+
+Każde wywołanie przechodzi przez:
+- limit tempa (token bucket) dopasowany do limitów RPM/TPM dostawcy; po
+  odpowiedzi 429 kubełek jest wstrzymywany na czas Retry-After, więc czekają
+  wszystkie wątki, a nie tylko ten, który dostał odmowę,
+- ponawianie z wykładniczym opóźnieniem i losowym rozrzutem (jitter),
+  z uwzględnieniem nagłówka Retry-After,
+- bezpiecznik (circuit breaker): po serii błędów dostawca jest na chwilę
+  odcinany i wywołania od razu kończą się ProviderUnavailable zamiast
+  czekać na kolejne timeouty.
+
+Błędy po wyczerpaniu prób zgłaszane są jako ProviderRateLimited (HTTP 429)
+lub ProviderUnavailable (HTTP 503) z czasem, po którym warto spróbować ponownie.
+Adresy API można przestawić na lokalny serwer testowy (DEEPGRAM_API_URL,
+OPENAI_BASE_URL).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+
+from .clients import provider_slot
+
+T = TypeVar("T")
+
+# Liczba prób jednego wywołania (pierwsza + ponowienia)
+PROVIDER_RETRY_ATTEMPTS = int(os.getenv("PROVIDER_RETRY_ATTEMPTS", "4"))
+
+# Opóźnienie ponowienia: losowe z przedziału [0, min(MAX, BASE * 2^próba)] sekund
+PROVIDER_RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", "1.0"))
+PROVIDER_RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", "30"))
+
+# Bezpiecznik: tyle kolejnych błędów otwiera obwód na CIRCUIT_RESET_SECONDS
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Domyślne limity (żądania / tokeny na minutę, 0 - bez limitu);
+# nadpisywane przez <DOSTAWCA>_RPM i <DOSTAWCA>_TPM, np. WHISPER_RPM=50, GPT4_TPM=10000
+PROVIDER_QUOTAS = {
+    "whisper": (50, 0),
+    "gpt-4": (500, 10000),
+    "deepgram": (0, 0),
+}
+
+# Kody odpowiedzi, po których warto ponowić wywołanie
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """Dostawca chwilowo nie obsłużył wywołania; retry_after - sugerowany czas ponowienia (sekundy)."""
+    def __init__(self, provider: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+class ProviderRateLimited(ProviderError):
+    """Przekroczony limit dostawcy (HTTP 429)."""
+
+class ProviderUnavailable(ProviderError):
+    """Dostawca nie odpowiada lub zwraca błędy serwera (HTTP 503)."""
+
+class TokenBucket:
+    """
+    Kubełek żetonów z rezerwacją: reserve() od razu pobiera żetony (stan może
+    zejść poniżej zera) i zwraca czas oczekiwania, więc działa tak samo dla
+    wątków (time.sleep) i korutyn (asyncio.sleep).
+    """
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= min(cost, self.capacity)
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Wstrzymuje wszystkie rezerwacje (odpowiedź 429 z Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, now + seconds)
+
+class CircuitBreaker:
+    """Bezpiecznik: closed → open (po serii błędów) → half-open (jedno próbne wywołanie)."""
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        # Token wywołania, które wykonuje próbę (tylko ono może ją zwolnić)
+        self._probe_token = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> Tuple[Optional[float], Optional[int]]:
+        """
+        Zwraca (None, token próby lub None), jeśli wywołanie jest dozwolone, albo
+        (czas w sekundach do ponownej próby, None). Token dostaje tylko wywołanie
+        próbne w stanie półotwartym.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return None, None
+
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0 or self.probing:
+                return max(remaining, 1.0), None
+
+            # Półotwarty - przepuszczamy jedno wywołanie próbne
+            self.probing = True
+            self._probe_token += 1
+            return None, self._probe_token
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self, token: Optional[int]) -> None:
+        """
+        Zwalnia wywołanie próbne bez wyniku (np. anulowane) - kolejne wywołanie może
+        spróbować ponownie. Wywołanie bez tokenu (lub z tokenem starszej próby) nic nie zmienia.
+        """
+        with self._lock:
+            if token is not None and self.probing and token == self._probe_token:
+                self.probing = False
+
+class ProviderLimiter:
+    """Limity tempa i bezpiecznik jednego dostawcy."""
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.breaker = CircuitBreaker()
+
+    def admit(self, tokens: float = 0) -> Tuple[float, Optional[int]]:
+        """
+        Sprawdza bezpiecznik i rezerwuje limit; zwraca (czas oczekiwania przed
+        wywołaniem, token próby bezpiecznika lub None).
+        """
+        retry_after, probe = self.breaker.allow()
+        if retry_after is not None:
+            raise ProviderUnavailable(
+                self.name, f"Dostawca {self.name} jest chwilowo niedostępny (wyłączony po serii błędów)", retry_after
+            )
+
+        wait = self.requests.reserve() if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait, probe
+
+    def failed(self, error: Exception, attempt: int) -> float:
+        """
+        Klasyfikuje błąd wywołania. Zwraca opóźnienie przed kolejną próbą albo
+        zgłasza błąd (oryginalny, jeśli ponawianie nie ma sensu).
+        """
+        transient, status, retry_after = _classify(error)
+        if not transient:
+            # Np. 400/401 - dostawca działa, ponowienie nic nie da
+            self.breaker.success()
+            raise error
+
+        if status == 429:
+            # Dostawca działa, ale odmawia - zwalniamy wszystkie wywołania
+            self.breaker.success()
+            for bucket in (self.requests, self.tokens):
+                if bucket:
+                    bucket.pause(retry_after or PROVIDER_RETRY_BASE_DELAY)
+        else:
+            self.breaker.failure()
+
+        delay = random.uniform(0, min(PROVIDER_RETRY_MAX_DELAY, PROVIDER_RETRY_BASE_DELAY * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, retry_after)
+
+        if attempt + 1 >= PROVIDER_RETRY_ATTEMPTS or delay > PROVIDER_RETRY_MAX_DELAY:
+            error_type = ProviderRateLimited if status == 429 else ProviderUnavailable
+            raise error_type(
+                self.name,
+                f"Dostawca {self.name} chwilowo nie obsłużył żądania ({_describe(error, status)}). Spróbuj ponownie później.",
+                retry_after or delay or PROVIDER_RETRY_BASE_DELAY
+            ) from error
+
+        print(f"Dostawca {self.name}: {_describe(error, status)}, ponowienie za {delay:.1f} s "
+              f"(próba {attempt + 2}/{PROVIDER_RETRY_ATTEMPTS})")
+        return delay
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def _env_name(name: str) -> str:
+    return name.upper().replace("-", "")
+
+def get_limiter(name: str) -> ProviderLimiter:
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                rpm, tpm = PROVIDER_QUOTAS.get(name, (0, 0))
+                limiter = _limiters[name] = ProviderLimiter(
+                    name,
+                    rpm=float(os.getenv(f"{_env_name(name)}_RPM", str(rpm))),
+                    tpm=float(os.getenv(f"{_env_name(name)}_TPM", str(tpm)))
+                )
+    return limiter
+
+def call_provider(name: str, call: Callable[[], T], tokens: float = 0) -> T:
+    """
+    Wykonuje wywołanie dostawcy z limitem tempa, ponawianiem i bezpiecznikiem.
+
+    Args:
+        name: Nazwa dostawcy (klucz limitów, np. 'whisper', 'gpt-4', 'deepgram')
+        call: Funkcja wykonująca żądanie; wywoływana ponownie przy każdej próbie
+        tokens: Szacowana liczba tokenów (limit TPM)
+    """
+    limiter = get_limiter(name)
+    for attempt in range(PROVIDER_RETRY_ATTEMPTS):
+        wait, _ = limiter.admit(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+        try:
+            result = call()
+        except Exception as error:
+            time.sleep(limiter.failed(error, attempt))
+            continue
+
+        limiter.breaker.success()
+        return result
+
+    raise ProviderUnavailable(name, f"Dostawca {name} nie obsłużył żądania")
+
+async def call_provider_async(name: str, call: Callable[[], Awaitable[T]], tokens: float = 0,
+                              slot: Optional[str] = None) -> T:
+    """
+    Wersja async call_provider. Każda próba zajmuje miejsce w semaforze
+    provider_slot(slot) tylko na czas samego żądania (nie podczas oczekiwania).
+    """
+    limiter = get_limiter(name)
+    for attempt in range(PROVIDER_RETRY_ATTEMPTS):
+        wait, probe = limiter.admit(tokens)
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with provider_slot(slot or name):
+                result = await call()
+        except asyncio.CancelledError:
+            # Anulowanie (np. zapytanie zapasowe w speech) nie jest ani sukcesem, ani błędem,
+            # ale nie może zostawić bezpiecznika w stanie "trwa próba"
+            limiter.breaker.release(probe)
+            raise
+        except Exception as error:
+            await asyncio.sleep(limiter.failed(error, attempt))
+            continue
+
+        limiter.breaker.success()
+        return result
+
+    raise ProviderUnavailable(name, f"Dostawca {name} nie obsłużył żądania")
+
+def _classify(error: Exception):
+    """Zwraca (czy błąd przejściowy, kod HTTP lub None, Retry-After w sekundach lub None)."""
+    response: Optional[Any] = None
+    if isinstance(error, httpx.HTTPStatusError):
+        response = error.response
+    elif isinstance(error, openai.APIStatusError):
+        response = error.response
+    elif isinstance(error, (httpx.TimeoutException, httpx.TransportError, openai.APIConnectionError)):
+        return True, None, None
+    else:
+        return False, None, None
+
+    status = response.status_code
+    return status in _RETRYABLE_STATUS, status, _retry_after(response.headers)
+
+def _retry_after(headers) -> Optional[float]:
+    """Czas z nagłówka Retry-After (sekundy lub data HTTP) albo retry-after-ms (OpenAI)."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000.0, 0.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _describe(error: Exception, status: Optional[int]) -> str:
+    if status == 429:
+        return "przekroczony limit zapytań (429)"
+    if status:
+        return f"HTTP {status}"
+    if isinstance(error, (httpx.TimeoutException, openai.APITimeoutError)):
+        return "przekroczony czas oczekiwania"
+    return f"błąd połączenia: {error}"
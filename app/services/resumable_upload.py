@@ -0,0 +1,191 @@
+"""
+Wznawialny upload długich nagrań przesyłanych w częściach.
+
+Klient zakłada sesję (nazwa pliku, rozmiar, opcjonalnie SHA-256), wysyła
+kolejne części żądaniami PUT z nagłówkiem Content-Range, a po zerwaniu
+połączenia pyta o bieżący offset i kontynuuje od niego. Zakończenie sesji
+weryfikuje skrót po stronie serwera i tworzy ten sam rekord AudioFile,
+co zwykły upload. Porzucone sesje wygasają razem z plikami częściowymi.
+"""
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional, Tuple
+
+import anyio
+from sqlalchemy.orm import Session
+
+from ..models.audio import AudioFile
+from ..models.upload_session import UploadSession
+from .storage import AUDIO_STORAGE_DIR, hash_file, store_file
+from .audio_ingest import allowed_file, audio_record, create_audio_file
+
+# Czas życia nieaktywnej sesji uploadu (godziny)
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+PARTIAL_UPLOAD_DIR = os.path.join(AUDIO_STORAGE_DIR, "partial")
+
+# Dane części zbierane są w bloki tej wielkości i zapisywane w wątku (bez blokowania pętli zdarzeń)
+_WRITE_BLOCK_BYTES = 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+class UploadError(Exception):
+    """Błąd protokołu uploadu; status_code odpowiada kodowi HTTP."""
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _expiry() -> datetime:
+    return _now() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+
+def parse_content_range(header: Optional[str]) -> Tuple[int, int, Optional[int]]:
+    """Parsuje nagłówek 'Content-Range: bytes start-end/total'."""
+    match = _CONTENT_RANGE.match((header or "").strip())
+    if not match:
+        raise UploadError("Brak lub nieprawidłowy nagłówek Content-Range (bytes start-end/total)")
+    start, end = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    if end < start:
+        raise UploadError("Nieprawidłowy zakres Content-Range")
+    return start, end, total
+
+def _write_at(path: str, offset: int, data: bytes) -> None:
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+def create_upload_session(db: Session, filename: str, total_size: int, sha256: Optional[str] = None) -> UploadSession:
+    if not allowed_file(filename):
+        raise UploadError("Dozwolone tylko pliki MP3 i WAV")
+    if total_size <= 0:
+        raise UploadError("Rozmiar pliku musi być większy od zera")
+
+    # Przy okazji sprzątnij porzucone sesje
+    expire_upload_sessions(db)
+
+    os.makedirs(PARTIAL_UPLOAD_DIR, exist_ok=True)
+    session_id = uuid.uuid4().hex
+    temp_path = os.path.join(PARTIAL_UPLOAD_DIR, f"{session_id}.part")
+    open(temp_path, "wb").close()
+
+    upload = UploadSession(
+        id=session_id,
+        filename=os.path.basename(filename),
+        file_type=filename.split(".")[-1].lower(),
+        total_size=total_size,
+        received_size=0,
+        expected_hash=sha256.lower() if sha256 else None,
+        temp_path=temp_path,
+        status="active",
+        expires_at=_expiry()
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+
+    return upload
+
+def get_active_session(db: Session, session_id: str) -> UploadSession:
+    upload = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    if not upload:
+        raise UploadError("Sesja uploadu nie znaleziona", 404)
+    if upload.status == "expired":
+        raise UploadError("Sesja uploadu wygasła", 410)
+    return upload
+
+async def write_chunk(db: Session, upload: UploadSession, content_range: Optional[str],
+                      body: AsyncIterator[bytes]) -> UploadSession:
+    """
+    Zapisuje część pliku pod wskazanym offsetem. Część musi zaczynać się
+    najpóźniej na bieżącym końcu danych (ponowne wysłanie już odebranych
+    bajtów jest dozwolone), inaczej zwracany jest błąd 409 z bieżącym offsetem.
+    """
+    if upload.status != "active":
+        raise UploadError("Sesja uploadu została już zakończona", 409)
+
+    start, end, total = parse_content_range(content_range)
+    if total is not None and total != upload.total_size:
+        raise UploadError("Rozmiar w Content-Range nie zgadza się z rozmiarem sesji")
+    if end >= upload.total_size:
+        raise UploadError("Zakres wykracza poza rozmiar pliku")
+    if start > upload.received_size:
+        raise UploadError(f"Oczekiwano danych od offsetu {upload.received_size}", 409)
+
+    expected_length = end - start + 1
+    written = 0
+    block = bytearray()
+    try:
+        async for chunk in body:
+            if written + len(block) + len(chunk) > expected_length:
+                raise UploadError("Treść żądania jest dłuższa niż zakres Content-Range")
+            block += chunk
+            if len(block) >= _WRITE_BLOCK_BYTES:
+                await anyio.to_thread.run_sync(_write_at, upload.temp_path, start + written, block)
+                written += len(block)
+                block.clear()
+    finally:
+        # Także po zerwaniu połączenia (ClientDisconnect) w trakcie części: zapisane zostaje
+        # to, co faktycznie dotarło - klient wznowi od tego miejsca
+        with anyio.CancelScope(shield=True):
+            if block:
+                await anyio.to_thread.run_sync(_write_at, upload.temp_path, start + written, block)
+                written += len(block)
+            await anyio.to_thread.run_sync(_save_progress, db, upload, start + written)
+
+    if written != expected_length:
+        raise UploadError(f"Odebrano {written} z {expected_length} bajtów części", 400)
+
+    return upload
+
+def _save_progress(db: Session, upload: UploadSession, end: int) -> None:
+    upload.received_size = max(upload.received_size, end)
+    upload.expires_at = _expiry()
+    db.commit()
+    db.refresh(upload)
+
+def complete_upload(db: Session, upload: UploadSession) -> AudioFile:
+    """
+    Kończy sesję: sprawdza kompletność i skrót SHA-256, przenosi plik do magazynu
+    i tworzy rekord AudioFile (lub zwraca istniejący duplikat).
+    """
+    if upload.status == "completed" and upload.audio_file_id:
+        return db.query(AudioFile).filter(AudioFile.id == upload.audio_file_id).first()
+
+    if upload.received_size != upload.total_size:
+        raise UploadError(f"Upload niekompletny: odebrano {upload.received_size} z {upload.total_size} bajtów", 409)
+
+    content_hash = hash_file(upload.temp_path)
+    if upload.expected_hash and content_hash != upload.expected_hash:
+        raise UploadError("Skrót SHA-256 przesłanego pliku nie zgadza się z zadeklarowanym", 422)
+
+    stored = store_file(upload.temp_path, upload.file_type, content_hash)
+    audio = create_audio_file(db, audio_record(stored, upload.filename))
+
+    upload.status = "completed"
+    upload.audio_file_id = audio.id
+    db.commit()
+
+    return audio
+
+def expire_upload_sessions(db: Session) -> int:
+    """Oznacza porzucone sesje jako wygasłe i usuwa ich pliki częściowe."""
+    expired = db.query(UploadSession).filter(
+        UploadSession.status == "active",
+        UploadSession.expires_at < _now()
+    ).all()
+
+    for upload in expired:
+        if os.path.exists(upload.temp_path):
+            os.remove(upload.temp_path)
+        upload.status = "expired"
+
+    if expired:
+        db.commit()
+        print(f"Wygaszono {len(expired)} porzuconych sesji uploadu")
+
+    return len(expired)
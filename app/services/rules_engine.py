@@ -1,62 +1,86 @@
 """
 Rules Engine - Weryfikacja fraz i zastosowanie reguł
 """
-import re
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Set, Tuple
 from datetime import timedelta
 
+from .phrase_matcher import compile_phrases, phrase_text
+from .phrase_index import PHRASE_FUZZY_MATCHING, compile_fuzzy_phrases
+
 def find_phrases_in_transcription(transcription_text: str, speaker_segments: List[Dict], 
-                                   phrases: List[str], case_sensitive: bool = False) -> List[Dict]:
+                                   phrases: List[str], case_sensitive: bool = False,
+                                   fuzzy: bool = True) -> List[Dict]:
     """
     Wyszukuje frazy w transkrypcji i zwraca dopasowania z timestampami.
     
     Args:
         transcription_text: Pełny tekst transkrypcji
         speaker_segments: Lista segmentów mówców
-        phrases: Lista fraz do wyszukania
+        phrases: Lista fraz do wyszukania (tekst lub {"phrase": ...})
         case_sensitive: Czy wyszukiwanie jest wrażliwe na wielkość liter
+        fuzzy: Czy frazy nieznalezione dokładnie szukać po normalizacji z tolerancją błędów
+               (bez znaków diakrytycznych, po stemmingu - PHRASE_FUZZY_MATCHING)
     
     Returns:
-        Lista dopasowań: [{"phrase": "...", "found": True/False, "timestamp": "...", "speaker": "..."}]
+        Lista dopasowań: [{"phrase": "...", "found": True/False, "match_type": "exact"/"fuzzy"/None,
+        "timestamp": "...", "speaker": "...", "occurrences": [...]}] - timestamp i mówca
+        pierwszego wystąpienia w segmentach
     """
-    matches = []
+    return _find_phrases(transcription_text, speaker_segments, [phrase_text(phrase) for phrase in phrases],
+                         case_sensitive, set(range(len(phrases))) if fuzzy else set())
+
+def _find_phrases(transcription_text: str, speaker_segments: List[Dict], phrases: List[str],
+                  case_sensitive: bool, fuzzy_indices: Set[int]) -> List[Dict]:
+    """find_phrases_in_transcription z wyszukiwaniem przybliżonym tylko dla fraz fuzzy_indices."""
+    matcher = compile_phrases(tuple(phrases), case_sensitive)
+    
+    # Jeden przebieg automatu po segmentach - niezależnie od liczby fraz
+    occurrences: List[List[Dict]] = [[] for _ in phrases]
+    for occurrence in matcher.scan_segments(speaker_segments):
+        occurrences[occurrence["phrase_index"]].append(occurrence)
+    
+    # Pełny tekst tylko dla fraz nieznalezionych w segmentach (np. na granicy segmentów)
+    in_text = [bool(found) for found in occurrences]
+    if not all(in_text):
+        in_text = matcher.found(transcription_text or "")
+    exact = [bool(occurrences[index]) or in_text[index] for index in range(len(phrases))]
+    
+    # Pozostałe frazy: wyszukiwanie przybliżone po znormalizowanych słowach (services.phrase_index)
+    missing = {index for index, found in enumerate(exact) if not found and index in fuzzy_indices}
+    if missing and PHRASE_FUZZY_MATCHING:
+        for occurrence in compile_fuzzy_phrases(tuple(phrases)).scan_segments(speaker_segments, missing):
+            occurrences[occurrence["phrase_index"]].append(occurrence)
     
-    for phrase in phrases:
-        found = False
-        timestamp = None
-        speaker = None
-        
-        # Wyszukaj frazę w transkrypcji
-        if case_sensitive:
-            pattern = re.escape(phrase)
-        else:
-            pattern = re.escape(phrase.lower())
-            transcription_lower = transcription_text.lower()
-        
-        search_text = transcription_text if case_sensitive else transcription_lower
-        
-        if re.search(pattern, search_text):
-            found = True
-            
-            # Znajdź timestamp i mówcę dla pierwszej frazy
-            for segment in speaker_segments:
-                segment_text = segment.get("text", "") or ""
-                search_segment = segment_text if case_sensitive else segment_text.lower()
-                
-                if re.search(pattern, search_segment):
-                    timestamp = format_timestamp(segment.get("start_time", 0))
-                    speaker = segment.get("speaker_label", "")
-                    break
-        
+    matches = []
+    for index, phrase in enumerate(phrases):
+        first = occurrences[index][0] if occurrences[index] else None
+        found = exact[index] or first is not None
         matches.append({
             "phrase": phrase,
             "found": found,
-            "timestamp": timestamp,
-            "speaker": speaker
+            "match_type": ("exact" if exact[index] else "fuzzy") if found else None,
+            "timestamp": format_timestamp(first["start_time"]) if first else None,
+            "speaker": first["speaker"] if first else None,
+            "occurrences": occurrences[index]
         })
     
     return matches
 
+def find_scorecard_phrases(transcription_text: str, speaker_segments: List[Dict],
+                           scorecard_config: Dict[str, Any]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Wyszukuje frazy obowiązkowe i zakazane karty oceny jednym automatem.
+    Wyszukiwanie przybliżone dotyczy tylko fraz obowiązkowych - podobne
+    słowa nie mogą powodować kary (i sufitu 60%) za frazę zakazaną.
+    
+    Returns:
+        Tuple: (dopasowania fraz obowiązkowych, dopasowania fraz zakazanych)
+    """
+    required = [phrase_text(phrase) for phrase in scorecard_config.get("required_phrases") or []]
+    forbidden = [phrase_text(phrase) for phrase in scorecard_config.get("forbidden_phrases") or []]
+    matches = _find_phrases(transcription_text, speaker_segments, required + forbidden, False, set(range(len(required))))
+    return matches[:len(required)], matches[len(required):]
+
 def format_timestamp(seconds: float) -> str:
     """Formatuje sekundy na format HH:MM:SS"""
     td = timedelta(seconds=int(seconds))
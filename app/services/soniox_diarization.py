@@ -4,16 +4,26 @@ from soniox.transcribe_file import transcribe_bytes_stream
 from typing import List, Dict, BinaryIO
 from dotenv import load_dotenv
 
+from .audio_upload import map_audio
+from .clients import register_client, get_client
+from .provider_cache import speech_cache_key, get_cached, store_cached
+from .word_segmenter import DEFAULT_WORD_CONFIDENCE, segment_words, speaker_codes
+
 load_dotenv()
 
-def get_soniox_client():
-    """Tworzy i zwraca klienta Soniox"""
+def _create_soniox_client() -> SpeechClient:
     api_key = os.getenv("SONIOX_API_KEY")
     if not api_key:
         raise ValueError("Brak klucza API Soniox. Sprawdź plik .env")
     
     return SpeechClient(api_key=api_key)
 
+register_client("soniox", _create_soniox_client)
+
+def get_soniox_client():
+    """Zwraca współdzielonego klienta Soniox (jeden kanał gRPC na proces)"""
+    return get_client("soniox")
+
 def transcribe_with_speaker_diarization(audio_file: BinaryIO, language: str = "pl") -> Dict:
     """
     Transkrybuje plik audio używając Soniox API z diaryzacją mówców.
@@ -26,106 +36,124 @@ def transcribe_with_speaker_diarization(audio_file: BinaryIO, language: str = "p
         Dict: Wynik transkrypcji z diaryzacją mówców
     """
     try:
-        client = get_soniox_client()
-        
-        print("Wykonywanie transkrypcji z diaryzacją mówców przez Soniox...")
-        
-        # Wczytaj cały plik audio
-        audio_data = audio_file.read()
-        print(f"Rozmiar pliku audio: {len(audio_data)} bajtów")
-        
-        # Użyj streaming API dla dużych plików
-        # TODO: Musisz wybrać model w Soniox Console -> Project Settings -> Model selection
-        # Przykładowe modele: 'en_us_general', 'en_us_phonecall', 'en_us_meeting', 'multilingual_v3'
-        # Jeśli nie działa żaden model, dodaj środki na konto lub sprawdź ustawienia projektu
-        result = transcribe_bytes_stream(
-            audio=audio_data,
-            client=client,
-            model="",  # Musisz podać poprawny model - sprawdź w Soniox Console
-            enable_global_speaker_diarization=True,
-            max_num_speakers=2,  # Maksymalnie 2 mówców (konsultant + klient)
-            chunk_size=131072  # 128KB chunks
-        )
-        
-        # Przetwarzanie wyników
-        segments = []
-        for word in result.words:
-            if hasattr(word, 'speaker') and word.speaker is not None:
-                segments.append({
-                    "start_time": word.start_time,
-                    "end_time": word.end_time,
-                    "speaker_label": f"SPEAKER_{word.speaker}",
-                    "text": word.text,
-                    "confidence": word.confidence if hasattr(word, 'confidence') else 0.8
-                })
-        
-        # Grupowanie słów w zdania dla każdego mówcy
-        speaker_segments = group_words_into_sentences(segments)
-        
-        return {
-            "text": result.text,
-            "language": language,
-            "duration": result.duration if hasattr(result, 'duration') else 0.0,
-            "segments": speaker_segments
-        }
-        
+        # Plik na dysku mapowany w pamięci zamiast wczytywania całości (services.audio_upload)
+        with map_audio(audio_file) as audio_data:
+            print(f"Rozmiar pliku audio: {len(audio_data)} bajtów")
+            return _transcribe_audio_data(audio_data, language)
+    
     except Exception as e:
         print(f"Szczegóły błędu Soniox: {str(e)}")
         raise Exception(f"Błąd podczas transkrypcji z diaryzacją przez Soniox: {str(e)}")
 
-def group_words_into_sentences(word_segments: List[Dict]) -> List[Dict]:
+def transcribe_words(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """
+    Transkrybuje nagranie jednego mówcy (kanał nagrania stereo) i zwraca słowa ze znacznikami czasu.
+
+    Returns:
+        Dict: {"text", "language", "duration", "words": [{"word", "start", "end", "confidence"}]}
+    """
+    try:
+        with map_audio(audio_file) as audio_data:
+            raw = _transcribe_raw(audio_data)
+    except Exception as e:
+        print(f"Szczegóły błędu Soniox: {str(e)}")
+        raise Exception(f"Błąd podczas transkrypcji przez Soniox: {str(e)}")
+
+    return {
+        "text": raw["text"],
+        "language": language,
+        "duration": raw["duration"],
+        "words": [
+            {
+                "word": word["text"],
+                "start": word["start_time"],
+                "end": word["end_time"],
+                "confidence": word.get("confidence", DEFAULT_WORD_CONFIDENCE)
+            }
+            for word in raw["words"]
+        ]
+    }
+
+def _transcribe_audio_data(audio_data, language: str) -> Dict:
+    return _soniox_result(_transcribe_raw(audio_data), language)
+
+def _transcribe_raw(audio_data) -> Dict:
+    # audio_data: bytes lub mmap - SDK dzieli je na bloki chunk_size bez kopiowania całości
+    # Zapisywane są słowa przed grupowaniem, żeby poprawki grupowania działały też na wynikach z pamięci
+    cache_key = speech_cache_key("soniox", "", audio_data, {"max_num_speakers": 2})
+    cached = get_cached(cache_key, "speech")
+    if cached is not None:
+        return cached
+    
+    client = get_soniox_client()
+    
+    print("Wykonywanie transkrypcji z diaryzacją mówców przez Soniox...")
+    
+    # Użyj streaming API dla dużych plików
+    # TODO: Musisz wybrać model w Soniox Console -> Project Settings -> Model selection
+    # Przykładowe modele: 'en_us_general', 'en_us_phonecall', 'en_us_meeting', 'multilingual_v3'
+    # Jeśli nie działa żaden model, dodaj środki na konto lub sprawdź ustawienia projektu
+    result = transcribe_bytes_stream(
+        audio=audio_data,
+        client=client,
+        model="",  # Musisz podać poprawny model - sprawdź w Soniox Console
+        enable_global_speaker_diarization=True,
+        max_num_speakers=2,  # Maksymalnie 2 mówców (konsultant + klient)
+        chunk_size=131072  # 128KB chunks
+    )
+    
+    # Przetwarzanie wyników
+    segments = []
+    for word in result.words:
+        if hasattr(word, 'speaker') and word.speaker is not None:
+            segments.append({
+                "start_time": word.start_time,
+                "end_time": word.end_time,
+                "speaker_label": f"SPEAKER_{word.speaker}",
+                "text": word.text,
+                "confidence": word.confidence if hasattr(word, 'confidence') else 0.8
+            })
+    
+    raw = {
+        "text": result.text,
+        "duration": result.duration if hasattr(result, 'duration') else 0.0,
+        "words": segments
+    }
+    store_cached(cache_key, "speech", "soniox", "", raw)
+    
+    return raw
+
+def _soniox_result(raw: Dict, language: str) -> Dict:
+    # Grupowanie słów w zdania dla każdego mówcy
+    speaker_segments = _segment_words(raw["words"])
+    
+    return {
+        "text": raw["text"],
+        "language": language,
+        "duration": raw["duration"],
+        "segments": speaker_segments
+    }
+
+def _segment_words(word_segments: List[Dict]) -> List[Dict]:
     """
-    Grupuje słowa w zdania dla każdego mówcy.
+    Grupuje słowa w segmenty mówców (services.word_segmenter) i mapuje mówców na KONSULTANT, KLIENT.
     
     Args:
-        word_segments: Lista segmentów słów z informacją o mówcy
+        word_segments: Lista słów {"start_time", "end_time", "speaker_label", "text", "confidence"}
     
     Returns:
-        List[Dict]: Lista segmentów zdań z informacją o mówcy
+        List[Dict]: Lista segmentów z informacją o mówcy
     """
-    if not word_segments:
-        return []
-    
-    sentence_segments = []
-    current_speaker = None
-    current_text = ""
-    start_time = 0.0
-    
-    for segment in word_segments:
-        speaker = segment["speaker_label"]
-        text = segment["text"]
-        start = segment["start_time"]
-        end = segment["end_time"]
-        
-        # Jeśli zmienił się mówca lub to pierwsze słowo
-        if current_speaker != speaker:
-            # Zapisz poprzednie zdanie jeśli istnieje
-            if current_text.strip():
-                sentence_segments.append({
-                    "start_time": start_time,
-                    "end_time": sentence_segments[-1]["end_time"] if sentence_segments else end,
-                    "speaker_label": current_speaker,
-                    "text": current_text.strip(),
-                    "confidence": 0.8
-                })
-            
-            # Rozpocznij nowe zdanie
-            current_speaker = speaker
-            current_text = text
-            start_time = start
-        else:
-            # Dodaj słowo do bieżącego zdania
-            current_text += " " + text
-    
-    # Zapisz ostatnie zdanie
-    if current_text.strip():
-        sentence_segments.append({
-            "start_time": start_time,
-            "end_time": word_segments[-1]["end_time"],
-            "speaker_label": current_speaker,
-            "text": current_text.strip(),
-            "confidence": 0.8
-        })
+    speakers, labels = speaker_codes(word["speaker_label"] for word in word_segments)
+    sentence_segments = segment_words(
+        [word["start_time"] for word in word_segments],
+        [word["end_time"] for word in word_segments],
+        speakers,
+        [word["text"] for word in word_segments],
+        [word.get("confidence", DEFAULT_WORD_CONFIDENCE) for word in word_segments],
+        labels=labels,
+        with_words=True
+    )
     
     # Mapuj SPEAKER_0, SPEAKER_1 na KONSULTANT, KLIENT
     mapped_segments = []
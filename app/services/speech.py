@@ -0,0 +1,433 @@
+"""
+Jednoprzebiegowa transkrypcja z diaryzacją mówców.
+
+Jedno wywołanie dostawcy zwraca zarówno pełny tekst (język, czas trwania),
+jak i segmenty mówców, więc nagranie nie jest wysyłane i opłacane dwukrotnie.
+
+Dostawcy zarejestrowani są w rejestrze (register_speech_provider) i zwracają
+wspólny wynik {"text", "language", "duration", "segments"}. Kolejność wyboru:
+SPEECH_PROVIDER, a po nim SPEECH_FALLBACKS; dostawca z otwartym bezpiecznikiem
+lub serią błędów jest pomijany, a błąd wywołania przełącza na kolejnego.
+Dostawcy bez diaryzacji (Whisper - mówcy odgadywani z tekstu) nigdy nie są
+zapasowymi; wynik ma pole "diarized", więc takie segmenty da się odróżnić.
+Opcjonalnie (SPEECH_HEDGE, tylko wersja async) drugi dostawca dostaje to samo
+nagranie, jeśli pierwszy nie odpowie w czasie p95 swoich dotychczasowych odpowiedzi.
+
+Dostawcy mogą też zarejestrować transkrypcję bez diaryzacji, zwracającą
+słowa ze znacznikami czasu (transcribe_words) - używa jej diaryzacja po
+kanałach nagrań stereo, z tym samym przełączaniem między dostawcami.
+"""
+import asyncio
+import importlib.util
+import io
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+from .provider_calls import get_limiter
+
+# deepgram (domyślnie), soniox lub whisper
+SPEECH_PROVIDER = os.getenv("SPEECH_PROVIDER", "deepgram").lower()
+
+SPEECH_PROVIDERS = ("deepgram", "soniox", "whisper")
+
+# Kolejni dostawcy używani, gdy wybrany zawiedzie (tylko dostawcy z diaryzacją - Whisper
+# jest pomijany, bo jego segmenty mówców są zgadywane z tekstu)
+SPEECH_FALLBACKS = [
+    name.strip().lower() for name in os.getenv("SPEECH_FALLBACKS", "deepgram,soniox").split(",") if name.strip()
+]
+
+# Zapytanie zapasowe (hedging) do drugiego dostawcy po czasie p95 pierwszego.
+# Działa tylko w transcribe_and_diarize_async, która anuluje przegrane zapytanie; wersja
+# synchroniczna (worker) nie może przerwać wywołania w wątku, więc nie wysyła zapytań zapasowych
+SPEECH_HEDGE = os.getenv("SPEECH_HEDGE", "false").lower() in ("1", "true", "yes")
+SPEECH_HEDGE_PERCENTILE = float(os.getenv("SPEECH_HEDGE_PERCENTILE", "95"))
+
+# Minimalna liczba pomiarów czasu odpowiedzi, zanim hedging zostanie włączony
+SPEECH_HEDGE_MIN_SAMPLES = int(os.getenv("SPEECH_HEDGE_MIN_SAMPLES", "20"))
+
+# Tyle kolejnych błędów wyłącza dostawcę z routingu na SPEECH_UNHEALTHY_SECONDS
+SPEECH_UNHEALTHY_FAILURES = int(os.getenv("SPEECH_UNHEALTHY_FAILURES", "3"))
+SPEECH_UNHEALTHY_SECONDS = float(os.getenv("SPEECH_UNHEALTHY_SECONDS", "60"))
+
+class SpeechProvider:
+    """Dostawca transkrypcji z diaryzacją wraz ze statystykami zdrowia i czasu odpowiedzi."""
+    def __init__(self, name: str, transcribe: Callable[[BinaryIO, str], Dict],
+                 transcribe_async: Optional[Callable[[BinaryIO, str], Awaitable[Dict]]] = None,
+                 available: Optional[Callable[[], bool]] = None,
+                 transcribe_words: Optional[Callable[[BinaryIO, str], Dict]] = None,
+                 transcribe_words_async: Optional[Callable[[BinaryIO, str], Awaitable[Dict]]] = None,
+                 diarizes: bool = True):
+        self.name = name
+        self.diarizes = diarizes
+        self.transcribe = transcribe
+        self.transcribe_async = transcribe_async
+        self.transcribe_words = transcribe_words
+        self.transcribe_words_async = transcribe_words_async
+        self._available = available
+        # Czas odpowiedzi na sekundę nagrania (niezależny od długości rozmowy)
+        self.latencies = deque(maxlen=200)
+        self.consecutive_failures = 0
+        self.last_failure_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return self._available() if self._available else True
+
+    def healthy(self) -> bool:
+        if get_limiter(self.name).breaker.state == "open":
+            return False
+        return not (
+            self.consecutive_failures >= SPEECH_UNHEALTHY_FAILURES
+            and time.monotonic() - self.last_failure_at < SPEECH_UNHEALTHY_SECONDS
+        )
+
+    def record_success(self, elapsed: float, duration: float) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            if duration > 0:
+                self.latencies.append(elapsed / duration)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_failure_at = time.monotonic()
+
+    def hedge_delay(self, duration: Optional[float]) -> Optional[float]:
+        """Czas p95 odpowiedzi dla nagrania o danej długości (None - za mało danych)."""
+        with self._lock:
+            if not duration or len(self.latencies) < SPEECH_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * SPEECH_HEDGE_PERCENTILE / 100), len(ordered) - 1)
+        return ordered[index] * duration
+
+    def status(self) -> Dict:
+        delay = self.hedge_delay(60.0)
+        return {
+            "name": self.name,
+            "available": self.available(),
+            "diarizes": self.diarizes,
+            "healthy": self.healthy(),
+            "circuit": get_limiter(self.name).breaker.state,
+            "consecutive_failures": self.consecutive_failures,
+            "samples": len(self.latencies),
+            "p95_seconds_per_minute": round(delay, 2) if delay is not None else None
+        }
+
+_providers: Dict[str, SpeechProvider] = {}
+
+def register_speech_provider(name: str, transcribe: Callable[[BinaryIO, str], Dict],
+                             transcribe_async: Optional[Callable[[BinaryIO, str], Awaitable[Dict]]] = None,
+                             available: Optional[Callable[[], bool]] = None,
+                             transcribe_words: Optional[Callable[[BinaryIO, str], Dict]] = None,
+                             transcribe_words_async: Optional[Callable[[BinaryIO, str], Awaitable[Dict]]] = None,
+                             diarizes: bool = True) -> SpeechProvider:
+    """
+    Rejestruje dostawcę; transcribe(audio_file, language) zwraca wspólny wynik,
+    a opcjonalne transcribe_words - {"text", "language", "duration", "words"}.
+    diarizes=False: dostawca nie rozpoznaje mówców (nie jest używany jako zapasowy).
+    """
+    provider = _providers[name] = SpeechProvider(
+        name, transcribe, transcribe_async, available, transcribe_words, transcribe_words_async, diarizes
+    )
+    return provider
+
+def get_speech_provider(name: str) -> SpeechProvider:
+    provider = _providers.get(name.lower())
+    if not provider:
+        raise ValueError(f"Nieznany dostawca transkrypcji: {name}. Dostępni: {', '.join(_providers)}")
+    return provider
+
+def providers_status() -> List[Dict]:
+    """Stan dostawców: najpierw w kolejności routingu, potem pozostali."""
+    order = route_providers()
+    rest = [provider for provider in _providers.values() if provider not in order]
+    return [provider.status() for provider in order + rest]
+
+def route_providers(provider: Optional[str] = None) -> List[SpeechProvider]:
+    """
+    Kolejność dostawców dla wywołania. Jawnie wskazany dostawca jest jedyny;
+    w przeciwnym razie SPEECH_PROVIDER i SPEECH_FALLBACKS, zdrowi przed
+    niezdrowymi (ci są ostatnią deską ratunku). Zapasowi są tylko dostawcy z diaryzacją.
+    """
+    if provider:
+        return [get_speech_provider(provider)]
+
+    fallbacks = [get_speech_provider(name) for name in SPEECH_FALLBACKS if name != SPEECH_PROVIDER]
+    candidates = [get_speech_provider(SPEECH_PROVIDER)] + [fallback for fallback in fallbacks if fallback.diarizes]
+    candidates = [candidate for candidate in candidates if candidate.available()]
+    return [c for c in candidates if c.healthy()] + [c for c in candidates if not c.healthy()]
+
+def _normalize_result(result: Dict, provider: SpeechProvider, language: str) -> Dict:
+    segments = result.get("segments") or []
+    duration = float(result.get("duration") or 0.0)
+    if not duration and segments:
+        duration = max(segment["end_time"] for segment in segments)
+    return {
+        "text": result.get("text") or "",
+        "language": result.get("language") or language,
+        "duration": duration,
+        "segments": segments,
+        "provider": provider.name,
+        "diarized": provider.diarizes
+    }
+
+def _audio_opener(audio_file: BinaryIO) -> Callable[[], BinaryIO]:
+    """
+    Każdy dostawca (także zapasowy, działający równolegle) dostaje własny strumień.
+    Plik na dysku jest otwierany ponownie i wysyłany blokami, bez wczytywania
+    do pamięci; inne strumienie wczytujemy raz i kopiujemy.
+    """
+    path = getattr(audio_file, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        position = audio_file.tell()
+
+        def open_file() -> BinaryIO:
+            reopened = open(path, "rb")
+            reopened.seek(position)
+            return reopened
+        return open_file
+
+    # Nazwa pozwala rozpoznać format (Whisper)
+    name = os.path.basename(path if isinstance(path, str) else "") or "audio.wav"
+    audio_data = audio_file.read()
+
+    def open_buffer() -> BinaryIO:
+        buffer = io.BytesIO(audio_data)
+        buffer.name = name
+        return buffer
+    return open_buffer
+
+def _call(provider: SpeechProvider, open_audio: Callable[[], BinaryIO], language: str) -> Dict:
+    started = time.monotonic()
+    try:
+        with open_audio() as audio:
+            result = provider.transcribe(audio, language)
+    except Exception as e:
+        provider.record_failure()
+        print(f"Dostawca {provider.name} nie wykonał transkrypcji: {e}")
+        raise
+
+    result = _normalize_result(result, provider, language)
+    provider.record_success(time.monotonic() - started, result["duration"])
+    return result
+
+async def _call_async(provider: SpeechProvider, open_audio: Callable[[], BinaryIO], language: str) -> Dict:
+    started = time.monotonic()
+    try:
+        with open_audio() as audio:
+            if provider.transcribe_async:
+                result = await provider.transcribe_async(audio, language)
+            else:
+                result = await asyncio.to_thread(provider.transcribe, audio, language)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        provider.record_failure()
+        print(f"Dostawca {provider.name} nie wykonał transkrypcji: {e}")
+        raise
+
+    result = _normalize_result(result, provider, language)
+    provider.record_success(time.monotonic() - started, result["duration"])
+    return result
+
+def transcribe_and_diarize(audio_file: BinaryIO, language: str = "pl", provider: Optional[str] = None,
+                           duration: Optional[float] = None) -> Dict:
+    """
+    Transkrybuje plik audio wraz z diaryzacją mówców jednym wywołaniem dostawcy.
+    Kolejni dostawcy są wywoływani po błędzie poprzedniego; bez zapytań zapasowych
+    (hedging), bo wywołania w wątku nie da się anulować i oba byłyby opłacone.
+
+    Args:
+        audio_file: Plik audio do transkrypcji
+        language: Kod języka (np. 'pl')
+        provider: Nazwa dostawcy; domyślnie SPEECH_PROVIDER z przełączaniem na SPEECH_FALLBACKS
+        duration: Długość nagrania (sekundy) - używana przez hedging w wersji async
+
+    Returns:
+        Dict: {"text", "language", "duration", "segments", "provider", "diarized"}
+    """
+    order = route_providers(provider)
+    if not order:
+        raise ValueError("Brak dostępnych dostawców transkrypcji")
+
+    open_audio = _audio_opener(audio_file)
+    last_error: Optional[Exception] = None
+    for candidate in order:
+        try:
+            return _call(candidate, open_audio, language)
+        except Exception as e:
+            last_error = e
+
+    raise last_error
+
+async def transcribe_and_diarize_async(audio_file: BinaryIO, language: str = "pl", provider: Optional[str] = None,
+                                       duration: Optional[float] = None) -> Dict:
+    """Wersja async transcribe_and_diarize; przegrane zapytanie zapasowe jest anulowane."""
+    order = route_providers(provider)
+    if not order:
+        raise ValueError("Brak dostępnych dostawców transkrypcji")
+
+    open_audio = await asyncio.to_thread(_audio_opener, audio_file)
+    candidates = iter(order)
+    hedge_delay = order[0].hedge_delay(duration) if SPEECH_HEDGE and len(order) > 1 else None
+    pending = set()
+
+    def launch() -> None:
+        candidate = next(candidates, None)
+        if candidate:
+            pending.add(asyncio.create_task(_call_async(candidate, open_audio, language)))
+
+    try:
+        launch()
+        last_error: Optional[Exception] = None
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"Dostawca {order[0].name} nie odpowiedział w {hedge_delay:.1f} s, wysyłam zapytanie zapasowe")
+                hedge_delay = None
+                launch()
+                continue
+
+            for task in done:
+                pending.discard(task)
+                try:
+                    return task.result()
+                except Exception as e:
+                    last_error = e
+
+            if not pending:
+                launch()
+
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def _normalize_words_result(result: Dict, provider: SpeechProvider, language: str) -> Dict:
+    words = result.get("words") or []
+    duration = float(result.get("duration") or 0.0)
+    if not duration and words:
+        duration = max(word["end"] for word in words)
+    return {
+        "text": result.get("text") or "",
+        "language": result.get("language") or language,
+        "duration": duration,
+        "words": words,
+        "provider": provider.name
+    }
+
+def _words_providers() -> List[SpeechProvider]:
+    order = [provider for provider in route_providers() if provider.transcribe_words]
+    if not order:
+        raise ValueError("Brak dostępnych dostawców zwracających słowa ze znacznikami czasu")
+    return order
+
+def transcribe_words(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """
+    Transkrybuje nagranie jednego mówcy (bez diaryzacji), przełączając się
+    na kolejnego dostawcę po błędzie.
+
+    Returns:
+        Dict: {"text", "language", "duration", "words": [{"word", "start", "end", "confidence"}], "provider"}
+    """
+    open_audio = _audio_opener(audio_file)
+    last_error: Optional[Exception] = None
+    for provider in _words_providers():
+        started = time.monotonic()
+        try:
+            with open_audio() as audio:
+                result = provider.transcribe_words(audio, language)
+        except Exception as e:
+            provider.record_failure()
+            print(f"Dostawca {provider.name} nie wykonał transkrypcji słów: {e}")
+            last_error = e
+            continue
+
+        result = _normalize_words_result(result, provider, language)
+        provider.record_success(time.monotonic() - started, result["duration"])
+        return result
+
+    raise last_error
+
+async def transcribe_words_async(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """Wersja async transcribe_words."""
+    open_audio = await asyncio.to_thread(_audio_opener, audio_file)
+    last_error: Optional[Exception] = None
+    for provider in _words_providers():
+        started = time.monotonic()
+        try:
+            with open_audio() as audio:
+                if provider.transcribe_words_async:
+                    result = await provider.transcribe_words_async(audio, language)
+                else:
+                    result = await asyncio.to_thread(provider.transcribe_words, audio, language)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            provider.record_failure()
+            print(f"Dostawca {provider.name} nie wykonał transkrypcji słów: {e}")
+            last_error = e
+            continue
+
+        result = _normalize_words_result(result, provider, language)
+        provider.record_success(time.monotonic() - started, result["duration"])
+        return result
+
+    raise last_error
+
+# ========== DOSTAWCY ==========
+
+def _deepgram(audio_file: BinaryIO, language: str) -> Dict:
+    from .deepgram_diarization import transcribe_with_speaker_diarization
+    return transcribe_with_speaker_diarization(audio_file, language=language)
+
+async def _deepgram_async(audio_file: BinaryIO, language: str) -> Dict:
+    from .deepgram_diarization import transcribe_with_speaker_diarization_async
+    return await transcribe_with_speaker_diarization_async(audio_file, language=language)
+
+def _soniox(audio_file: BinaryIO, language: str) -> Dict:
+    # SDK Soniox jest opcjonalne - importujemy tylko gdy jest używane
+    from .soniox_diarization import transcribe_with_speaker_diarization
+    return transcribe_with_speaker_diarization(audio_file, language=language)
+
+def _deepgram_words(audio_file: BinaryIO, language: str) -> Dict:
+    from .deepgram_diarization import transcribe_words
+    return transcribe_words(audio_file, language=language)
+
+async def _deepgram_words_async(audio_file: BinaryIO, language: str) -> Dict:
+    from .deepgram_diarization import transcribe_words_async
+    return await transcribe_words_async(audio_file, language=language)
+
+def _soniox_words(audio_file: BinaryIO, language: str) -> Dict:
+    from .soniox_diarization import transcribe_words
+    return transcribe_words(audio_file, language=language)
+
+def _soniox_available() -> bool:
+    return bool(os.getenv("SONIOX_API_KEY")) and importlib.util.find_spec("soniox") is not None
+
+def _whisper(audio_file: BinaryIO, language: str) -> Dict:
+    # Whisper nie rozpoznaje mówców - segmenty tworzymy z tekstu
+    from .transcription import transcribe_audio
+    from .whisper_diarization import create_speaker_segments_from_text
+    result = transcribe_audio(audio_file, language=language)
+    result["segments"] = create_speaker_segments_from_text(result["text"], result["duration"])
+    return result
+
+async def _whisper_async(audio_file: BinaryIO, language: str) -> Dict:
+    from .transcription import transcribe_audio_async
+    from .whisper_diarization import create_speaker_segments_from_text
+    result = await transcribe_audio_async(audio_file, language=language)
+    result["segments"] = create_speaker_segments_from_text(result["text"], result["duration"])
+    return result
+
+def _whisper_available() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+register_speech_provider("deepgram", _deepgram, _deepgram_async,
+                         transcribe_words=_deepgram_words, transcribe_words_async=_deepgram_words_async)
+register_speech_provider("soniox", _soniox, available=_soniox_available, transcribe_words=_soniox_words)
+register_speech_provider("whisper", _whisper, _whisper_async, available=_whisper_available, diarizes=False)
@@ -0,0 +1,437 @@
+"""
+Przechowywanie plików audio adresowane zawartością.
+
+Plik zapisywany jest pod kluczem wyznaczonym przez skrót SHA-256 jego zawartości,
+podzielonym na podkatalogi (np. ab/cd/abcd....wav), więc identyczne nagrania
+trafiają w to samo miejsce i nie są zapisywane ani przetwarzane dwa razy.
+
+Magazyn wybiera zmienna STORAGE_BACKEND:
+- local - dysk lokalny (AUDIO_STORAGE_DIR); file_path to ścieżka pliku,
+- s3 - magazyn obiektów zgodny z S3 (AWS, MinIO); file_path ma postać
+  s3://bucket/klucz, a węzły przetwarzające trzymają lokalną kopię podręczną
+  pobranych nagrań (AUDIO_CACHE_DIR). Klient może wysłać plik bezpośrednio
+  do magazynu przez podpisany URL, z pominięciem serwera aplikacji.
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+AUDIO_STORAGE_DIR = os.getenv("AUDIO_STORAGE_DIR", "uploads/audio")
+
+# local (domyślnie) lub s3
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+
+# Konfiguracja magazynu S3; S3_ENDPOINT_URL wskazuje np. na MinIO
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "audio/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+
+# Ważność podpisanych URL-i (sekundy)
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "3600"))
+
+# Lokalna kopia podręczna nagrań z magazynu S3 i jej maksymalny rozmiar
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(AUDIO_STORAGE_DIR, "cache"))
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "10240"))
+
+# Rozmiar bloku przy kopiowaniu i liczeniu skrótu
+STORAGE_CHUNK_SIZE = 1024 * 1024
+
+# Rozmiar części przy uploadzie wieloczęściowym do S3
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+def _cache_path(location: str) -> str:
+    """Ścieżka lokalnej kopii obiektu s3://bucket/klucz w AUDIO_CACHE_DIR."""
+    bucket, _, object_key = location[len("s3://"):].partition("/")
+    return os.path.join(AUDIO_CACHE_DIR, bucket, *object_key.split("/"))
+
+def content_key(content_hash: str, extension: str) -> str:
+    """Zwraca klucz pliku o danym skrócie (dwa poziomy podkatalogów)."""
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{extension.lower()}"
+
+def content_path(content_hash: str, extension: str) -> str:
+    """Zwraca ścieżkę pliku o danym skrócie w lokalnym magazynie."""
+    return os.path.join(AUDIO_STORAGE_DIR, *content_key(content_hash, extension).split("/"))
+
+class LocalStorage:
+    """Magazyn na dysku lokalnym; lokalizacja pliku to jego ścieżka."""
+    name = "local"
+
+    def location(self, key: str) -> str:
+        return os.path.join(AUDIO_STORAGE_DIR, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.location(key))
+
+    def size(self, key: str) -> Optional[int]:
+        path = self.location(key)
+        return os.path.getsize(path) if os.path.exists(path) else None
+
+    def put_file(self, source_path: str, key: str) -> str:
+        """Przenosi plik pod klucz (bez kopiowania danych). Zwraca lokalizację."""
+        path = self.location(key)
+        if os.path.exists(path):
+            os.remove(source_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(source_path, path)
+        return path
+
+    def open(self, location: str) -> BinaryIO:
+        return open(location, "rb")
+
+    def local_path(self, location: str) -> str:
+        return location
+
+    def checksum(self, key: str) -> Optional[str]:
+        return None
+
+    def delete(self, key: str) -> None:
+        path = self.location(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def presigned_upload(self, key: str, content_hash: str) -> Optional[Dict]:
+        return None
+
+    def presigned_download_url(self, location: str) -> Optional[str]:
+        return None
+
+class S3Storage:
+    """Magazyn zgodny z S3 (AWS S3, MinIO i podobne)."""
+    name = "s3"
+
+    def __init__(self):
+        # boto3 jest opcjonalne - potrzebne tylko przy STORAGE_BACKEND=s3
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise ValueError("STORAGE_BACKEND=s3 wymaga pakietu boto3 (pip install boto3)")
+
+        if not S3_BUCKET:
+            raise ValueError("Brak nazwy bucketu S3. Ustaw zmienną S3_BUCKET")
+
+        self.bucket = S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            region_name=S3_REGION,
+            config=Config(
+                signature_version="s3v4",
+                # MinIO i inne lokalne zamienniki wymagają adresowania ścieżką
+                s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"}
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE
+        )
+
+    def _object_key(self, key: str) -> str:
+        return f"{S3_PREFIX}{key}"
+
+    def _parse(self, location: str):
+        bucket, _, object_key = location[len("s3://"):].partition("/")
+        return bucket, object_key
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self._object_key(key)}"
+
+    def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    def exists(self, key: str) -> bool:
+        return self.size(key) is not None
+
+    def checksum(self, key: str) -> Optional[str]:
+        """SHA-256 obiektu (hex) zapisany przez magazyn przy uploadzie, jeśli jest dostępny."""
+        head = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key), ChecksumMode="ENABLED")
+        checksum = head.get("ChecksumSHA256")
+        if not checksum or "-" in checksum:
+            return None
+        return base64.b64decode(checksum).hex()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def put_file(self, source_path: str, key: str) -> str:
+        """
+        Wysyła plik strumieniowo (upload wieloczęściowy), o ile obiektu jeszcze
+        nie ma, i zostawia go w lokalnej kopii podręcznej do dalszego przetwarzania.
+        """
+        location = self.location(key)
+        if not self.exists(key):
+            self.client.upload_file(source_path, self.bucket, self._object_key(key), Config=self.transfer_config)
+
+        cache_path = _cache_path(location)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        os.replace(source_path, cache_path)
+        return location
+
+    def open(self, location: str) -> BinaryIO:
+        bucket, object_key = self._parse(location)
+        return self.client.get_object(Bucket=bucket, Key=object_key)["Body"]
+
+    def local_path(self, location: str) -> str:
+        """Zwraca ścieżkę lokalnej kopii obiektu, pobierając go w razie potrzeby."""
+        cache_path = _cache_path(location)
+        if os.path.exists(cache_path):
+            # Tylko czas dostępu - mtime wyznacza aktualność plików pochodnych (np. .16k.wav)
+            os.utime(cache_path, (time.time(), os.path.getmtime(cache_path)))
+            return cache_path
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".part")
+        os.close(fd)
+        try:
+            bucket, object_key = self._parse(location)
+            self.client.download_file(bucket, object_key, tmp_path, Config=self.transfer_config)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return cache_path
+
+    def presigned_upload(self, key: str, content_hash: str) -> Optional[Dict]:
+        """
+        Podpisany URL do bezpośredniego uploadu (PUT). Magazyn sam weryfikuje
+        SHA-256 przesłanych danych (nagłówek x-amz-checksum-sha256).
+        """
+        checksum = base64.b64encode(bytes.fromhex(content_hash)).decode("ascii")
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key), "ChecksumSHA256": checksum},
+            ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+        return {
+            "upload_url": url,
+            "method": "PUT",
+            "headers": {"x-amz-checksum-sha256": checksum},
+            "expires_in": S3_PRESIGN_EXPIRES
+        }
+
+    def presigned_download_url(self, location: str) -> Optional[str]:
+        bucket, object_key = self._parse(location)
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": object_key},
+            ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+
+_storage = None
+_s3_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Zwraca skonfigurowany magazyn (tworzony raz na proces)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "s3":
+                    _storage = _get_s3_storage()
+                elif STORAGE_BACKEND == "local":
+                    _storage = LocalStorage()
+                else:
+                    raise ValueError(f"Nieznany magazyn: {STORAGE_BACKEND}. Dostępne: local, s3")
+    return _storage
+
+def _get_s3_storage() -> S3Storage:
+    global _s3_storage
+    if _s3_storage is None:
+        _s3_storage = S3Storage()
+    return _s3_storage
+
+def storage_for(location: str):
+    """Magazyn, w którym leży plik o danej lokalizacji (także po zmianie STORAGE_BACKEND)."""
+    if location.startswith("s3://"):
+        if STORAGE_BACKEND == "s3":
+            return get_storage()
+        with _storage_lock:
+            return _get_s3_storage()
+    return LocalStorage()
+
+def local_audio_path(location: str) -> str:
+    """Ścieżka lokalnego pliku nagrania (dla dostawców transkrypcji i analizy audio)."""
+    if not location.startswith("s3://"):
+        # Normalizuj ścieżkę pliku (zamień backslashe na forward slashe)
+        location = location.replace("\\", "/")
+    return storage_for(location).local_path(location)
+
+def open_audio(location: str) -> BinaryIO:
+    """Otwiera nagranie do odczytu strumieniowego."""
+    return storage_for(location).open(location)
+
+def store_stream(source: BinaryIO, extension: str) -> Dict:
+    """
+    Zapisuje strumień na dysk, licząc w trakcie kopiowania jego skrót SHA-256,
+    i przenosi go do magazynu pod kluczem adresowanym zawartością.
+
+    Returns:
+        Dict: {"file_path", "content_hash", "file_size", "already_stored"}
+    """
+    tmp_dir = os.path.join(AUDIO_STORAGE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=f".{extension}")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(STORAGE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                buffer.write(chunk)
+                size += len(chunk)
+
+        return _move_into_place(tmp_path, digest.hexdigest(), extension, size)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def hash_file(file_path: str) -> str:
+    """Liczy skrót SHA-256 pliku, czytając go blokami."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(STORAGE_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def store_file(file_path: str, extension: str, content_hash: str = None) -> Dict:
+    """
+    Przenosi plik z dysku (np. złożony z części upload) do magazynu
+    pod kluczem adresowanym zawartością - lokalnie bez ponownego kopiowania danych.
+    """
+    content_hash = content_hash or hash_file(file_path)
+    return _move_into_place(file_path, content_hash, extension, os.path.getsize(file_path))
+
+def _move_into_place(tmp_path: str, content_hash: str, extension: str, size: int) -> Dict:
+    storage = get_storage()
+    key = content_key(content_hash, extension)
+    already_stored = storage.exists(key)
+
+    return {
+        "file_path": storage.put_file(tmp_path, key),
+        "content_hash": content_hash,
+        "file_size": size,
+        "already_stored": already_stored
+    }
+
+# Kopie podręczne używane przez etapy pipeline w tym procesie (ścieżka -> liczba użyć)
+_cache_in_use: Dict[str, int] = {}
+_cache_in_use_lock = threading.Lock()
+
+@contextmanager
+def audio_cache_in_use(location: str) -> Iterator[None]:
+    """
+    Chroni lokalną kopię nagrania S3 i jej pliki pochodne (np. .16k.wav, .vad.wav)
+    przed prune_audio_cache, dopóki etap z niej korzysta.
+    """
+    if not location or not location.startswith("s3://"):
+        yield
+        return
+
+    path = _cache_path(location)
+    with _cache_in_use_lock:
+        _cache_in_use[path] = _cache_in_use.get(path, 0) + 1
+    try:
+        yield
+    finally:
+        with _cache_in_use_lock:
+            if _cache_in_use[path] > 1:
+                _cache_in_use[path] -= 1
+            else:
+                del _cache_in_use[path]
+
+def _in_use(path: str, in_use: List[str]) -> bool:
+    return any(path == used or path.startswith(f"{used}.") for used in in_use)
+
+def touch_audio_cache_in_use() -> None:
+    """
+    Odświeża czas dostępu używanych kopii i ich plików pochodnych - prune_audio_cache
+    w innych procesach pomija pliki użyte niedawno (także na dyskach z noatime).
+    """
+    with _cache_in_use_lock:
+        in_use = list(_cache_in_use)
+
+    now = time.time()
+    for used in in_use:
+        directory = os.path.dirname(used)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            if not _in_use(path, [used]):
+                continue
+            try:
+                os.utime(path, (now, os.path.getmtime(path)))
+            except OSError:
+                continue
+
+def prune_audio_cache(min_idle_seconds: float = 0.0) -> int:
+    """
+    Usuwa najdawniej używane pliki z lokalnej kopii podręcznej nagrań S3,
+    gdy przekracza AUDIO_CACHE_MAX_MB. Pomija pliki używane przez etapy tego
+    procesu oraz użyte w ciągu ostatnich min_idle_seconds (np. przez inne workery).
+    Zwraca liczbę usuniętych plików.
+    """
+    if not os.path.isdir(AUDIO_CACHE_DIR):
+        return 0
+
+    with _cache_in_use_lock:
+        in_use = list(_cache_in_use)
+
+    entries = []
+    total = 0
+    for root, _, files in os.walk(AUDIO_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            total += stat.st_size
+
+    limit = AUDIO_CACHE_MAX_MB * 1024 * 1024
+    idle_before = time.time() - min_idle_seconds
+    removed = 0
+    for used_at, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if used_at > idle_before or _in_use(path, in_use):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    if removed:
+        print(f"Usunięto {removed} plików z kopii podręcznej nagrań")
+    return removed
@@ -0,0 +1,76 @@
+"""
+Normalizacja tekstu rozmowy do wyszukiwania fraz.
+
+Transkrypcja ASR często gubi polskie znaki albo zwraca inną formę słowa
+("pomóc"/"pomocy", "Dzień dobry"/"dzien dobry"). Tekst jest więc
+sprowadzany do postaci porównywalnej:
+1. małe litery (casefold),
+2. usunięcie znaków diakrytycznych (ą→a, ł→l, ż→z, ...),
+3. podział na słowa bez interpunkcji,
+4. lekki stemming - odcięcie jednej typowej polskiej końcówki fleksyjnej.
+
+Wynik (normalized_text segmentu) jest zapisywany razem z segmentami
+mówców, więc normalizacja wykonuje się raz na transkrypcję.
+NORMALIZATION_VERSION zmienia się przy każdej zmianie reguł - segmenty
+zapisane starszą wersją są normalizowane ponownie w czasie oceny.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional
+
+NORMALIZATION_VERSION = 1
+
+# Litery bez rozkładu NFKD (ł nie jest "l + znak diakrytyczny")
+_FOLD = str.maketrans({"ł": "l", "đ": "d", "ø": "o", "ß": "ss"})
+
+_COMBINING = re.compile(r"[\u0300-\u036f]")
+_TOKEN = re.compile(r"[^\W_]+")
+
+# Końcówki fleksyjne (po usunięciu diakrytyków)
+_SUFFIXES = {
+    # rzeczowniki i przymiotniki
+    "owie", "ami", "ach", "ego", "emu", "owi", "iej", "ych", "ymi", "imi", "ich", "owa", "owe", "owy",
+    "ym", "im", "om", "ow", "ej", "ie", "ia", "iu", "ii", "a", "e", "i", "o", "u", "y",
+    # czasowniki
+    "acie", "ecie", "icie", "emy", "amy", "imy", "esz", "asz", "isz", "ala", "alo", "ali", "aly",
+    "ela", "elo", "eli", "ely", "am", "em", "al", "el"
+}
+
+# Końcówki według długości, od najdłuższych: (długość, zbiór końcówek)
+_SUFFIXES_BY_LENGTH = [
+    (length, {suffix for suffix in _SUFFIXES if len(suffix) == length})
+    for length in sorted({len(suffix) for suffix in _SUFFIXES}, reverse=True)
+]
+
+# Minimalna długość rdzenia po odcięciu końcówki
+_MIN_STEM = 3
+
+def fold_text(text: str) -> str:
+    """Małe litery bez znaków diakrytycznych."""
+    text = unicodedata.normalize("NFKD", text.casefold().translate(_FOLD))
+    return _COMBINING.sub("", text)
+
+@lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """Lekki stemming: odcina jedną (najdłuższą pasującą) końcówkę fleksyjną."""
+    for length, suffixes in _SUFFIXES_BY_LENGTH:
+        if len(token) - length >= _MIN_STEM and token[-length:] in suffixes:
+            return token[:-length]
+    return token
+
+def normalize_tokens(text: Optional[str]) -> List[str]:
+    """Słowa tekstu po normalizacji (małe litery, bez diakrytyków i interpunkcji, po stemmingu)."""
+    return [stem(token) for token in _TOKEN.findall(fold_text(text or ""))]
+
+def normalized_text(text: Optional[str]) -> str:
+    """Postać zapisywana w speaker_segments.normalized_text: "wersja|słowa rozdzielone spacją"."""
+    return f"{NORMALIZATION_VERSION}|{' '.join(normalize_tokens(text))}"
+
+def segment_tokens(text: Optional[str], stored: Optional[str] = None) -> List[str]:
+    """Słowa segmentu z zapisanej postaci znormalizowanej (gdy aktualna) lub wyliczone na nowo."""
+    if stored:
+        version, _, tokens = stored.partition("|")
+        if version == str(NORMALIZATION_VERSION):
+            return tokens.split()
+    return normalize_tokens(text)
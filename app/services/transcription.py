@@ -1,41 +1,143 @@
 import os
-from openai import OpenAI
+import anyio
+from openai import OpenAI, AsyncOpenAI
 from typing import BinaryIO, Dict
 from dotenv import load_dotenv
 
+from .clients import (
+    register_client, get_client, http_client, provider_timeout,
+    register_async_client, get_async_client, async_http_client
+)
+from .provider_calls import ProviderError, call_provider, call_provider_async
+from .provider_cache import speech_cache_key, get_cached, store_cached, get_cached_async, store_cached_async
+
 try:
     load_dotenv()
 except Exception as e:
     print(f"Ostrzeżenie: Nie można załadować pliku .env: {e}")
 
-def get_openai_client():
-    """Tworzy i zwraca klienta OpenAI"""
+def _openai_api_key() -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("Brak klucza API OpenAI. Sprawdź plik .env")
+    return api_key
+
+def _create_openai_client() -> OpenAI:
+    api_key = _openai_api_key()
     
-    # Inicjalizacja klienta bez dodatkowych parametrów
+    # Własna pula połączeń z limitami i keep-alive, wspólna dla całego procesu;
+    # ponawianiem zajmuje się provider_calls, więc SDK nie ponawia samo
     return OpenAI(
         api_key=api_key,
+        http_client=http_client(),
+        timeout=provider_timeout(),
+        max_retries=0,
+    )
+
+register_client("openai", _create_openai_client, warmup=lambda client: client.models.list())
+
+def _create_async_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=_openai_api_key(),
+        http_client=async_http_client(),
+        timeout=provider_timeout(),
+        max_retries=0,
     )
 
+register_async_client("openai", _create_async_openai_client)
+
+def get_openai_client():
+    """Zwraca współdzielonego klienta OpenAI (Whisper i GPT-4)"""
+    return get_client("openai")
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Zwraca współdzielonego klienta async OpenAI (dla endpointów API)"""
+    return get_async_client("openai")
+
 def transcribe_audio(audio_file: BinaryIO, language: str = "pl") -> Dict:
     """
     Transkrybuje plik audio używając OpenAI Whisper API.
     """
     try:
+        cache_key = _whisper_cache_key(audio_file, language)
+        cached = get_cached(cache_key, "speech")
+        if cached is not None:
+            return _transcription_result(cached, language)
+        
         client = get_openai_client()
-        response = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            language=language
-        )
+        rewind = _rewinder(audio_file)
+        
+        def request():
+            rewind()
+            return client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                language=language,
+                response_format="verbose_json"
+            )
         
-        return {
-            "text": response.text,
-            "language": language,
-            "duration": 0.0
-        }
+        response = call_provider("whisper", request)
+        payload = response.model_dump()
+        store_cached(cache_key, "speech", "whisper", "whisper-1", payload)
+        return _transcription_result(payload, language)
+    except ProviderError:
+        raise
     except Exception as e:
         print(f"Szczegóły błędu: {str(e)}")
-        raise Exception(f"Błąd podczas transkrypcji: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Błąd podczas transkrypcji: {str(e)}")
+
+async def transcribe_audio_async(audio_file: BinaryIO, language: str = "pl") -> Dict:
+    """
+    Transkrybuje plik audio przez Whisper API bez blokowania wątku serwera.
+    Liczbę równoczesnych wywołań ogranicza OPENAI_CONCURRENCY.
+    """
+    try:
+        cache_key = await anyio.to_thread.run_sync(_whisper_cache_key, audio_file, language)
+        cached = await get_cached_async(cache_key, "speech")
+        if cached is not None:
+            return _transcription_result(cached, language)
+        
+        client = get_async_openai_client()
+        rewind = _rewinder(audio_file)
+        
+        async def request():
+            rewind()
+            return await client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                language=language,
+                response_format="verbose_json"
+            )
+        
+        response = await call_provider_async("whisper", request, slot="openai")
+        payload = response.model_dump()
+        await store_cached_async(cache_key, "speech", "whisper", "whisper-1", payload)
+        return _transcription_result(payload, language)
+    except ProviderError:
+        raise
+    except Exception as e:
+        print(f"Szczegóły błędu: {str(e)}")
+        raise Exception(f"Błąd podczas transkrypcji: {str(e)}")
+
+def _whisper_cache_key(audio_file: BinaryIO, language: str):
+    # Strumienia bez seek nie da się skrócić do skrótu i wysłać ponownie
+    if not hasattr(audio_file, "seek"):
+        return None
+    return speech_cache_key("whisper", "whisper-1", audio_file, {"language": language, "response_format": "verbose_json"})
+
+def _rewinder(audio_file):
+    """Przy ponowieniu plik musi być wysłany od początku."""
+    seek = getattr(audio_file, "seek", None)
+    if not seek:
+        return lambda: None
+    position = audio_file.tell()
+    return lambda: seek(position)
+
+def _transcription_result(payload: Dict, language: str) -> Dict:
+    """Wynik transkrypcji z surowej odpowiedzi verbose_json (także z pamięci podręcznej)."""
+    # verbose_json zwraca dodatkowo czas trwania nagrania
+    return {
+        "text": payload["text"],
+        "language": language,
+        "duration": float(payload.get("duration") or 0.0)
+    }
\ No newline at end of file
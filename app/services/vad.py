@@ -0,0 +1,237 @@
+"""
+Wykrywanie mowy (VAD) przed wysłaniem nagrania do dostawcy transkrypcji.
+
+Nagrania z call center zawierają długie fragmenty ciszy, muzyki na czekanie
+i zapowiedzi IVR, za które płacimy jak za mowę. Na podstawie energii i liczby
+przejść przez zero w ramkach 30 ms wyznaczamy obszary mowy, wycinamy dłuższe
+przerwy i wysyłamy skrócone nagranie. Mapa przesunięć (OffsetMap) przelicza
+czasy zwrócone przez dostawcę z powrotem na czasy oryginalnego nagrania.
+
+Analiza działa na znormalizowanym pliku 16 kHz mono (services.audio_normalize)
+i jest w pełni zwektoryzowana - godzina nagrania to ułamek sekundy.
+"""
+import json
+import os
+import wave
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .audio_normalize import normalize_audio, prepare_for_provider
+from .audio_probe import probe_audio_file
+
+# Włącza wycinanie ciszy przed wywołaniem dostawcy
+AUDIO_VAD = os.getenv("AUDIO_VAD", "false").lower() in ("1", "true", "yes")
+
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+
+# O ile dB ponad poziom szumu musi być ramka, aby uznać ją za mowę
+VAD_ENERGY_MARGIN_DB = float(os.getenv("VAD_ENERGY_MARGIN_DB", "12"))
+
+# Wycinamy tylko przerwy dłuższe niż ta wartość (sekundy)
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.5"))
+
+# Margines zostawiany przed i po każdym obszarze mowy (sekundy)
+VAD_PADDING_SECONDS = float(os.getenv("VAD_PADDING_SECONDS", "0.3"))
+
+# Muzyka ma niemal stałą głośność; mowa zmienia się z każdą sylabą.
+# Sekundowe okna o odchyleniu energii poniżej progu (dB) traktujemy jako nie-mowę.
+VAD_MUSIC_MODULATION_DB = float(os.getenv("VAD_MUSIC_MODULATION_DB", "3"))
+
+# Nie skracamy nagrania, jeśli zysk byłby mniejszy niż ten ułamek długości
+VAD_MIN_SAVING = float(os.getenv("VAD_MIN_SAVING", "0.05"))
+
+# Ramki ciszej niż ten poziom (dBFS) nigdy nie są mową
+_ABSOLUTE_FLOOR_DB = -60.0
+
+# Próg przejść przez zero dla cichych głosek bezdźwięcznych (s, sz, f)
+_FRICATIVE_ZCR = 0.25
+
+class OffsetMap:
+    """
+    Przelicza czas w skróconym nagraniu na czas w oryginale.
+    regions - zachowane fragmenty oryginału jako (początek, koniec) w sekundach.
+    """
+    def __init__(self, regions: List[Tuple[float, float]], original_duration: float):
+        self.regions = regions
+        self.original_duration = original_duration
+        self.trimmed_starts = []
+        position = 0.0
+        for start, end in regions:
+            self.trimmed_starts.append(position)
+            position += end - start
+        self.trimmed_duration = position
+
+    def to_original(self, t: float) -> float:
+        if not self.regions:
+            return t
+        index = max(bisect_right(self.trimmed_starts, t) - 1, 0)
+        start, end = self.regions[index]
+        return round(min(start + (t - self.trimmed_starts[index]), end), 3)
+
+    def to_dict(self) -> Dict:
+        return {"regions": self.regions, "original_duration": self.original_duration}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "OffsetMap":
+        return cls([tuple(region) for region in data["regions"]], data["original_duration"])
+
+def _frame_features(samples: np.ndarray, frame_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Energia (dBFS) i współczynnik przejść przez zero dla kolejnych ramek."""
+    frames_count = samples.shape[0] // frame_length
+    frames = samples[:frames_count * frame_length].reshape(frames_count, frame_length).astype(np.float32) / 32768.0
+
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) + 1e-10
+    energy_db = 20 * np.log10(rms)
+
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_length - 1)
+
+    return energy_db, zcr
+
+def _dilate(mask: np.ndarray, width: int) -> np.ndarray:
+    """Rozszerza obszary True o width ramek w obie strony."""
+    if width <= 0 or not mask.any():
+        return mask
+    cumulative = np.concatenate(([0], np.cumsum(mask)))
+    index = np.arange(mask.shape[0])
+    lo = np.clip(index - width, 0, mask.shape[0])
+    hi = np.clip(index + width + 1, 0, mask.shape[0])
+    return (cumulative[hi] - cumulative[lo]) > 0
+
+def detect_speech(samples: np.ndarray, sample_rate: int) -> List[Tuple[int, int]]:
+    """
+    Wyznacza obszary mowy w sygnale mono PCM 16-bit.
+
+    Returns:
+        List[Tuple[int, int]]: Zakresy próbek (początek, koniec) do zachowania
+    """
+    frame_length = int(sample_rate * VAD_FRAME_MS / 1000)
+    energy_db, zcr = _frame_features(samples, frame_length)
+    if energy_db.size == 0:
+        return [(0, samples.shape[0])]
+
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + VAD_ENERGY_MARGIN_DB, _ABSOLUTE_FLOOR_DB)
+
+    speech = energy_db > threshold
+    # Ciche głoski bezdźwięczne: niższa energia, ale wysoka liczba przejść przez zero
+    speech |= (energy_db > threshold - VAD_ENERGY_MARGIN_DB / 2) & (zcr > _FRICATIVE_ZCR)
+
+    # Muzyka na czekanie: głośno, ale bez modulacji typowej dla mowy
+    window = max(int(1000 / VAD_FRAME_MS), 1)
+    windows_count = energy_db.size // window
+    if windows_count:
+        windowed = energy_db[:windows_count * window].reshape(windows_count, window)
+        steady = (windowed.std(axis=1) < VAD_MUSIC_MODULATION_DB) & (windowed.mean(axis=1) > threshold)
+        speech[:windows_count * window] &= ~np.repeat(steady, window)
+
+    # Margines wokół mowy, a następnie wypełnienie krótkich przerw
+    speech = _dilate(speech, int(VAD_PADDING_SECONDS * 1000 / VAD_FRAME_MS))
+    min_gap_frames = int(VAD_MIN_SILENCE_SECONDS * 1000 / VAD_FRAME_MS)
+
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    regions: List[Tuple[int, int]] = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < min_gap_frames:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+
+    total_frames = energy_db.size
+    result = []
+    for start, end in regions:
+        sample_end = samples.shape[0] if end >= total_frames else int(end) * frame_length
+        result.append((int(start) * frame_length, sample_end))
+    return result
+
+def trim_silence(file_path: str) -> Optional[Tuple[str, OffsetMap]]:
+    """
+    Tworzy (lub zwraca z pamięci podręcznej) nagranie bez długich przerw.
+
+    Returns:
+        (ścieżka skróconego pliku WAV, mapa przesunięć) lub None, jeśli
+        skrócenie nie przynosi wyraźnego zysku
+    """
+    source = normalize_audio(file_path)[0]
+    target = f"{source}.vad.wav"
+    map_path = f"{source}.vad.json"
+
+    if os.path.exists(map_path) and os.path.getmtime(map_path) >= os.path.getmtime(source):
+        with open(map_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached is None:
+            return None
+        return target, OffsetMap.from_dict(cached)
+
+    info = probe_audio_file(source, "wav")
+    sample_rate = info["sample_rate"]
+    samples = np.memmap(source, dtype="<i2", mode="r", offset=info["data_offset"],
+                        shape=(info["data_size"] // 2,))
+
+    regions = detect_speech(samples, sample_rate)
+    kept = sum(end - start for start, end in regions)
+    saving = 1 - kept / samples.shape[0] if samples.shape[0] else 0.0
+
+    offset_map = None
+    if regions and saving >= VAD_MIN_SAVING:
+        tmp_target = f"{target}.tmp"
+        with wave.open(tmp_target, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(sample_rate)
+            for start, end in regions:
+                writer.writeframes(samples[start:end].tobytes())
+        os.replace(tmp_target, target)
+
+        offset_map = OffsetMap(
+            [(round(start / sample_rate, 3), round(end / sample_rate, 3)) for start, end in regions],
+            info["duration"]
+        )
+        print(f"VAD: {file_path} skrócony o {saving:.0%} ({info['duration']:.0f}s → {offset_map.trimmed_duration:.0f}s)")
+
+    del samples
+
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump(offset_map.to_dict() if offset_map else None, f)
+
+    return (target, offset_map) if offset_map else None
+
+def prepare_speech_audio(file_path: str) -> Tuple[str, Optional[OffsetMap]]:
+    """
+    Przygotowuje nagranie dla dostawcy: normalizacja (jeśli włączona) oraz
+    wycięcie ciszy (jeśli włączone). Zwraca ścieżkę pliku i mapę przesunięć
+    (None, gdy czasy nie wymagają przeliczenia).
+    """
+    if AUDIO_VAD:
+        try:
+            trimmed = trim_silence(file_path)
+            if trimmed:
+                return trimmed
+        except Exception as e:
+            print(f"Ostrzeżenie: VAD dla {file_path} nie powiódł się, wysyłam całe nagranie: {e}")
+
+    return prepare_for_provider(file_path), None
+
+def restore_timestamps(result: Dict, offset_map: Optional[OffsetMap]) -> Dict:
+    """Przelicza czasy segmentów (i słów) wyniku dostawcy na czasy oryginalnego nagrania."""
+    if not offset_map:
+        return result
+
+    for segment in result.get("segments", []):
+        segment["start_time"] = offset_map.to_original(segment["start_time"])
+        segment["end_time"] = offset_map.to_original(segment["end_time"])
+        for word in segment.get("words", []):
+            word["start"] = offset_map.to_original(word["start"])
+            word["end"] = offset_map.to_original(word["end"])
+
+    for word in result.get("words", []):
+        word["start"] = offset_map.to_original(word["start"])
+        word["end"] = offset_map.to_original(word["end"])
+
+    result["duration"] = offset_map.original_duration
+    return result
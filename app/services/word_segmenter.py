@@ -0,0 +1,101 @@
+"""
+Grupowanie słów dostawcy w segmenty mówców (wspólne dla Deepgram i Soniox).
+
+Słowa przekazywane są jako równoległe kolumny (początek, koniec, mówca,
+tekst, pewność), a granice segmentów wyznacza jeden wektorowy przebieg
+numpy: nowy segment zaczyna się przy zmianie mówcy oraz po przerwie
+dłuższej niż SEGMENT_PAUSE_SECONDS. Koniec segmentu to koniec jego
+ostatniego (najpóźniej kończącego się) słowa, a pewność - średnia
+pewności jego słów.
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Przerwa (s) między słowami tego samego mówcy, po której zaczyna się nowy segment; 0 - tylko zmiana mówcy
+SEGMENT_PAUSE_SECONDS = float(os.getenv("SEGMENT_PAUSE_SECONDS", "2.0"))
+
+# Pewność słowa, gdy dostawca jej nie podał
+DEFAULT_WORD_CONFIDENCE = 0.8
+
+def speaker_codes(speakers: Iterable) -> Tuple[np.ndarray, List[str]]:
+    """
+    Koduje mówców kolejnych słów liczbami (w kolejności pojawienia się).
+
+    Returns:
+        Tuple: (kody mówców, etykiety SPEAKER_n / oryginalne etykiety tekstowe)
+    """
+    index: Dict = {}
+    codes = np.fromiter((index.setdefault(speaker, len(index)) for speaker in speakers), dtype=np.int32)
+    labels = [speaker if isinstance(speaker, str) else f"SPEAKER_{speaker}" for speaker in index]
+    return codes, labels
+
+def segment_words(start: Sequence[float], end: Sequence[float], speaker: Sequence[int],
+                  text: Sequence[str], confidence: Optional[Sequence[float]] = None,
+                  labels: Optional[Sequence[str]] = None, pause_seconds: Optional[float] = None,
+                  with_words: bool = False) -> List[Dict]:
+    """
+    Dzieli strumień słów na segmenty według zmiany mówcy i przerw.
+
+    Args:
+        start, end: Czasy słów (s)
+        speaker: Kody mówców (np. z speaker_codes)
+        text: Tekst słów
+        confidence: Pewności słów (domyślnie DEFAULT_WORD_CONFIDENCE)
+        labels: Etykieta dla każdego kodu mówcy (domyślnie SPEAKER_n)
+        pause_seconds: Próg przerwy (domyślnie SEGMENT_PAUSE_SECONDS)
+        with_words: Dołącz listę słów {"word", "start", "end", "confidence"} do segmentu
+
+    Returns:
+        List[Dict]: Segmenty {"start_time", "end_time", "speaker_label", "text", "confidence"[, "words"]}
+    """
+    count = len(text)
+    if not count:
+        return []
+
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    speaker = np.asarray(speaker)
+    if confidence is None:
+        confidence = np.full(count, DEFAULT_WORD_CONFIDENCE)
+    else:
+        confidence = np.asarray(confidence, dtype=np.float64)
+    if pause_seconds is None:
+        pause_seconds = SEGMENT_PAUSE_SECONDS
+
+    # Granica przed słowem i: inny mówca niż słowo i-1 albo długa przerwa po nim
+    boundary = speaker[1:] != speaker[:-1]
+    if pause_seconds > 0:
+        boundary |= (start[1:] - end[:-1]) > pause_seconds
+    first = np.concatenate(([0], np.flatnonzero(boundary) + 1))
+    last = np.append(first[1:], count)
+
+    start_times = start[first].tolist()
+    end_times = np.maximum.reduceat(end, first).tolist()
+    confidences = np.round(np.add.reduceat(confidence, first) / (last - first), 3).tolist()
+    codes = speaker[first].tolist()
+
+    if with_words:
+        words = [
+            {"word": word, "start": word_start, "end": word_end, "confidence": word_confidence}
+            for word, word_start, word_end, word_confidence
+            in zip(text, start.tolist(), end.tolist(), confidence.tolist())
+        ]
+
+    segments = []
+    for index, (a, b) in enumerate(zip(first.tolist(), last.tolist())):
+        code = codes[index]
+        segment = {
+            "start_time": start_times[index],
+            "end_time": end_times[index],
+            "speaker_label": labels[code] if labels is not None else f"SPEAKER_{code}",
+            "text": " ".join(text[a:b]).strip(),
+            "confidence": confidences[index]
+        }
+        if not segment["text"]:
+            continue
+        if with_words:
+            segment["words"] = words[a:b]
+        segments.append(segment)
+    return segments
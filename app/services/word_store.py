@@ -0,0 +1,184 @@
+"""
+Słowa transkrypcji ze znacznikami czasu w jednym skompresowanym bloku
+(kolumna transcriptions.words).
+
+Zamiast wiersza na słowo zapisywane są kolumny: początek i koniec
+(float32), pewność (float16), kod mówcy (uint8), przesunięcia tekstu
+(uint32) oraz bufor tekstu UTF-8. Po rozpakowaniu (zlib) kolumny są
+widokami numpy na ten sam bufor - bez kopiowania i bez parsowania
+słowo po słowie. Dokładne cytaty, czasy fraz i ponowny podział na
+segmenty nie wymagają więc kolejnego wywołania dostawcy.
+
+Układ bloku (przed kompresją, little-endian):
+    nagłówek  <4sHHII: "SORW", wersja, długość etykiet, liczba słów, długość tekstu
+    etykiety  JSON listy etykiet mówców, dopełniony do 8 bajtów
+    start     float32[n]
+    end       float32[n]
+    offsets   uint32[n + 1]
+    conf      float16[n]
+    speaker   uint8[n]
+    text      UTF-8
+"""
+import json
+import struct
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .word_segmenter import DEFAULT_WORD_CONFIDENCE, segment_words
+
+_MAGIC = b"SORW"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+
+def _padded(size: int, alignment: int = 8) -> int:
+    return (size + alignment - 1) // alignment * alignment
+
+class WordColumns:
+    """Słowa transkrypcji jako kolumny numpy (widoki na rozpakowany blok)."""
+    def __init__(self, start: np.ndarray, end: np.ndarray, speaker: np.ndarray, confidence: np.ndarray,
+                 offsets: np.ndarray, text: memoryview, labels: List[str]):
+        self.start = start
+        self.end = end
+        self.speaker = speaker
+        self.confidence = confidence
+        self.offsets = offsets
+        self.text = text
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def word(self, index: int) -> str:
+        return bytes(self.text[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+    def texts(self, first: int = 0, last: Optional[int] = None) -> List[str]:
+        """Tekst słów [first, last)."""
+        last = len(self) if last is None else last
+        bounds = self.offsets[first:last + 1].tolist()
+        return [bytes(self.text[a:b]).decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+
+    def window(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> np.ndarray:
+        """
+        Indeksy słów, które kończą się po start_time i zaczynają przed end_time.
+
+        Maska zamiast wyszukiwania binarnego - przy nakładających się mówcach
+        (nagrania stereo) końce słów nie są posortowane, a pasujące słowa nie
+        muszą tworzyć ciągłego zakresu.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if start_time is not None:
+            mask &= self.end > start_time
+        if end_time is not None:
+            mask &= self.start < end_time
+        return np.flatnonzero(mask)
+
+    def words(self, indices: Optional[np.ndarray] = None) -> List[Dict]:
+        """Słowa (wszystkie lub o podanych indeksach) jako {"word", "start", "end", "confidence", "speaker_label"}."""
+        if indices is None:
+            indices = np.arange(len(self))
+        bounds = zip(self.offsets[indices].tolist(), self.offsets[indices + 1].tolist())
+        return [
+            {
+                "word": bytes(self.text[a:b]).decode("utf-8"),
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "confidence": round(confidence, 3),
+                "speaker_label": self.labels[speaker]
+            }
+            for (a, b), start, end, confidence, speaker in zip(
+                bounds,
+                self.start[indices].tolist(),
+                self.end[indices].tolist(),
+                self.confidence[indices].tolist(),
+                self.speaker[indices].tolist()
+            )
+        ]
+
+    def segments(self, pause_seconds: Optional[float] = None) -> List[Dict]:
+        """Ponowny podział na segmenty mówców (services.word_segmenter) bez wywołania dostawcy."""
+        return segment_words(
+            self.start, self.end, self.speaker, self.texts(), self.confidence.astype(np.float64),
+            labels=self.labels, pause_seconds=pause_seconds
+        )
+
+def pack_words(words: List[Dict]) -> bytes:
+    """
+    Pakuje słowa {"word", "start", "end", "confidence", "speaker_label"} w skompresowany blok.
+
+    Słowa są zapisywane w kolejności czasu (start, end) - słowa kanałów
+    nagrania stereo przeplatają się, a ponowny podział na segmenty wymaga
+    jednego uporządkowanego strumienia.
+    """
+    words = sorted(words, key=lambda word: (word["start"], word["end"]))
+    labels: Dict[str, int] = {}
+    codes = np.fromiter((labels.setdefault(word["speaker_label"], len(labels)) for word in words),
+                        dtype=np.int64, count=len(words))
+    if len(labels) > 256:
+        raise ValueError(f"Zbyt wielu mówców do zapisania słów: {len(labels)}")
+
+    encoded = [str(word["word"]).encode("utf-8") for word in words]
+    offsets = np.zeros(len(words) + 1, dtype="<u4")
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    text = b"".join(encoded)
+
+    label_bytes = json.dumps(list(labels), ensure_ascii=False).encode("utf-8")
+    header = _HEADER.pack(_MAGIC, _VERSION, len(label_bytes), len(words), len(text))
+    prefix = header + label_bytes
+    prefix += b"\0" * (_padded(len(prefix)) - len(prefix))
+
+    raw = b"".join([
+        prefix,
+        np.array([word["start"] for word in words], dtype="<f4").tobytes(),
+        np.array([word["end"] for word in words], dtype="<f4").tobytes(),
+        offsets.tobytes(),
+        np.array([word.get("confidence", DEFAULT_WORD_CONFIDENCE) for word in words], dtype="<f2").tobytes(),
+        codes.astype(np.uint8).tobytes(),
+        text
+    ])
+    return zlib.compress(raw)
+
+def unpack_words(blob: bytes) -> WordColumns:
+    """Rozpakowuje blok pack_words; kolumny są widokami numpy na rozpakowany bufor."""
+    raw = zlib.decompress(blob)
+    magic, version, label_size, count, text_size = _HEADER.unpack_from(raw)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Nieznany format zapisanych słów")
+
+    labels = json.loads(raw[_HEADER.size:_HEADER.size + label_size].decode("utf-8"))
+    position = _padded(_HEADER.size + label_size)
+
+    columns = []
+    for dtype, length in (("<f4", count), ("<f4", count), ("<u4", count + 1), ("<f2", count), ("u1", count)):
+        column = np.frombuffer(raw, dtype=dtype, count=length, offset=position)
+        columns.append(column)
+        position += column.nbytes
+    start, end, offsets, confidence, speaker = columns
+
+    text = memoryview(raw)[position:position + text_size]
+    return WordColumns(start, end, speaker, confidence, offsets, text, labels)
+
+def result_words(segments: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Słowa segmentów wyniku dostawcy z etykietą mówcy segmentu; None, jeśli
+    któryś segment nie ma listy słów (np. Whisper).
+    """
+    words = []
+    for segment in segments:
+        if not segment.get("words"):
+            return None
+        for word in segment["words"]:
+            words.append({**word, "speaker_label": segment["speaker_label"]})
+    return words
+
+def pack_result_words(segments: List[Dict]) -> Optional[bytes]:
+    """Blok słów dla kolumny transcriptions.words albo None, gdy dostawca nie zwrócił słów."""
+    words = result_words(segments)
+    if not words:
+        return None
+    try:
+        return pack_words(words)
+    except ValueError as e:
+        print(f"Ostrzeżenie: Nie można zapisać słów transkrypcji: {e}")
+        return None
@@ -1,70 +1,93 @@
+// Odstęp między kolejnymi odpytaniami o stan zadania (ms)
+const PIPELINE_POLL_INTERVAL = 2000;
+
+// Etap "speech" wykonuje transkrypcję i diaryzację jednym wywołaniem
+const PIPELINE_STAGE_STEPS = {
+    speech: ['transcription', 'diarization'],
+    transcription: ['transcription'],
+    diarization: ['diarization'],
+    evaluation: ['evaluation']
+};
+
 // Funkcja rozpoczynająca pełny pipeline przetwarzania
 async function startProcessing(audioId) {
     // Ukryj sekcję uploadu, pokaż sekcję przetwarzania
     document.getElementById('upload-section').style.display = 'none';
     document.getElementById('processing-section').style.display = 'block';
     
-    let transcriptionId = null;
-    
     try {
-        // KROK 1: Transkrypcja
-        updateStepStatus('transcription', 'processing', 'Przetwarzanie...');
-        updateProgress(10);
+        // Zakolejkuj całe przetwarzanie po stronie serwera
+        updateProgress(5);
         
-        const transcriptionResponse = await fetch(`/api/transcription/transcribe/${audioId}`, {
+        const jobResponse = await fetch(`/api/pipeline/${audioId}?scorecard_type=SERVICE`, {
             method: 'POST'
         });
         
-        if (!transcriptionResponse.ok) {
-            const error = await transcriptionResponse.json();
-            throw new Error(error.detail || 'Błąd podczas transkrypcji');
+        if (!jobResponse.ok) {
+            const error = await jobResponse.json();
+            throw new Error(error.detail || 'Błąd podczas uruchamiania przetwarzania');
         }
         
-        const transcription = await transcriptionResponse.json();
-        transcriptionId = transcription.id;
-        
-        updateStepStatus('transcription', 'completed', '✅ Zakończono');
-        updateProgress(33);
+        let job = await jobResponse.json();
+        renderPipelineJob(job);
         
-        // KROK 2: Diarization
-        updateStepStatus('diarization', 'processing', 'Przetwarzanie...');
-        
-        const diarizationResponse = await fetch(`/api/diarization/analyze/${transcriptionId}`, {
-            method: 'POST'
-        });
-        
-        if (!diarizationResponse.ok) {
-            const error = await diarizationResponse.json();
-            throw new Error(error.detail || 'Błąd podczas diaryzacji');
+        // Odpytuj o stan zadania aż do zakończenia
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, PIPELINE_POLL_INTERVAL));
+            
+            const statusResponse = await fetch(`/api/pipeline/jobs/${job.id}`);
+            if (!statusResponse.ok) {
+                const error = await statusResponse.json();
+                throw new Error(error.detail || 'Błąd pobierania stanu przetwarzania');
+            }
+            
+            job = await statusResponse.json();
+            renderPipelineJob(job);
         }
         
-        await diarizationResponse.json();
-        updateStepStatus('diarization', 'completed', '✅ Zakończono');
-        updateProgress(66);
-        
-        // KROK 3: Ocena
-        updateStepStatus('evaluation', 'processing', 'Przetwarzanie...');
-        
-        const evaluationResponse = await fetch(`/api/evaluation/evaluate/${transcriptionId}?scorecard_type=SERVICE`, {
-            method: 'POST'
-        });
-        
-        if (!evaluationResponse.ok) {
-            const error = await evaluationResponse.json();
-            throw new Error(error.detail || 'Błąd podczas oceny');
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Błąd podczas przetwarzania');
         }
         
-        await evaluationResponse.json();
-        updateStepStatus('evaluation', 'completed', '✅ Zakończono');
         updateProgress(100);
         
         // Pokazuj przyciski wyników
-        showResultsSection(transcriptionId);
+        showResultsSection(job.transcription_id);
         
     } catch (error) {
         console.error('Błąd podczas przetwarzania:', error);
         alert('Błąd: ' + error.message);
-        updateStepStatus('evaluation', 'error', '❌ Błąd: ' + error.message);
+    }
+}
+
+// Aktualizuje kroki i pasek postępu na podstawie stanu zadania
+function renderPipelineJob(job) {
+    const stages = job.stages || [];
+    let finished = 0;
+    
+    stages.forEach(stage => {
+        const time = stage.duration_seconds != null ? ` (${stage.duration_seconds.toFixed(1)} s)` : '';
+        const steps = PIPELINE_STAGE_STEPS[stage.name] || [stage.name];
+        
+        if (stage.status === 'completed' || stage.status === 'skipped') {
+            finished++;
+        }
+        
+        steps.forEach(step => {
+            if (stage.status === 'running') {
+                updateStepStatus(step, 'processing', 'Przetwarzanie...');
+            } else if (stage.status === 'completed' || stage.status === 'skipped') {
+                updateStepStatus(step, 'completed', '✅ Zakończono' + time);
+            } else if (stage.status === 'failed') {
+                updateStepStatus(step, 'error', '❌ Błąd: ' + (stage.error || ''));
+            } else {
+                updateStepStatus(step, 'pending', 'Oczekiwanie...');
+            }
+        });
+    });
+    
+    if (stages.length > 0) {
+        updateProgress(Math.max(5, Math.round(finished / stages.length * 100)));
     }
 }
 
@@ -0,0 +1,178 @@
+"""
+Worker przetwarzający etapy pipeline z trwałej kolejki w bazie danych.
+
+Uruchomienie (dowolna liczba procesów, także na różnych maszynach):
+    python -m app.worker --concurrency 4
+
+Serwer API (app.main) może dodatkowo uruchamiać wbudowane wątki workerów
+(zmienna PIPELINE_EMBEDDED_WORKERS), co wystarcza przy lokalnym uruchomieniu.
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import List
+
+from .database import Base, SessionLocal, engine, ensure_schema_columns
+from .services.job_queue import (
+    STAGE_LEASE_SECONDS,
+    claim_next_stage,
+    heartbeat_stage,
+    complete_stage,
+    fail_stage,
+    requeue_stale_stages
+)
+from .services.clients import init_clients, close_clients
+from .services.pipeline import execute_stage
+from .services.provider_cache import prune_provider_cache
+from .services.provider_calls import ProviderError
+from .services.resumable_upload import expire_upload_sessions
+from .services.storage import prune_audio_cache, touch_audio_cache_in_use
+
+# Odstęp między sprawdzeniami pustej kolejki (sekundy)
+POLL_INTERVAL = float(os.getenv("PIPELINE_POLL_INTERVAL", "1.0"))
+
+# Liczba wątków workerów uruchamianych wewnątrz procesu API
+EMBEDDED_WORKERS = int(os.getenv("PIPELINE_EMBEDDED_WORKERS", "1"))
+
+_embedded_stop = threading.Event()
+_embedded_threads: List[threading.Thread] = []
+
+def make_worker_id(index: int = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}:{uuid.uuid4().hex[:6]}"
+
+def _heartbeat_loop(stage_id: int, worker_id: str, done: threading.Event) -> None:
+    """Przedłuża dzierżawę etapu, dopóki worker go wykonuje."""
+    interval = max(1.0, STAGE_LEASE_SECONDS / 3)
+    while not done.wait(interval):
+        db = SessionLocal()
+        try:
+            heartbeat_stage(db, stage_id, worker_id)
+            touch_audio_cache_in_use()
+        except Exception as e:
+            print(f"Błąd heartbeatu etapu {stage_id}: {str(e)}")
+        finally:
+            db.close()
+
+def process_next_stage(worker_id: str) -> bool:
+    """
+    Pobiera i wykonuje jeden etap z kolejki. Zwraca False, jeśli kolejka była pusta.
+    """
+    db = SessionLocal()
+    try:
+        stage = claim_next_stage(db, worker_id)
+        if not stage:
+            return False
+
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat_loop, args=(stage.id, worker_id, done), daemon=True
+        )
+        heartbeat.start()
+
+        started = time.perf_counter()
+        try:
+            executed = execute_stage(db, stage)
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            retry_after = (e.retry_after or 0.0) if isinstance(e, ProviderError) else None
+            fail_stage(db, stage, str(e), time.perf_counter() - started, retry_after)
+        else:
+            complete_stage(db, stage, executed, time.perf_counter() - started)
+        finally:
+            done.set()
+
+        return True
+    finally:
+        db.close()
+
+def worker_loop(worker_id: str, stop: threading.Event) -> None:
+    """Pętla workera: pobiera etapy, aż do otrzymania sygnału zatrzymania."""
+    print(f"Worker {worker_id} uruchomiony")
+    last_requeue = 0.0
+
+    while not stop.is_set():
+        try:
+            # Okresowo odzyskuj etapy porzucone przez zatrzymane workery
+            # oraz sprzątaj porzucone sesje uploadu, kopię podręczną nagrań i odpowiedzi dostawców
+            if time.monotonic() - last_requeue > STAGE_LEASE_SECONDS / 2:
+                db = SessionLocal()
+                try:
+                    requeue_stale_stages(db)
+                    expire_upload_sessions(db)
+                finally:
+                    db.close()
+                prune_audio_cache(STAGE_LEASE_SECONDS)
+                prune_provider_cache()
+                last_requeue = time.monotonic()
+
+            if not process_next_stage(worker_id):
+                stop.wait(POLL_INTERVAL)
+        except Exception as e:
+            print(f"Błąd workera {worker_id}: {str(e)}")
+            traceback.print_exc()
+            stop.wait(POLL_INTERVAL)
+
+    print(f"Worker {worker_id} zatrzymany")
+
+def start_embedded_workers() -> None:
+    """Uruchamia wątki workerów wewnątrz procesu API."""
+    _embedded_stop.clear()
+    for index in range(EMBEDDED_WORKERS):
+        thread = threading.Thread(
+            target=worker_loop,
+            args=(make_worker_id(index), _embedded_stop),
+            name=f"pipeline-worker-{index}",
+            daemon=True
+        )
+        thread.start()
+        _embedded_threads.append(thread)
+
+def stop_embedded_workers() -> None:
+    _embedded_stop.set()
+    for thread in _embedded_threads:
+        thread.join(timeout=5)
+    _embedded_threads.clear()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker pipeline SOR")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("PIPELINE_WORKER_CONCURRENCY", "2")),
+                        help="Liczba równoległych wątków w procesie")
+    args = parser.parse_args()
+
+    # Upewnij się, że tabele istnieją (worker może wystartować przed API)
+    from . import models  # noqa: F401
+    from .models import evaluation  # noqa: F401
+    Base.metadata.create_all(bind=engine)
+    ensure_schema_columns()
+
+    # Klienty dostawców współdzielone przez wszystkie wątki workera
+    init_clients()
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        print("Otrzymano sygnał zatrzymania, kończę bieżące etapy...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    threads = []
+    for index in range(args.concurrency):
+        thread = threading.Thread(target=worker_loop, args=(make_worker_id(index), stop), name=f"pipeline-worker-{index}")
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    close_clients()
+
+if __name__ == "__main__":
+    main()
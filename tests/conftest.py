@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+import app.models  # noqa: F401 - rejestracja modeli
+import app.models.evaluation  # noqa: F401
+import app.models.scorecard  # noqa: F401
+
+@pytest.fixture
+def db():
+    """Sesja na osobnej bazie SQLite w pamięci (bez pliku sor.db)."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
@@ -0,0 +1,109 @@
+"""Odtwarzanie z obsługą Range (services.audio_stream)."""
+import asyncio
+import struct
+import wave
+
+import pytest
+
+from app.services import audio_stream
+from app.services.audio_stream import FileRangeResponse, RangeNotSatisfiable, parse_range, time_slice
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    # Kilka zakresów - używany jest pierwszy
+    ("bytes=0-9, 20-29", (0, 9)),
+    (None, None),
+    ("bytes=-", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1500-1600", "bytes=50-10", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+def _wav(path, seconds: float, sample_rate: int = 8000, channels: int = 2):
+    frames = int(seconds * sample_rate)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(b"".join(struct.pack("<hh", i % 100, -(i % 100)) for i in range(frames)))
+    return str(path)
+
+def test_time_slice_wav_rewrites_header(tmp_path):
+    path = _wav(tmp_path / "rozmowa.wav", 3.0)
+    prefix, offset, length = time_slice(path, "wav", 1.0, 2.5)
+
+    # 1,5 s stereo 16 bit przy 8 kHz, od początku drugiej sekundy
+    assert length == 12000 * 4
+    assert offset == 44 + 8000 * 4
+    assert len(prefix) == 44
+
+    piece = tmp_path / "fragment.wav"
+    with open(path, "rb") as f:
+        f.seek(offset)
+        piece.write_bytes(prefix + f.read(length))
+    with wave.open(str(piece), "rb") as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (2, 2, 8000)
+        assert w.getnframes() == 12000
+        assert struct.unpack("<hh", w.readframes(1)) == (8000 % 100, -(8000 % 100))
+
+def test_time_slice_open_end_and_errors(tmp_path):
+    path = _wav(tmp_path / "rozmowa.wav", 2.0)
+    prefix, offset, length = time_slice(path, "wav", 1.0, None)
+    assert offset + length == 44 + 16000 * 4
+    assert struct.unpack("<I", prefix[40:44])[0] == length
+
+    with pytest.raises(ValueError):
+        time_slice(path, "wav", 1.0, 0.5)
+    with pytest.raises(ValueError):
+        time_slice(path, "wav", 5.0, None)
+
+def _respond(response, extensions=None):
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            # Serwer czyta z pliku w trakcie send - musi być jeszcze otwarty
+            f = message["file"]
+            assert not f.closed
+            f.seek(message["offset"])
+            message = dict(message, data=f.read(message["count"]))
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": extensions or {}}
+    asyncio.run(response(scope, None, send))
+    return messages
+
+def test_range_response_spans_prefix_and_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_stream, "STREAM_CHUNK_SIZE", 4)
+    path = tmp_path / "plik.bin"
+    path.write_bytes(b"0123456789")
+
+    response = FileRangeResponse(str(path), 2, 6, prefix=b"HDR", byte_range=(1, 6))
+    messages = _respond(response)
+
+    assert messages[0]["status"] == 206
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-range"] == b"bytes 1-6/9"
+    assert headers[b"content-length"] == b"6"
+    assert b"".join(m.get("body", b"") for m in messages[1:]) == b"DR2345"
+    assert messages[-1]["more_body"] is False
+
+def test_range_response_zero_copy_passes_open_file(tmp_path):
+    path = tmp_path / "plik.bin"
+    path.write_bytes(b"0123456789")
+
+    response = FileRangeResponse(str(path), 0, 10, byte_range=(3, 7))
+    messages = _respond(response, extensions={"http.response.zerocopysend": {}})
+
+    assert messages[1]["type"] == "http.response.zerocopysend"
+    assert messages[1]["data"] == b"34567"
+    assert messages[1]["file"].closed
@@ -0,0 +1,56 @@
+"""Kolejka etapów pipeline (services.job_queue): odzyskiwanie porzuconych etapów."""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.pipeline import PipelineJob, PipelineStage
+from app.services import job_queue
+from app.services.job_queue import MAX_STAGE_ATTEMPTS, requeue_stale_stages
+
+@pytest.fixture
+def legacy_db(monkeypatch):
+    """Baza, w której kolumnę attempts dodał ensure_schema_columns (bez NOT NULL)."""
+    monkeypatch.setattr(PipelineStage.__table__.c.attempts, "nullable", True)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+def _stale_stage(db, attempts):
+    job = PipelineJob(audio_file_id=1, status="running")
+    stage = PipelineStage(name="speech", position=0, status="running", locked_by="worker-1",
+                          locked_at=job_queue._now() - timedelta(seconds=job_queue.STAGE_LEASE_SECONDS + 60))
+    job.stages.append(stage)
+    db.add(job)
+    db.flush()
+    stage.attempts = attempts
+    db.commit()
+    return stage
+
+def test_requeues_stage_without_attempts(legacy_db):
+    stage = _stale_stage(legacy_db, None)
+
+    assert requeue_stale_stages(legacy_db) == 1
+    assert (stage.status, stage.locked_by) == ("pending", None)
+
+def test_fails_exhausted_stage_and_job(db):
+    stage = _stale_stage(db, MAX_STAGE_ATTEMPTS)
+
+    assert requeue_stale_stages(db) == 0
+    assert stage.status == "failed"
+    assert stage.job.status == "failed"
+    assert "Worker przestał odpowiadać" in stage.error
+
+def test_keeps_running_stage_with_fresh_heartbeat(db):
+    stage = _stale_stage(db, 1)
+    stage.locked_at = job_queue._now()
+    db.commit()
+
+    assert requeue_stale_stages(db) == 0
+    assert stage.status == "running"
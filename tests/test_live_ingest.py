@@ -0,0 +1,72 @@
+"""Transkrypcja w trakcie uploadu (services.live_ingest) z zastępnikiem sesji "local"."""
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from app.services import live_ingest, storage
+
+def _body(blocks):
+    async def iterate():
+        for block in blocks:
+            yield block
+    return iterate()
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "AUDIO_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "_storage", storage.LocalStorage())
+    monkeypatch.setattr(live_ingest, "AUDIO_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(live_ingest, "_WRITE_BLOCK_BYTES", 4)
+    return tmp_path
+
+@pytest.fixture
+def transcribed(monkeypatch):
+    calls = []
+
+    async def fake_transcribe(file_path, language="pl"):
+        with open(file_path, "rb") as f:
+            calls.append((f.read(), language))
+        return {"text": "Dzień dobry", "segments": [], "provider": "local-test", "diarized": True}
+
+    monkeypatch.setattr(live_ingest, "transcribe_and_diarize_file_async", fake_transcribe)
+    return calls
+
+def test_local_session_transcribes_stored_file(store_dir, transcribed):
+    blocks = [b"RIFF", b"", b"abcdefghij", b"xyz"]
+    ingested = asyncio.run(live_ingest.ingest_stream(_body(blocks), "rozmowa.wav", provider="local", language="en"))
+
+    data = b"".join(blocks)
+    record = ingested["record"]
+    assert record["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert record["file_size"] == len(data)
+    with open(record["file_path"], "rb") as f:
+        assert f.read() == data
+
+    # Zastępnik transkrybuje plik zapisany w magazynie, a nie bloki ze strumienia
+    assert transcribed == [(data, "en")]
+    assert ingested["result"]["provider"] == "local-test"
+    assert ingested["error"] is None
+    assert os.listdir(os.path.join(store_dir, "tmp")) == []
+
+def test_local_session_error_keeps_file(store_dir, monkeypatch):
+    async def failing(file_path, language="pl"):
+        raise RuntimeError("brak dostawcy")
+
+    monkeypatch.setattr(live_ingest, "transcribe_and_diarize_file_async", failing)
+    ingested = asyncio.run(live_ingest.ingest_stream(_body([b"abcdef"]), "rozmowa.mp3", provider="local"))
+
+    assert ingested["result"] is None
+    assert ingested["error"] == "brak dostawcy"
+    assert os.path.exists(ingested["record"]["file_path"])
+
+def test_empty_body_removes_temp_file(store_dir, transcribed):
+    with pytest.raises(ValueError):
+        asyncio.run(live_ingest.ingest_stream(_body([b""]), "rozmowa.wav", provider="local"))
+    assert os.listdir(os.path.join(store_dir, "tmp")) == []
+    assert transcribed == []
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        live_ingest.create_live_session("nieznany")
@@ -0,0 +1,111 @@
+"""Tryb długich nagrań (services.long_audio): podział i łączenie wyników fragmentów."""
+import os
+import wave
+
+import numpy as np
+
+from app.services import long_audio
+from app.services.long_audio import AudioChunk, _link_speakers, merge_texts, stitch_diarized
+
+def _wav(path, seconds: float, sample_rate: int = 16000):
+    samples = np.random.default_rng(0).integers(-3000, 3000, int(seconds * sample_rate), dtype=np.int16)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(samples.tobytes())
+    return str(path)
+
+def test_plan_fits_chunks_into_upload_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(long_audio, "LONG_AUDIO_CHUNK_SECONDS", 600)
+    monkeypatch.setattr(long_audio, "LONG_AUDIO_OVERLAP_SECONDS", 1)
+    monkeypatch.setattr(long_audio, "LONG_AUDIO_SEARCH_SECONDS", 2)
+    path = _wav(tmp_path / "rozmowa.wav", 30)
+    max_bytes = 300_000
+
+    source, chunks = long_audio._plan(path, max_bytes)
+
+    assert len(chunks) >= 4
+    for chunk in chunks:
+        chunk_path = long_audio._write_chunk(source, chunk)
+        try:
+            assert os.path.getsize(chunk_path) <= max_bytes
+        finally:
+            os.remove(chunk_path)
+
+def test_merge_texts_removes_overlap():
+    merged = merge_texts([
+        "Dzień dobry, w czym mogę pomóc? Chciałbym zmienić taryfę",
+        "mogę pomóc. Chciałbym zmienić taryfę na tańszą.",
+        "Oczywiście, sprawdzę to.",
+    ])
+    assert merged == "Dzień dobry, w czym mogę pomóc? Chciałbym zmienić taryfę na tańszą. Oczywiście, sprawdzę to."
+
+def test_merge_texts_keeps_short_matches():
+    # Mniej niż _TEXT_MIN_MATCH wspólnych słów to nie zakładka
+    assert merge_texts(["tak tak", "tak dobrze"]) == "tak tak tak dobrze"
+    assert merge_texts(["", "Halo"]) == "Halo"
+
+def _item(speaker, start, end, text="słowo"):
+    return {"text": text, "start": start, "end": end, "confidence": 0.9, "speaker": speaker}
+
+def test_link_speakers_follows_overlap():
+    previous = [_item("SPEAKER_0", 9.0, 9.5), _item("SPEAKER_1", 10.5, 11.5)]
+    # Dostawca nadał mówcom fragmentu odwrotne etykiety
+    current = [_item("SPEAKER_1", 9.0, 9.5), _item("SPEAKER_0", 10.5, 11.5), _item("SPEAKER_2", 15.0, 16.0)]
+
+    mapping = _link_speakers(previous, current, 8.0, 12.0, ["SPEAKER_0", "SPEAKER_1"])
+    assert mapping["SPEAKER_0"] == "SPEAKER_1"
+    assert mapping["SPEAKER_1"] == "SPEAKER_0"
+    # Nowy mówca spoza zakładki dostaje nową etykietę
+    assert mapping["SPEAKER_2"] not in ("SPEAKER_0", "SPEAKER_1")
+
+def test_link_speakers_without_overlap_reuses_known_labels():
+    mapping = _link_speakers([], [_item("SPEAKER_3", 15.0, 16.0)], 8.0, 12.0, ["SPEAKER_0", "SPEAKER_1"])
+    assert mapping == {"SPEAKER_3": "SPEAKER_0"}
+
+def _segment(speaker, words):
+    return {
+        "speaker_label": speaker,
+        "text": " ".join(word for word, _, _ in words),
+        "start_time": words[0][1],
+        "end_time": words[-1][2],
+        "words": [{"word": word, "start": start, "end": end, "confidence": 0.9} for word, start, end in words],
+    }
+
+def test_stitch_diarized_joins_chunks():
+    chunks = [
+        AudioChunk(0, 0.0, 12.0, float("-inf"), 10.0),
+        AudioChunk(1, 8.0, 20.0, 10.0, float("inf")),
+    ]
+    results = [
+        {"provider": "deepgram", "diarized": True, "segments": [
+            _segment("SPEAKER_0", [("Dzień", 0.0, 1.0), ("dobry", 1.0, 2.0)]),
+            _segment("SPEAKER_1", [("Halo", 3.0, 4.0)]),
+            _segment("SPEAKER_0", [("słucham", 9.0, 9.5)]),
+            _segment("SPEAKER_1", [("tak", 10.5, 11.5)]),
+        ]},
+        # Czasy względem początku fragmentu (8 s), etykiety mówców zamienione
+        {"provider": "deepgram", "diarized": True, "segments": [
+            _segment("SPEAKER_1", [("słucham", 1.0, 1.5)]),
+            _segment("SPEAKER_0", [("tak", 2.5, 3.5), ("proszę", 5.0, 6.0)]),
+            _segment("SPEAKER_1", [("dziękuję", 8.0, 9.0)]),
+        ]},
+    ]
+
+    result = stitch_diarized(chunks, results, "pl")
+
+    words = [(word["word"], segment["speaker_label"]) for segment in result["segments"] for word in segment["words"]]
+    assert words == [
+        ("Dzień", "SPEAKER_0"), ("dobry", "SPEAKER_0"), ("Halo", "SPEAKER_1"), ("słucham", "SPEAKER_0"),
+        ("tak", "SPEAKER_1"), ("proszę", "SPEAKER_1"), ("dziękuję", "SPEAKER_0"),
+    ]
+    assert result["text"] == "Dzień dobry Halo słucham tak proszę dziękuję"
+    assert result["duration"] == 20.0
+    assert result["provider"] == "deepgram"
+    assert result["diarized"] is True
+
+def test_stitch_diarized_marks_undiarized_chunks():
+    chunks = [AudioChunk(0, 0.0, 5.0, float("-inf"), float("inf"))]
+    results = [{"provider": "whisper", "diarized": False, "segments": [_segment("SPEAKER_0", [("Halo", 0.0, 1.0)])]}]
+    assert stitch_diarized(chunks, results, "pl")["diarized"] is False
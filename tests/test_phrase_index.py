@@ -0,0 +1,37 @@
+"""Przybliżone wyszukiwanie fraz karty oceny (services.phrase_index, services.rules_engine)."""
+from app.services.phrase_index import FuzzyPhraseIndex
+from app.services.rules_engine import find_phrases_in_transcription, find_scorecard_phrases
+
+PHRASES = ["Dzień dobry", "Czy mogę w czymś jeszcze pomóc", "reklamacja", "nie wiem"]
+
+def _found(text):
+    index = FuzzyPhraseIndex(PHRASES, max_edits=1, min_token_length=5)
+    return [occurrence["phrase"] for occurrence in index.scan_segments([{"text": text, "start_time": 0.0}])]
+
+def test_matches_without_diacritics():
+    assert _found("dzien dobry panu") == ["Dzień dobry"]
+
+def test_matches_inflected_form():
+    assert _found("czy moge w czyms jeszcze pomocy") == ["Czy mogę w czymś jeszcze pomóc"]
+
+def test_matches_within_edit_distance():
+    assert _found("reklamcja przyjęta") == ["reklamacja"]
+
+def test_short_tokens_must_match_exactly():
+    assert _found("nic wiem") == []
+    assert _found("nie wiem") == ["nie wiem"]
+
+def test_match_type_and_timestamp():
+    segments = [{"text": "Dzien dobry, w czym moge pomoc?", "speaker_label": "KONSULTANT", "start_time": 65.0}]
+    exact, fuzzy = find_phrases_in_transcription("", segments, ["w czym", "Dzień dobry"])
+    assert (exact["match_type"], fuzzy["match_type"]) == ("exact", "fuzzy")
+    assert fuzzy["timestamp"] == "00:01:05" and fuzzy["speaker"] == "KONSULTANT"
+
+def test_forbidden_phrases_are_matched_exactly():
+    segments = [{"text": "To nie moja wina, reklamcja", "speaker_label": "KONSULTANT", "start_time": 0.0}]
+    required, forbidden = find_scorecard_phrases("", segments, {
+        "required_phrases": ["reklamacja"],
+        "forbidden_phrases": ["to nie mój problem", "reklamacja"]
+    })
+    assert required[0]["match_type"] == "fuzzy"
+    assert [match["found"] for match in forbidden] == [False, False]
@@ -0,0 +1,151 @@
+"""Warstwa wywołań dostawców (services.provider_calls): ponawianie, Retry-After i bezpiecznik."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services import provider_calls
+from app.services.provider_calls import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    PROVIDER_RETRY_ATTEMPTS,
+    ProviderRateLimited,
+    ProviderUnavailable,
+    call_provider,
+    call_provider_async,
+    get_limiter
+)
+
+PROVIDER = "test-provider"
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    provider_calls._limiters.pop(PROVIDER, None)
+    sleeps = []
+    monkeypatch.setattr(provider_calls.time, "sleep", sleeps.append)
+    yield sleeps
+    provider_calls._limiters.pop(PROVIDER, None)
+
+def _server(*responses):
+    """Klient httpx z lokalnym serwerem (MockTransport) zwracającym kolejne odpowiedzi; ostatnia się powtarza."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        status, headers = responses[min(len(requests), len(responses)) - 1]
+        return httpx.Response(status, headers=headers, json={"ok": status == 200})
+
+    client = httpx.Client(base_url="http://provider.test", transport=httpx.MockTransport(handler))
+
+    def call():
+        response = client.post("/v1/listen")
+        response.raise_for_status()
+        return response.json()
+    return call, requests
+
+def _half_open():
+    breaker = get_limiter(PROVIDER).breaker
+    # Bezpiecznik otwarty dawno temu - następne wywołanie jest próbą (half-open)
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+    breaker.failures = breaker.threshold
+    return breaker
+
+def test_429_waits_for_retry_after(fresh_limiter):
+    call, requests = _server((429, {"Retry-After": "7"}), (200, {}))
+
+    assert call_provider(PROVIDER, call) == {"ok": True}
+    assert len(requests) == 2
+    assert fresh_limiter[0] >= 7
+    # 429 to odmowa działającego dostawcy, a nie awaria
+    assert get_limiter(PROVIDER).breaker.state == "closed"
+
+def test_429_exhausted_raises_rate_limited():
+    call, requests = _server((429, {"Retry-After": "1"}))
+
+    with pytest.raises(ProviderRateLimited) as error:
+        call_provider(PROVIDER, call)
+    assert len(requests) == PROVIDER_RETRY_ATTEMPTS
+    assert error.value.retry_after >= 1
+
+def test_server_errors_are_retried(fresh_limiter):
+    call, requests = _server((503, {}), (502, {}), (200, {}))
+
+    assert call_provider(PROVIDER, call) == {"ok": True}
+    assert len(requests) == 3
+    assert len(fresh_limiter) == 2
+    assert get_limiter(PROVIDER).breaker.failures == 0
+
+def test_client_errors_are_not_retried():
+    call, requests = _server((400, {}))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        call_provider(PROVIDER, call)
+    assert len(requests) == 1
+
+def test_breaker_opens_after_repeated_failures():
+    call, requests = _server((500, {}))
+
+    with pytest.raises(ProviderUnavailable):
+        call_provider(PROVIDER, call)
+    with pytest.raises(ProviderUnavailable):
+        call_provider(PROVIDER, call)
+    assert len(requests) == CIRCUIT_FAILURE_THRESHOLD
+    assert get_limiter(PROVIDER).breaker.state == "open"
+
+    # Otwarty obwód: wywołanie kończy się od razu, bez żądania do dostawcy
+    with pytest.raises(ProviderUnavailable) as error:
+        call_provider(PROVIDER, call)
+    assert len(requests) == CIRCUIT_FAILURE_THRESHOLD
+    assert error.value.retry_after > 0
+
+def test_half_open_probe_closes_breaker():
+    breaker = _half_open()
+    call, requests = _server((200, {}))
+
+    assert call_provider(PROVIDER, call) == {"ok": True}
+    assert breaker.state == "closed"
+
+def test_cancelled_probe_releases_breaker():
+    breaker = _half_open()
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def slow_call():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.create_task(call_provider_async(PROVIDER, slow_call))
+        await started.wait()
+        assert breaker.probing
+
+        # Zapytanie zapasowe wygrało - próba zostaje anulowana
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert not breaker.probing
+
+        async def fast_call():
+            return "ok"
+
+        # Kolejne wywołanie jest nową próbą i zamyka bezpiecznik
+        return await call_provider_async(PROVIDER, fast_call)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+def test_only_probe_owner_releases_probe():
+    breaker = _half_open()
+    retry_after, probe = breaker.allow()
+    assert retry_after is None and probe is not None
+
+    # Anulowane wywołanie, które nie było próbą, nie zwalnia cudzej próby
+    breaker.release(None)
+    breaker.release(probe - 1)
+    assert breaker.probing
+    with pytest.raises(ProviderUnavailable):
+        get_limiter(PROVIDER).admit()
+
+    breaker.release(probe)
+    assert not breaker.probing
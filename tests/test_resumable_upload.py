@@ -0,0 +1,51 @@
+"""Wznawialny upload (services.resumable_upload): zapis części przy zerwanym połączeniu."""
+import asyncio
+
+import pytest
+
+from app.services import resumable_upload
+from app.services.resumable_upload import UploadError, create_upload_session, write_chunk
+
+class ClientDisconnect(Exception):
+    pass
+
+def _body(blocks, fail_after=None):
+    async def iterate():
+        for index, block in enumerate(blocks):
+            if index == fail_after:
+                raise ClientDisconnect()
+            yield block
+    return iterate()
+
+@pytest.fixture
+def upload(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(resumable_upload, "PARTIAL_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(resumable_upload, "_WRITE_BLOCK_BYTES", 4)
+    return create_upload_session(db, "rozmowa.wav", 20)
+
+def _content(upload):
+    with open(upload.temp_path, "rb") as f:
+        return f.read()
+
+def test_disconnect_keeps_received_data(db, upload):
+    blocks = [b"abc", b"def", b"gh", b"ijk"]
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(write_chunk(db, upload, "bytes 0-19/20", _body(blocks, fail_after=3)))
+
+    # Odebrane 8 bajtów (także ostatni, niepełny blok) jest zapisane - klient wznowi od offsetu 8
+    assert upload.received_size == 8
+    assert _content(upload) == b"abcdefgh"
+
+    asyncio.run(write_chunk(db, upload, "bytes 8-19/20", _body([b"ijklmnopqrst"])))
+    assert upload.received_size == 20
+    assert _content(upload) == b"abcdefghijklmnopqrst"
+
+def test_body_longer_than_range_is_rejected(db, upload):
+    with pytest.raises(UploadError):
+        asyncio.run(write_chunk(db, upload, "bytes 0-4/20", _body([b"abc", b"def"])))
+    assert upload.received_size == 3
+
+def test_gap_is_rejected_with_current_offset(db, upload):
+    with pytest.raises(UploadError) as error:
+        asyncio.run(write_chunk(db, upload, "bytes 5-9/20", _body([b"abcde"])))
+    assert error.value.status_code == 409
@@ -0,0 +1,114 @@
+"""Magazyn nagrań (services.storage): kopia podręczna S3 i jej sprzątanie."""
+import os
+import time
+
+import pytest
+
+from app.services import storage
+from app.services.storage import audio_cache_in_use, prune_audio_cache, touch_audio_cache_in_use
+
+LOCATION = "s3://nagrania/audio/ab/cd/abcd.wav"
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "AUDIO_CACHE_DIR", str(tmp_path / "cache"))
+    # Limit 0 MB - sprzątanie usuwa wszystko, czego nie chroni
+    monkeypatch.setattr(storage, "AUDIO_CACHE_MAX_MB", 0)
+    return tmp_path / "cache"
+
+def _cached(path, age: float = 3600.0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * 16)
+    used_at = time.time() - age
+    os.utime(path, (used_at, used_at))
+    return path
+
+def test_prune_skips_files_in_use(cache_dir):
+    original = _cached(storage._cache_path(LOCATION))
+    derived = [_cached(f"{original}.16k.wav"), _cached(f"{original}.vad.wav")]
+    other = _cached(storage._cache_path("s3://nagrania/audio/ef/01/ef01.wav"))
+
+    with audio_cache_in_use(LOCATION):
+        assert prune_audio_cache() == 1
+        assert not os.path.exists(other)
+        assert all(os.path.exists(path) for path in [original] + derived)
+
+    # Po zakończeniu etapu pliki mogą zostać usunięte
+    assert prune_audio_cache() == 3
+    assert not os.path.exists(original)
+
+def test_prune_skips_recently_used_files(cache_dir):
+    recent = _cached(storage._cache_path(LOCATION), age=10)
+    stale = _cached(storage._cache_path("s3://nagrania/audio/ef/01/ef01.wav"), age=600)
+
+    assert prune_audio_cache(min_idle_seconds=300) == 1
+    assert os.path.exists(recent)
+    assert not os.path.exists(stale)
+
+def test_touch_refreshes_files_in_use(cache_dir):
+    original = _cached(storage._cache_path(LOCATION))
+    derived = _cached(f"{original}.16k.wav")
+    mtime = os.path.getmtime(derived)
+
+    with audio_cache_in_use(LOCATION):
+        touch_audio_cache_in_use()
+
+    # Inny proces nie usunie plików używanych w ciągu ostatniej dzierżawy etapu
+    assert prune_audio_cache(min_idle_seconds=300) == 0
+    assert os.path.getmtime(derived) == mtime
+
+def test_in_use_is_reference_counted(cache_dir):
+    original = _cached(storage._cache_path(LOCATION))
+    with audio_cache_in_use(LOCATION):
+        with audio_cache_in_use(LOCATION):
+            pass
+        assert prune_audio_cache() == 0
+    assert prune_audio_cache() == 1
+    assert not os.path.exists(original)
+
+@pytest.fixture
+def s3(cache_dir, monkeypatch):
+    pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+
+    # Endpoint w stylu MinIO (adresowanie ścieżką)
+    endpoint = "http://minio.local:9000"
+    monkeypatch.setenv("MOTO_S3_CUSTOM_ENDPOINTS", endpoint)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setattr(storage, "S3_ENDPOINT_URL", endpoint)
+    monkeypatch.setattr(storage, "S3_REGION", "us-east-1")
+    monkeypatch.setattr(storage, "S3_BUCKET", "nagrania")
+    with moto.mock_aws():
+        s3_storage = storage.S3Storage()
+        s3_storage.client.create_bucket(Bucket="nagrania")
+        yield s3_storage
+
+def test_s3_put_file_and_local_path(s3, tmp_path):
+    source = tmp_path / "upload.wav"
+    source.write_bytes(b"RIFFdane")
+    key = storage.content_key("abcd" * 16, "wav")
+
+    location = s3.put_file(str(source), key)
+    assert location == f"s3://nagrania/audio/{key}"
+    assert s3.exists(key) and s3.size(key) == 8
+    assert not source.exists()
+
+    # Plik zostaje w kopii podręcznej; po jej usunięciu jest pobierany z magazynu
+    cache_path = s3.local_path(location)
+    os.remove(cache_path)
+    assert s3.local_path(location) == cache_path
+    with open(cache_path, "rb") as f:
+        assert f.read() == b"RIFFdane"
+    assert s3.open(location).read() == b"RIFFdane"
+
+    s3.delete(key)
+    assert not s3.exists(key)
+
+def test_s3_presigned_urls_use_endpoint(s3):
+    key = storage.content_key("ef01" * 16, "wav")
+    upload = s3.presigned_upload(key, "ef01" * 16)
+    assert upload["upload_url"].startswith("http://minio.local:9000/nagrania/audio/")
+    assert upload["headers"]["x-amz-checksum-sha256"]
+    assert s3.presigned_download_url(s3.location(key)).startswith("http://minio.local:9000/nagrania/")
@@ -0,0 +1,20 @@
+"""Normalizacja tekstu do wyszukiwania fraz (services.text_normalize)."""
+from app.services.text_normalize import NORMALIZATION_VERSION, normalize_tokens, normalized_text, segment_tokens
+
+def test_diacritics_and_case_are_folded():
+    assert normalize_tokens("Dzień dobry!") == normalize_tokens("dzien dobry")
+    assert normalize_tokens("Żółć, łąka") == ["zolc", "lak"]
+
+def test_inflected_forms_share_a_stem():
+    assert normalize_tokens("pomocy") == normalize_tokens("pomóc") == ["pomoc"]
+
+def test_short_tokens_keep_their_ending():
+    # Rdzeń musi mieć co najmniej 3 znaki - "nie" i "nic" pozostają różnymi słowami
+    assert normalize_tokens("nie nic") == ["nie", "nic"]
+
+def test_stored_form_is_versioned():
+    stored = normalized_text("Dzień dobry")
+    assert stored == f"{NORMALIZATION_VERSION}|dzien dobr"
+    assert segment_tokens("ignorowany tekst", stored) == ["dzien", "dobr"]
+    # Zapis starszą wersją reguł jest normalizowany ponownie
+    assert segment_tokens("Dzień dobry", "0|inne slowa") == ["dzien", "dobr"]
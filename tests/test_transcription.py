@@ -0,0 +1,53 @@
+"""Transkrypcja Whisper (services.transcription) z pamięcią podręczną odpowiedzi."""
+import io
+import json
+import zlib
+from types import SimpleNamespace
+
+import pytest
+from openai.types.audio import Transcription
+from sqlalchemy.orm import sessionmaker
+
+from app.models.provider_cache import ProviderCacheEntry
+from app.services import provider_cache, transcription
+
+VERBOSE_JSON = {
+    "text": "Dzień dobry, w czym mogę pomóc?",
+    "language": "polish",
+    "duration": 4.5,
+    "segments": [{"id": 0, "start": 0.0, "end": 4.5, "text": "Dzień dobry, w czym mogę pomóc?"}],
+}
+
+@pytest.fixture
+def whisper(db, monkeypatch):
+    monkeypatch.setattr(provider_cache, "PROVIDER_CACHE", True)
+    monkeypatch.setattr(provider_cache, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    requests = []
+
+    def create(**params):
+        requests.append(params)
+        return Transcription.model_validate(VERBOSE_JSON)
+
+    client = SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(transcription, "get_openai_client", lambda: client)
+    return requests
+
+def test_caches_raw_response(db, whisper):
+    expected = {"text": VERBOSE_JSON["text"], "language": "pl", "duration": 4.5}
+    assert transcription.transcribe_audio(io.BytesIO(b"nagranie")) == expected
+
+    # W pamięci jest pełna odpowiedź verbose_json, nie przetworzony wynik
+    entry = db.query(ProviderCacheEntry).one()
+    assert json.loads(zlib.decompress(entry.payload)) == VERBOSE_JSON
+
+    assert transcription.transcribe_audio(io.BytesIO(b"nagranie")) == expected
+    assert len(whisper) == 1
+
+def test_cached_response_is_processed_again(db, whisper, monkeypatch):
+    transcription.transcribe_audio(io.BytesIO(b"nagranie"))
+
+    # Zmiana przetwarzania działa także na odpowiedzi z pamięci
+    monkeypatch.setattr(transcription, "_transcription_result",
+                        lambda payload, language: {"segments": len(payload["segments"])})
+    assert transcription.transcribe_audio(io.BytesIO(b"nagranie")) == {"segments": 1}
+    assert len(whisper) == 1
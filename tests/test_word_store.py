@@ -0,0 +1,43 @@
+"""Zapis słów transkrypcji (services.word_store) przy nakładających się mówcach."""
+from app.services.word_store import pack_words, unpack_words
+
+def _word(text, start, end, speaker):
+    return {"word": text, "start": start, "end": end, "confidence": 0.9, "speaker_label": speaker}
+
+# Słowa kanałów stereo w kolejności kanałów, nie czasu
+STEREO_WORDS = [
+    _word("a", 0.0, 0.5, "KONSULTANT"),
+    _word("b", 5.0, 5.5, "KONSULTANT"),
+    _word("c", 1.0, 1.5, "KLIENT"),
+    _word("d", 2.0, 2.5, "KLIENT"),
+]
+
+def _texts(columns, indices=None):
+    return [word["word"] for word in columns.words(indices)]
+
+def test_words_are_stored_in_time_order():
+    columns = unpack_words(pack_words(STEREO_WORDS))
+    assert _texts(columns) == ["a", "c", "d", "b"]
+    assert [word["speaker_label"] for word in columns.words()] == ["KONSULTANT", "KLIENT", "KLIENT", "KONSULTANT"]
+
+def test_window_with_interleaved_speakers():
+    columns = unpack_words(pack_words(STEREO_WORDS))
+    assert _texts(columns, columns.window(0.9, 3.0)) == ["c", "d"]
+    assert _texts(columns, columns.window(start_time=2.4)) == ["d", "b"]
+    assert _texts(columns, columns.window(end_time=1.0)) == ["a"]
+
+def test_window_with_overlapping_words():
+    # Długie słowo konsultanta trwa, gdy klient mówi krótko
+    columns = unpack_words(pack_words([
+        _word("długo", 0.0, 4.0, "KONSULTANT"),
+        _word("tak", 1.0, 1.2, "KLIENT"),
+        _word("dobrze", 4.5, 5.0, "KONSULTANT"),
+    ]))
+    assert _texts(columns, columns.window(3.0, 6.0)) == ["długo", "dobrze"]
+    assert _texts(columns, columns.window(1.1, 1.15)) == ["długo", "tak"]
+
+def test_segments_follow_time_order():
+    segments = unpack_words(pack_words(STEREO_WORDS)).segments()
+    assert [(segment["speaker_label"], segment["text"]) for segment in segments] == [
+        ("KONSULTANT", "a"), ("KLIENT", "c d"), ("KONSULTANT", "b")
+    ]